@@ -0,0 +1,320 @@
+"""
+Assembly benchmark suite.
+
+Generates synthetic clips with FFmpeg's testsrc2/sine sources across a
+matrix of clip counts, durations, resolutions, trims and audio layouts,
+runs the assemble_service paths against them and reports wall time, CPU
+time (this process plus every FFmpeg child), peak RSS and output size as
+JSON. Each case runs in a fresh worker process against a fresh project,
+so probe caches start cold and resource usage isn't shared between cases.
+
+Usage (from apps/python-renderer):
+    python -m benchmarks.assemble_bench --matrix quick --output bench.json
+    python -m benchmarks.assemble_bench --matrix full --repeat 3 --compare baseline.json
+    python -m benchmarks.assemble_bench compare baseline.json bench.json
+
+Results carry the git commit and FFmpeg version so runs from different
+commits can be compared; `--compare` exits non-zero when any case got
+slower than --threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+APP_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_FIXTURES_DIR = Path(tempfile.gettempdir()) / "omegaframe-bench-fixtures"
+
+MATRICES = {
+    "quick": {
+        "path": ["assemble", "preview"],
+        "count": [3],
+        "duration": [2.0],
+        "resolution": ["1280x720", "mixed"],
+        "trimmed": [False, True],
+        "audio": ["all", "mixed"],
+    },
+    "full": {
+        "path": ["assemble", "preview"],
+        "count": [2, 8],
+        "duration": [2.0, 6.0],
+        "resolution": ["1280x720", "1920x1080", "mixed"],
+        "trimmed": [False, True],
+        "audio": ["all", "none", "mixed"],
+    },
+}
+
+# "mixed" resolution alternates between these
+MIXED_RESOLUTIONS = ["1920x1080", "1280x720"]
+FIXTURE_FPS = 30
+
+
+def _run(cmd: List[str]) -> str:
+    return subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def fixture_path(fixtures_dir: Path, resolution: str, duration: float, audio: bool) -> Path:
+    """Generate (once) a synthetic clip: moving test pattern plus an optional sine tone."""
+    name = f"testsrc_{resolution}_{duration:g}s_{'av' if audio else 'v'}.mp4"
+    path = fixtures_dir / name
+    if path.exists():
+        return path
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={resolution}:rate={FIXTURE_FPS}:duration={duration}",
+    ]
+    if audio:
+        cmd += ["-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}"]
+    cmd += ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(FIXTURE_FPS)]
+    if audio:
+        cmd += ["-c:a", "aac", "-ac", "2"]
+    tmp_path = path.with_name(f".{path.name}")
+    _run(cmd + [str(tmp_path)])
+    os.replace(tmp_path, path)
+    return path
+
+
+def case_name(case: Dict[str, Any]) -> str:
+    return (
+        f"{case['path']}-n{case['count']}-d{case['duration']:g}-{case['resolution']}"
+        f"-{'trim' if case['trimmed'] else 'full'}-audio_{case['audio']}"
+    )
+
+
+def expand_matrix(matrix: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = list(matrix)
+    return [dict(zip(keys, values)) for values in itertools.product(*(matrix[k] for k in keys))]
+
+
+def build_timeline(case: Dict[str, Any], fixtures_dir: Path) -> List[Dict[str, Any]]:
+    """Fixture clips (and trims) for one benchmark case."""
+    clips = []
+    for i in range(case["count"]):
+        resolution = case["resolution"]
+        if resolution == "mixed":
+            resolution = MIXED_RESOLUTIONS[i % len(MIXED_RESOLUTIONS)]
+        audio = {"all": True, "none": False, "mixed": i % 2 == 0}[case["audio"]]
+        path = fixture_path(fixtures_dir, resolution, case["duration"], audio)
+        clip = {"file": path.name, "start": 0.0, "end": None}
+        if case["trimmed"]:
+            clip["start"] = round(case["duration"] * 0.2, 3)
+            clip["end"] = round(case["duration"] * 0.8, 3)
+        clips.append(clip)
+    return clips
+
+
+def run_case_in_worker(case: Dict[str, Any], fixtures_dir: Path) -> Dict[str, Any]:
+    """Run one case in a fresh interpreter with its own project and render directories."""
+    timeline = build_timeline(case, fixtures_dir)
+    with tempfile.TemporaryDirectory(prefix="bench-") as work_dir:
+        # Renders, render records and probe indexes stay out of the real BASE_DIR/renders
+        projects_dir = Path(work_dir) / "projects"
+        render_dir = Path(work_dir) / "renders"
+        project_id = "bench_" + case_name(case).replace(".", "_")
+        clips_dir = projects_dir / project_id / "clips"
+        clips_dir.mkdir(parents=True)
+        clips = []
+        for i, clip in enumerate(timeline):
+            # Copy rather than link so probe sidecars are written next to the project, not the fixtures
+            dest = clips_dir / f"{i:03d}_{clip['file']}"
+            shutil.copyfile(fixtures_dir / clip["file"], dest)
+            clips.append({"path": str(dest), "start": clip["start"], "end": clip["end"]})
+
+        job = {"path": case["path"], "project_id": project_id, "clips": clips, "profile": case.get("profile")}
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.assemble_bench", "worker", json.dumps(job)],
+            cwd=APP_DIR,
+            env={
+                **os.environ,
+                "PROJECTS_DIR": str(projects_dir),
+                "RENDER_DIR": str(render_dir),
+                # Probe FFmpeg once per fixtures dir, not once per case
+                "FFMPEG_CAPABILITIES_PATH": str(fixtures_dir / ".ffmpeg_capabilities.json"),
+            },
+            capture_output=True,
+            text=True,
+        )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr or proc.stdout).strip()[-2000:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def worker(job_json: str) -> None:
+    """Worker side: run a single assemble path and print its measurements as one JSON line."""
+    job = json.loads(job_json)
+    # Keep service logs off stdout, which carries the result
+    real_stdout = sys.stdout
+    sys.stdout = sys.stderr
+
+    from config import RENDER_DIR
+    from services.assemble_service import assemble_preview, assemble_video
+
+    start_wall = time.perf_counter()
+    if job["path"] == "preview":
+        result = assemble_preview(job["project_id"], job["clips"])
+        output = RENDER_DIR / "previews" / f"{job['project_id']}.mp4"
+    else:
+        result = assemble_video(job["project_id"], job["clips"], job.get("profile"))
+        output = RENDER_DIR / f"{job['project_id']}.mp4"
+    wall = time.perf_counter() - start_wall
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    measurement = {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 4),
+        "peak_rss_bytes": max(own.ru_maxrss, children.ru_maxrss) * rss_unit,
+        "output_bytes": output.stat().st_size if output.exists() else 0,
+        "duration": result.get("duration"),
+        "strategy": result.get("plan", {}).get("strategy"),
+    }
+    for path in (output, RENDER_DIR / "thumbnails" / f"{job['project_id']}.png"):
+        path.unlink(missing_ok=True)
+
+    sys.stdout = real_stdout
+    print(json.dumps(measurement))
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Median of each numeric metric across repeats (errors are reported instead)."""
+    errors = [r["error"] for r in runs if "error" in r]
+    if errors:
+        return {"error": errors[0]}
+    summary = {
+        key: statistics.median(r[key] for r in runs)
+        for key in ("wall_s", "cpu_s", "peak_rss_bytes", "output_bytes")
+    }
+    summary["wall_s_min"] = min(r["wall_s"] for r in runs)
+    summary["strategy"] = runs[0]["strategy"]
+    summary["duration"] = runs[0]["duration"]
+    return summary
+
+
+def environment_info() -> Dict[str, Any]:
+    """Identify the code and machine a run was made on."""
+    def git(*args: str) -> Optional[str]:
+        try:
+            return _run(["git", "-C", str(APP_DIR), *args])
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    try:
+        ffmpeg_version = _run(["ffmpeg", "-version"]).splitlines()[0]
+    except (subprocess.CalledProcessError, OSError, IndexError):
+        ffmpeg_version = None
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--", ".")),
+        "ffmpeg": ffmpeg_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compare two benchmark reports case by case.
+
+    Returns:
+        One entry per shared case with relative wall/CPU change and a
+        `regression` flag when either grew by more than `threshold`
+    """
+    base_cases = {c["name"]: c for c in baseline.get("cases", [])}
+    rows = []
+    for case in current.get("cases", []):
+        base = base_cases.get(case["name"])
+        if not base or "error" in base or "error" in case:
+            continue
+        row = {"name": case["name"]}
+        for metric in ("wall_s", "cpu_s", "peak_rss_bytes", "output_bytes"):
+            before, after = base[metric], case[metric]
+            row[metric] = {"before": before, "after": after, "change": (after - before) / before if before else 0.0}
+        row["regression"] = row["wall_s"]["change"] > threshold or row["cpu_s"]["change"] > threshold
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        flag = "❌" if row["regression"] else "✅"
+        print(
+            f"{flag} {row['name']}: wall {row['wall_s']['change']:+.1%} "
+            f"cpu {row['cpu_s']['change']:+.1%} size {row['output_bytes']['change']:+.1%}",
+            file=sys.stderr,
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv[:1] == ["worker"]:
+        worker(argv[1])
+        return 0
+
+    if argv[:1] == ["compare"]:
+        parser = argparse.ArgumentParser(prog="assemble_bench compare")
+        parser.add_argument("baseline")
+        parser.add_argument("current")
+        parser.add_argument("--threshold", type=float, default=0.10)
+        args = parser.parse_args(argv[1:])
+        rows = compare(json.loads(Path(args.baseline).read_text()), json.loads(Path(args.current).read_text()), args.threshold)
+        print_comparison(rows)
+        print(json.dumps(rows, indent=2))
+        return 1 if any(r["regression"] for r in rows) else 0
+
+    parser = argparse.ArgumentParser(description="Benchmark assemble_service against synthetic clips")
+    parser.add_argument("--matrix", choices=sorted(MATRICES), default="quick")
+    parser.add_argument("--filter", help="Only run cases whose name contains this substring")
+    parser.add_argument("--profile", help="Render profile for the assemble path (default: standard)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case (the median is reported)")
+    parser.add_argument("--fixtures-dir", type=Path, default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--output", type=Path, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", type=Path, help="Baseline report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    cases = expand_matrix(MATRICES[args.matrix])
+    if args.filter:
+        cases = [c for c in cases if args.filter in case_name(c)]
+
+    report = {"environment": environment_info(), "matrix": args.matrix, "profile": args.profile, "cases": []}
+    for case in cases:
+        case["profile"] = args.profile
+        name = case_name(case)
+        print(f"⏱️ {name}", file=sys.stderr)
+        runs = [run_case_in_worker(case, args.fixtures_dir) for _ in range(max(args.repeat, 1))]
+        summary = summarize(runs)
+        if "error" in summary:
+            print(f"❌ {name}: {summary['error']}", file=sys.stderr)
+        report["cases"].append({"name": name, "params": case, **summary, "runs": runs})
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+
+    if args.compare:
+        rows = compare(json.loads(args.compare.read_text()), report, args.threshold)
+        print_comparison(rows)
+        return 1 if any(r["regression"] for r in rows) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
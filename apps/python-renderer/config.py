@@ -13,12 +13,100 @@ RUNWAY_API_KEY = os.getenv("RUNWAY_API_KEY")
 # Paths
 BASE_DIR = Path(__file__).parent
 PROJECTS_DIR = Path(os.getenv("PROJECTS_DIR", BASE_DIR / "projects"))
-PROJECTS_DIR.mkdir(parents=True, exist_ok=True)
 
-# Render output directory
-RENDER_DIR = BASE_DIR / "renders"
-RENDER_DIR.mkdir(exist_ok=True)
-(RENDER_DIR / "thumbnails").mkdir(exist_ok=True)
+# Render output directory (created by the startup warm-up and by the writers
+# themselves, never at import)
+RENDER_DIR = Path(os.getenv("RENDER_DIR", BASE_DIR / "renders"))
+
+# FFmpeg capabilities (version, encoders, filters, working hardware encoders),
+# probed once and cached until the ffmpeg/ffprobe binaries change
+FFMPEG_CAPABILITIES_PATH = Path(os.getenv("FFMPEG_CAPABILITIES_PATH", RENDER_DIR / ".ffmpeg_capabilities.json"))
+
+# Media probing
+PROBE_MAX_WORKERS = int(os.getenv("PROBE_MAX_WORKERS", "8"))
+
+# Clip ingest (background probe/proxy generation)
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "2"))
+
+# Preview proxies
+PROXY_HEIGHT = int(os.getenv("PROXY_HEIGHT", "360"))
+PROXY_FPS = float(os.getenv("PROXY_FPS", "30"))
+
+# Render encoding: "libx264", a hardware H.264 encoder (h264_nvenc, h264_qsv,
+# h264_videotoolbox) or "auto" to use the first hardware encoder that works
+RENDER_ENCODER = os.getenv("RENDER_ENCODER", "libx264")
+RENDER_THREADS = int(os.getenv("RENDER_THREADS", "0"))  # 0 = encoder default
+
+# Admission control for CPU-heavy endpoints (0 = derive from CPU count)
+ADMISSION_RENDER_SLOTS = int(os.getenv("ADMISSION_RENDER_SLOTS", "0"))
+ADMISSION_RENDER_QUEUE = int(os.getenv("ADMISSION_RENDER_QUEUE", "0"))
+ADMISSION_GENERATE_SLOTS = int(os.getenv("ADMISSION_GENERATE_SLOTS", "4"))
+ADMISSION_GENERATE_QUEUE = int(os.getenv("ADMISSION_GENERATE_QUEUE", "8"))
+ADMISSION_MAX_FFMPEG = int(os.getenv("ADMISSION_MAX_FFMPEG", "0"))  # Running FFmpeg processes before renders wait
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))  # Seconds a request may queue before 429
+
+# Render farm mode: with RENDER_DISPATCH the API only enqueues renders in Redis
+# and `python worker.py` processes (on this box or others sharing the render
+# and project storage) run them, each with its own concurrency limit
+RENDER_DISPATCH = os.getenv("RENDER_DISPATCH", "false").lower() == "true"
+RENDER_WORKER_SLOTS = int(os.getenv("RENDER_WORKER_SLOTS", "0"))  # Concurrent renders per worker (0 = one per two CPUs)
+RENDER_WORKER_HEARTBEAT = float(os.getenv("RENDER_WORKER_HEARTBEAT", "5"))  # Seconds between worker heartbeats
+RENDER_WORKER_METRICS_PORT = int(os.getenv("RENDER_WORKER_METRICS_PORT", "0"))  # Prometheus port per worker (0 = off)
+RENDER_QUEUE_MAX = int(os.getenv("RENDER_QUEUE_MAX", "0"))  # Queued renders before dispatch answers 429 (0 = unlimited)
+RENDER_JOB_TIMEOUT = float(os.getenv("RENDER_JOB_TIMEOUT", "1800"))  # Seconds a waiting request waits for its render
+RENDER_JOB_MAX_ATTEMPTS = int(os.getenv("RENDER_JOB_MAX_ATTEMPTS", "2"))  # Runs before a job orphaned by dead workers fails
+RENDER_JOB_TTL = int(os.getenv("RENDER_JOB_TTL", "86400"))  # Seconds job records are kept
+
+# Soundtrack mixing: loudness target (LUFS) and true-peak ceiling (dBTP)
+AUDIO_TARGET_LUFS = float(os.getenv("AUDIO_TARGET_LUFS", "-14"))
+AUDIO_TRUE_PEAK = float(os.getenv("AUDIO_TRUE_PEAK", "-1.5"))
+
+# Adaptive streaming (HLS/DASH) packaging
+STREAMING_SEGMENT_SECONDS = int(os.getenv("STREAMING_SEGMENT_SECONDS", "4"))
+
+# Disk garbage collection of derived artifacts (renders, previews, streams, thumbnails, proxies)
+GC_INTERVAL = float(os.getenv("GC_INTERVAL", "600"))  # Seconds between runs (0 = only on startup and on demand)
+GC_QUOTA_MB = int(os.getenv("GC_QUOTA_MB", "0"))  # Max total size of derived artifacts (0 = unlimited)
+GC_MIN_FREE_MB = int(os.getenv("GC_MIN_FREE_MB", "2048"))  # Evict until the volume has this much free
+GC_MIN_AGE = float(os.getenv("GC_MIN_AGE", "900"))  # Artifacts used more recently than this are never evicted
+GC_TEMP_MAX_AGE = float(os.getenv("GC_TEMP_MAX_AGE", "21600"))  # Untouched temp files older than this are orphans
+
+# Clip thumbnails (sprite sheet / WebVTT filmstrip)
+THUMBNAIL_SPRITE_FRAMES = int(os.getenv("THUMBNAIL_SPRITE_FRAMES", "20"))
+THUMBNAIL_SPRITE_COLUMNS = int(os.getenv("THUMBNAIL_SPRITE_COLUMNS", "5"))
+
+# Image generation: concurrent provider requests per batch and the cache of
+# generated images keyed by (provider, model, prompt, size)
+IMAGE_MAX_CONCURRENCY = int(os.getenv("IMAGE_MAX_CONCURRENCY", "4"))
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", BASE_DIR / "image_cache"))
+SDXL_LOCAL_STANDIN = os.getenv("SDXL_LOCAL_STANDIN", "false").lower() == "true"  # Serve "sdxl" with the local backend
+
+# Video generation providers: failover/hedging order, server-side polling and
+# the hedge delay used until a provider has enough latency samples for its p90
+VIDEO_PROVIDERS = [p.strip() for p in os.getenv("VIDEO_PROVIDERS", "pika,runway").split(",") if p.strip()]
+VIDEO_POLL_INTERVAL = float(os.getenv("VIDEO_POLL_INTERVAL", "3"))
+VIDEO_TIMEOUT = float(os.getenv("VIDEO_TIMEOUT", "600"))
+VIDEO_HEDGE = os.getenv("VIDEO_HEDGE", "false").lower() == "true"  # Hedge server-side generations by default
+VIDEO_HEDGE_DEFAULT_DELAY = float(os.getenv("VIDEO_HEDGE_DEFAULT_DELAY", "90"))
+VIDEO_FAKE_LATENCY = float(os.getenv("VIDEO_FAKE_LATENCY", "5"))  # Seconds the local fake provider takes per job
+
+# Outbound provider rate limits, shared by every worker through Redis:
+# "requests_per_minute/concurrent" per bucket (0 = unlimited). Concurrency
+# counts in-flight calls, or in-flight jobs for the video providers.
+# Override per bucket with RATE_LIMIT_<BUCKET>, e.g. RATE_LIMIT_PIKA=20/4
+PROVIDER_RATE_LIMITS = {
+    bucket: os.getenv(f"RATE_LIMIT_{bucket.upper()}", default)
+    for bucket, default in {
+        "openai": "500/0",
+        "dalle": "5/0",  # DALL-E 3 allows 5 images/minute on the lowest tier
+        "elevenlabs": "100/3",
+        "pika": "10/2",
+        "pika_poll": "60/0",
+        "runway": "10/2",
+        "runway_poll": "60/0",
+    }.items()
+}
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "4"))  # Retries of a 429/503 before giving up
 
 # ElevenLabs Voice ID (you'll need to set this)
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "your-voice-id")
@@ -1,33 +1,58 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Form, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from services.voice_service import generate_cloud_voice, generate_voice
 from services.voice_cloning_service import clone_voice_from_audio, list_cloned_voices, delete_cloned_voice
-from services.pika_service import generate_pika_clip, poll_pika_job
-from services.runway_service import generate_runway_clip, poll_runway_job
-from services.image_service import generate_image
-from services.assemble_service import assemble_video
+from services.video_providers import COMPLETED, get_registry
+from services.image_service import generate_image, generate_images
+from services.assemble_service import plan_project_render, resolve_clip_path
+from services.render_profiles import DEFAULT_PROFILE, RENDER_PROFILES, select_encoder
+from services.thumbnail_service import generate_clip_thumbnails
+from services.caption_service import prepare_captions, remember_script
+from services import ingest_service  # noqa: F401 - registers background proxy generation on clip ingest
 from services.job_events import start_job_event_listener
 from services.redis_client import close_redis
 from routes.ws import router as ws_router
-from config import RENDER_DIR
+from routes.media import router as media_router
+from utils.metrics import render_metrics
+from services.admission import admission
+from services.storage_gc import disk_usage_report, last_report, request_gc, start_storage_gc, stop_storage_gc
+from services.warmup import readiness, start_warmup
+from services.render_jobs import (
+    FAILED,
+    QUEUE_FULL_RETRY_AFTER,
+    QUEUED,
+    RENDER_ASSEMBLE,
+    RENDER_PREVIEW,
+    enqueue_render,
+    farm_status,
+    get_render_job,
+    queue_depth,
+    run_render,
+    wait_for_render,
+)
+from config import RENDER_DISPATCH, RENDER_QUEUE_MAX
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting OmegaFrame Studio backend...")
+    start_warmup()
     try:
         await start_job_event_listener()
         print("✅ Job event listener started")
     except Exception as e:
         print(f"⚠️ Warning: Could not start job event listener: {e}")
         print("   Progress updates will not work. Is Redis running?")
+    start_storage_gc()
+    print("✅ Storage GC started")
     yield
     # Shutdown
     print("🛑 Shutting down...")
+    stop_storage_gc()
     await close_redis()
     print("✅ Redis connection closed")
 
@@ -56,12 +81,14 @@ class VoiceRequest(BaseModel):
 class VideoRequest(BaseModel):
     projectId: str
     prompt: str
-    provider: str
+    provider: str | None = None  # pika, runway, fake; None = first healthy provider in VIDEO_PROVIDERS
+    wait: bool = False  # Generate server-side (poll, fail over, download) instead of returning a job to poll
+    hedge: bool | None = None  # With wait: also submit to the next provider past the first one's p90 latency
 
 
 class JobStatusRequest(BaseModel):
     job_id: str
-    provider: str  # "pika" or "runway"
+    provider: str  # The provider that accepted the job ("provider" in the /video response)
 
 
 class ImageRequest(BaseModel):
@@ -70,14 +97,105 @@ class ImageRequest(BaseModel):
     provider: str = "dalle"
 
 
+class ImageBatchRequest(BaseModel):
+    projectId: str
+    prompts: list[str]  # One image per prompt, e.g. one still per template scene
+    provider: str = "dalle"  # dalle, sdxl, local
+    size: str | None = None  # WIDTHxHEIGHT (default 1024x1024)
+    model: str | None = None  # Provider model (default dall-e-3 for dalle)
+
+
+class TransitionData(BaseModel):
+    type: str = "crossfade"  # crossfade, dissolve, dip_to_black, dip_to_white, wipe_left/right/up/down, slide_left/right
+    duration: float = 0.5
+
+
 class ClipData(BaseModel):
     path: str
     start: float = 0.0
     end: float | None = None
+    transition: TransitionData | None = None  # Transition into the next clip
+    scene: int | None = None  # Index of the narration scene this clip illustrates (for alignment)
+    duration: float | None = None  # Still images: seconds on screen (default 4)
+    motion: str | None = None  # Still images: zoom_in, zoom_out, pan_left/right/up/down, none
+    zoom: float | None = None  # Still images: zoom at the tight end of the move (default 1.15)
+
+class CaptionOptions(BaseModel):
+    script: str | None = None  # Defaults to the script the narration was generated from
+    formats: list[str] = ["srt", "vtt"]
+    style: str = "shorts"  # shorts, subtitle
+    burnIn: bool = False  # Draw captions into the video (during the render's encode)
+
+
+class AudioMixOptions(BaseModel):
+    music: str | None = None  # Music bed: URL or path (project music/ folder, project folder or absolute)
+    musicVolume: float | None = None  # dB relative to the loudness target (default -14)
+    clipAudio: bool = True  # Keep the clips' own audio under the narration
+    clipVolume: float | None = None  # dB relative to the target while narration plays (default -8)
+    ducking: bool = True  # Duck music and clip audio under the narration
+    targetLufs: float | None = None  # Integrated loudness target (default AUDIO_TARGET_LUFS)
+
+
+class AlignmentOptions(BaseModel):
+    mode: str = "auto"  # auto (small speed changes, then trims/freeze frames), speed, trim
+    scenes: list[float | str] | None = None  # Narration times where scenes start (seconds or "m:ss")
+    useChapters: bool = False  # Use the project's seo_chapters as scene markers
+    minSpeed: float | None = None  # Slowest speed auto mode may use (default 0.87)
+    maxSpeed: float | None = None  # Fastest speed auto mode may use (default 1.15)
+
 
 class AssembleRequest(BaseModel):
     projectId: str
     clips: list[ClipData] | list[str] | None = None
+    profile: str = "standard"  # draft, standard, archival, shorts_vertical
+    outputs: list[str] | None = None  # Extra profiles rendered in the same pass, e.g. ["shorts_vertical", "draft"]
+    streaming: list[str] | None = None  # Package as adaptive streaming: "hls", "dash"
+    uploadStreaming: bool = False  # Upload the streaming package to Supabase Storage
+    captions: CaptionOptions | None = None
+    audio: AudioMixOptions | None = None
+    align: AlignmentOptions | None = None  # Fit the clips to the narration's length
+    jobId: str | None = None  # Render farm mode: id for /ws/job/<id> progress (generated if omitted)
+    wait: bool = True  # Render farm mode: wait for the render; False = return the job id at once
+
+
+class CaptionRequest(CaptionOptions):
+    projectId: str
+
+
+class ClipThumbnailRequest(BaseModel):
+    projectId: str
+    path: str
+
+
+# In render farm mode the API only queues renders, so it holds no render slots
+RENDER_ADMISSION = [] if RENDER_DISPATCH else [Depends(admission("render"))]
+
+
+async def dispatch_render(kind: str, payload: AssembleRequest) -> dict:
+    """Render farm mode: queue a render for the workers and (unless wait is off) await its result."""
+    if RENDER_QUEUE_MAX and await queue_depth() >= RENDER_QUEUE_MAX:
+        raise HTTPException(
+            status_code=429,
+            detail="Render queue full, retry later",
+            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER)},
+        )
+    try:
+        job_id = await enqueue_render(kind, payload.model_dump(exclude={"jobId", "wait"}), payload.jobId)
+        if not payload.wait:
+            return {"jobId": job_id, "status": QUEUED}
+        job = await wait_for_render(job_id)
+        if job["status"] == FAILED:
+            return {"error": job.get("error"), "jobId": job_id}
+        return {**job["result"], "jobId": job_id}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def clip_payload(clips: list[ClipData] | list[str] | None) -> list[dict] | list[str] | None:
+    """Convert request clip models into the plain dicts the render services expect."""
+    if not clips:
+        return clips
+    return [clip.model_dump() if isinstance(clip, BaseModel) else clip for clip in clips]
 
 
 class CloneVoiceRequest(BaseModel):
@@ -90,7 +208,42 @@ def root():
     return {"message": "OmegaFrame Studio Renderer API"}
 
 
-@app.post("/voice")
+@app.get("/ready")
+def ready_endpoint(response: Response):
+    """Readiness probe: 200 once warm-up (directories, FFmpeg capabilities, encoder) is done, 503 until then."""
+    report = readiness()
+    if not report["ready"]:
+        response.status_code = 503
+    return report
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics: stage timings, FFmpeg processes, queue depth, WebSockets, cache hit rates."""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+@app.get("/storage/usage")
+def storage_usage_endpoint(refresh: bool = False):
+    """Disk usage by category and project, quota status and the last GC pass."""
+    try:
+        report = last_report()
+        if refresh or report is None:
+            report = {**(report or {}), **disk_usage_report()}
+        return report
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/storage/gc")
+def storage_gc_endpoint():
+    """Run a GC pass now (in the background); see /storage/usage for the result."""
+    request_gc()
+    return {"scheduled": True}
+
+
+@app.post("/voice", dependencies=[Depends(admission("generate"))])
 def voice_endpoint(payload: VoiceRequest):
     """Legacy endpoint for backward compatibility."""
     try:
@@ -107,7 +260,7 @@ def voice_endpoint(payload: VoiceRequest):
         return {"error": str(e)}
 
 
-@app.post("/voice/generate")
+@app.post("/voice/generate", dependencies=[Depends(admission("generate"))])
 def generate_voice_endpoint(payload: VoiceRequest):
     """Unified voice generation endpoint supporting cloud and local engines."""
     try:
@@ -135,6 +288,7 @@ def generate_voice_endpoint(payload: VoiceRequest):
             # Save audio file
             from utils.file_utils import save_audio
             audio_path = save_audio(payload.projectId, audio_bytes)
+            remember_script(payload.projectId, audio_path, payload.script)
             
             return {
                 "audio": audio_path,
@@ -233,7 +387,7 @@ def list_local_voices_endpoint():
         return {"error": str(e)}
 
 
-@app.post("/voice/local/generate")
+@app.post("/voice/local/generate", dependencies=[Depends(admission("generate"))])
 def generate_local_voice_endpoint(payload: dict):
     """Generate voice using local XTTS-v2 model (requires GPU)."""
     try:
@@ -253,35 +407,39 @@ def generate_local_voice_endpoint(payload: dict):
         return {"error": str(e)}
 
 
-@app.post("/video")
-def video_endpoint(payload: VideoRequest):
-    """Generate a video clip. Returns either a completed video URL or a job_id for polling."""
+@app.post("/video", dependencies=[Depends(admission("generate"))])
+async def video_endpoint(payload: VideoRequest):
+    """Generate a video clip. Returns either a completed video or a job_id (and provider) for polling."""
     try:
-        if payload.provider == "pika":
-            result = generate_pika_clip(payload.projectId, payload.prompt)
-        else:
-            result = generate_runway_clip(payload.projectId, payload.prompt)
-        return result
+        registry = get_registry()
+        if payload.wait:
+            return await registry.generate(payload.projectId, payload.prompt, payload.provider, hedge=payload.hedge)
+        job = await registry.submit(payload.prompt, payload.provider, payload.projectId)
+        if job.status == COMPLETED:
+            clip_path = await registry.fetch(payload.projectId, job)
+            return {"clip": clip_path, "url": job.url, "status": "completed", "provider": job.provider}
+        return job.to_dict()
     except Exception as e:
         return {"error": str(e)}
 
 
 @app.post("/video/status")
-def video_status_endpoint(payload: JobStatusRequest):
+async def video_status_endpoint(payload: JobStatusRequest):
     """Check the status of a video generation job."""
     try:
-        if payload.provider == "pika":
-            result = poll_pika_job(payload.job_id)
-        elif payload.provider == "runway":
-            result = poll_runway_job(payload.job_id)
-        else:
-            return {"error": f"Unknown provider: {payload.provider}"}
-        return result
+        job = await get_registry().poll(payload.provider, payload.job_id)
+        return job.to_dict()
     except Exception as e:
         return {"error": str(e), "status": "error"}
 
 
-@app.post("/image")
+@app.get("/video/providers")
+def video_providers_endpoint():
+    """Health and generation latency of each video provider."""
+    return get_registry().report()
+
+
+@app.post("/image", dependencies=[Depends(admission("generate"))])
 def image_endpoint(payload: ImageRequest):
     try:
         result = generate_image(payload.projectId, payload.prompt, payload.provider)
@@ -290,10 +448,107 @@ def image_endpoint(payload: ImageRequest):
         return {"error": str(e)}
 
 
-@app.post("/assemble")
-def assemble_endpoint(payload: AssembleRequest):
+@app.post("/image/batch", dependencies=[Depends(admission("generate"))])
+def image_batch_endpoint(payload: ImageBatchRequest):
+    """Generate several images concurrently; repeated prompts are served from the image cache."""
+    try:
+        images = generate_images(payload.projectId, payload.prompts, payload.provider, payload.size, payload.model)
+        return {"images": images}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/assemble", dependencies=RENDER_ADMISSION)
+async def assemble_endpoint(payload: AssembleRequest):
+    if RENDER_DISPATCH:
+        return await dispatch_render(RENDER_ASSEMBLE, payload)
+    try:
+        return await run_in_threadpool(run_render, RENDER_ASSEMBLE, payload.model_dump())
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/assemble/preview", dependencies=RENDER_ADMISSION)
+async def assemble_preview_endpoint(payload: AssembleRequest):
+    """Fast low-resolution render from clip proxies for timeline scrubbing."""
+    if RENDER_DISPATCH:
+        return await dispatch_render(RENDER_PREVIEW, payload)
+    try:
+        return await run_in_threadpool(run_render, RENDER_PREVIEW, payload.model_dump())
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/render/jobs/{job_id}")
+async def render_job_endpoint(job_id: str):
+    """Render farm mode: status, progress and result of a queued render."""
+    try:
+        job = await get_render_job(job_id)
+        return job or {"error": "Job not found"}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/render/workers")
+async def render_workers_endpoint():
+    """Render farm mode: queue depth and the live workers' capacity and running jobs."""
+    try:
+        return await farm_status()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/assemble/profiles")
+def assemble_profiles_endpoint():
+    """Available render profiles and the encoder they'll run on."""
+    return {
+        "encoder": select_encoder(),
+        "default": DEFAULT_PROFILE,
+        "profiles": {name: profile.to_dict() for name, profile in RENDER_PROFILES.items()},
+    }
+
+
+# Planning animates stills (zoompan encodes) in this process even in render farm mode
+@app.post("/assemble/plan", dependencies=[Depends(admission("render"))])
+def assemble_plan_endpoint(payload: AssembleRequest):
+    """Return the render plan for a timeline without rendering it."""
+    try:
+        plan = plan_project_render(
+            payload.projectId,
+            clip_payload(payload.clips),
+            payload.profile,
+            payload.audio.model_dump() if payload.audio else None,
+            payload.align.model_dump() if payload.align else None,
+        )
+        return plan.to_dict()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# Captions and clip thumbnails run FFmpeg here (also in render farm mode), like planning
+@app.post("/captions", dependencies=[Depends(admission("render"))])
+def captions_endpoint(payload: CaptionRequest):
+    """SRT/WebVTT captions timed to the project's narration (TTS timestamps or local alignment)."""
+    try:
+        captions = prepare_captions(payload.projectId, payload.script, payload.formats, payload.style)
+        return {
+            "source": captions["source"],
+            "style": captions["style"],
+            "cues": captions["cues"],
+            **captions["urls"],
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/thumbnails/clip", dependencies=[Depends(admission("render"))])
+def clip_thumbnails_endpoint(payload: ClipThumbnailRequest):
+    """Poster, sprite sheet and WebVTT filmstrip index for a timeline clip (cached)."""
     try:
-        result = assemble_video(payload.projectId, payload.clips)
+        clip_path = resolve_clip_path(payload.path, payload.projectId)
+        result = generate_clip_thumbnails(payload.projectId, clip_path)
+        if result is None:
+            return {"error": f"Could not generate thumbnails for {payload.path}"}
         return result
     except Exception as e:
         return {"error": str(e)}
@@ -302,8 +557,8 @@ def assemble_endpoint(payload: AssembleRequest):
 # Include WebSocket routes
 app.include_router(ws_router)
 
-# Mount static files for renders
-app.mount("/renders", StaticFiles(directory=str(RENDER_DIR)), name="renders")
+# Renders, thumbnails and previews (ETags, Range requests, versioned immutable URLs)
+app.include_router(media_router)
 
 
 if __name__ == "__main__":
@@ -5,21 +5,13 @@ This demonstrates the pattern for saving generated clips to Supabase Storage and
 from fastapi import APIRouter, HTTPException
 from services.supabase_storage import upload_video_clip
 from services.supabase_db import save_clip_record
-from services.pika_service import generate_pika_clip
-from services.runway_service import generate_runway_clip
-import requests
+from services.video_providers import COMPLETED, get_registry
+from services.probe_service import get_duration
 from typing import Dict, Any
 
 router = APIRouter()
 
 
-async def generate_clip_bytes(url: str) -> bytes:
-    """Download clip from URL and return as bytes."""
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    return response.content
-
-
 @router.post("/video")
 async def generate_video_clip(request: Dict[str, Any]):
     """
@@ -29,35 +21,32 @@ async def generate_video_clip(request: Dict[str, Any]):
     {
         "projectId": "uuid",
         "sceneId": "uuid" (optional),
-        "provider": "pika" | "runway",
+        "provider": "pika" | "runway" | "fake" (optional; default: first healthy provider),
         "prompt": "video generation prompt"
     }
     """
     project_id = request.get("projectId")
     scene_id = request.get("sceneId")
-    provider = request.get("provider", "pika")
+    provider = request.get("provider")
     prompt = request.get("prompt")
 
     if not project_id or not prompt:
         raise HTTPException(status_code=400, detail="projectId and prompt are required")
 
     try:
-        # Generate clip using provider
-        if provider == "pika":
-            result = generate_pika_clip(project_id, prompt)
-        elif provider == "runway":
-            result = generate_runway_clip(project_id, prompt)
-        else:
-            raise HTTPException(status_code=400, detail=f"Unknown provider: {provider}")
+        # Generate clip using the first provider that accepts the job
+        registry = get_registry()
+        job = await registry.submit(prompt, provider, project_id)
+        provider = job.provider
 
-        # If result has a URL, download and upload to Supabase
-        clip_url = result.get("url") or result.get("clip")
-        if not clip_url:
+        if job.status != COMPLETED:
             # If it's a job ID, return that for polling
-            return result
+            return job.to_dict()
+        result = {"url": job.url, "clip": await registry.fetch(project_id, job)}
 
-        # Download clip
-        clip_bytes = await generate_clip_bytes(clip_url)
+        # Read the clip the provider fetch saved into the project
+        with open(result["clip"], "rb") as f:
+            clip_bytes = f.read()
 
         # Upload to Supabase Storage
         file_url = upload_video_clip(project_id, scene_id or "clip", clip_bytes, provider)
@@ -68,6 +57,7 @@ async def generate_video_clip(request: Dict[str, Any]):
             scene_id=scene_id,
             provider=provider,
             file_url=file_url,
+            duration=get_duration(result["clip"]) if result.get("clip") else None,
             prompt=prompt,
             status="done"
         )
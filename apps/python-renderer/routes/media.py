@@ -0,0 +1,14 @@
+"""
+Media routes: renders, thumbnails and previews under /renders.
+"""
+from fastapi import APIRouter, Request
+
+from services.media_service import serve_media
+
+router = APIRouter()
+
+
+@router.api_route("/renders/{file_path:path}", methods=["GET", "HEAD"])
+async def renders_media(request: Request, file_path: str):
+    """Serve render outputs with ETags, Range support and versioned immutable URLs."""
+    return await serve_media(request, file_path)
@@ -0,0 +1,166 @@
+"""
+Admission control for CPU-heavy endpoints.
+
+Render and generation endpoints are sync handlers, so every accepted
+request occupies a threadpool thread and (for renders) starts FFmpeg
+encodes. Requests pass through an admission pool first: they wait on the
+event loop, not in a thread, until a slot is free (and, for renders, until
+the number of running FFmpeg processes is below the limit). Beyond the
+queue limit or the maximum wait they're rejected with 429 and a
+Retry-After estimate. Heavy pools are sized well below the threadpool, so
+cheap endpoints like /voice/cloud/list keep responding under overload.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+
+from config import (
+    ADMISSION_GENERATE_QUEUE,
+    ADMISSION_GENERATE_SLOTS,
+    ADMISSION_MAX_FFMPEG,
+    ADMISSION_MAX_WAIT,
+    ADMISSION_RENDER_QUEUE,
+    ADMISSION_RENDER_SLOTS,
+)
+from utils.metrics import ffmpeg_running
+
+POLL_INTERVAL = 0.25  # How often waiters re-check FFmpeg load, which changes outside the event loop
+
+ADMISSION_REJECTED = Counter("renderer_admission_rejected_total", "Requests rejected with 429", ["pool", "reason"])
+ADMISSION_ACTIVE = Gauge("renderer_admission_active", "Requests holding an admission slot", ["pool"])
+ADMISSION_WAITING = Gauge("renderer_admission_waiting", "Requests queued for an admission slot", ["pool"])
+
+
+class AdmissionPool:
+    """A bounded set of slots with a bounded FIFO wait queue."""
+
+    def __init__(self, name: str, slots: int, max_queue: int, max_ffmpeg: Optional[int] = None):
+        self.name = name
+        self.slots = max(slots, 1)
+        self.max_queue = max(max_queue, 0)
+        self.max_ffmpeg = max_ffmpeg
+        self.active = 0
+        self.waiters: deque = deque()
+        self.avg_service_time = 10.0  # EWMA of seconds a slot is held, seeded pessimistically
+        self._changed: Optional[asyncio.Event] = None
+
+    def _event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _has_capacity(self) -> bool:
+        if self.active >= self.slots:
+            return False
+        return self.max_ffmpeg is None or ffmpeg_running() < self.max_ffmpeg
+
+    def retry_after(self) -> int:
+        """Seconds until a new request would likely be admitted."""
+        backlog = len(self.waiters) + max(self.active - self.slots + 1, 1)
+        return max(1, math.ceil(self.avg_service_time * backlog / self.slots))
+
+    def _reject(self, reason: str) -> HTTPException:
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        retry_after = self.retry_after()
+        return HTTPException(
+            status_code=429,
+            detail=f"Server busy ({self.name}: {reason}), retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    async def acquire(self) -> None:
+        """Wait for a slot in FIFO order, or raise 429."""
+        if not self.waiters and self._has_capacity():
+            self._take()
+            return
+        if len(self.waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+
+        ticket = object()
+        self.waiters.append(ticket)
+        ADMISSION_WAITING.labels(self.name).set(len(self.waiters))
+        deadline = time.monotonic() + ADMISSION_MAX_WAIT
+        try:
+            while not (self.waiters[0] is ticket and self._has_capacity()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._reject("timeout")
+                event = self._event()
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(POLL_INTERVAL, remaining))
+                except asyncio.TimeoutError:
+                    pass
+            self._take()
+        finally:
+            self.waiters.remove(ticket)
+            ADMISSION_WAITING.labels(self.name).set(len(self.waiters))
+            self._event().set()
+
+    def _take(self) -> None:
+        self.active += 1
+        ADMISSION_ACTIVE.labels(self.name).set(self.active)
+
+    def release(self, held_for: float) -> None:
+        self.active -= 1
+        self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * held_for
+        ADMISSION_ACTIVE.labels(self.name).set(self.active)
+        self._event().set()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "max_queue": self.max_queue,
+            "avg_service_time": round(self.avg_service_time, 2),
+        }
+
+
+_cpus = os.cpu_count() or 1
+
+POOLS: Dict[str, AdmissionPool] = {
+    # FFmpeg renders: roughly one encode per two cores, and no new render while the box is saturated
+    "render": AdmissionPool(
+        "render",
+        slots=ADMISSION_RENDER_SLOTS or max(1, _cpus // 2),
+        max_queue=ADMISSION_RENDER_QUEUE or 2 * max(1, _cpus // 2),
+        max_ffmpeg=ADMISSION_MAX_FFMPEG or 2 * _cpus,
+    ),
+    # Provider generation calls: mostly waiting on the network, but each holds a thread for minutes
+    "generate": AdmissionPool(
+        "generate",
+        slots=ADMISSION_GENERATE_SLOTS,
+        max_queue=ADMISSION_GENERATE_QUEUE,
+    ),
+}
+
+
+def admission(pool_name: str) -> Callable[[], AsyncIterator[None]]:
+    """
+    FastAPI dependency that holds a slot in `pool_name` for the duration of a request.
+
+    Usage:
+        @app.post("/assemble", dependencies=[Depends(admission("render"))])
+    """
+    pool = POOLS[pool_name]
+
+    async def dependency() -> AsyncIterator[None]:
+        await pool.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            pool.release(time.monotonic() - started)
+
+    return dependency
+
+
+def admission_stats() -> Dict[str, Dict[str, float]]:
+    return {name: pool.stats() for name, pool in POOLS.items()}
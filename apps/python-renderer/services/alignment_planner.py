@@ -0,0 +1,232 @@
+"""
+Timeline-to-narration alignment.
+
+Works out, from probed clip durations and the narration's length, how to
+retime a timeline so the video ends exactly when the narration does,
+instead of letting the final mux truncate one of them. Each scene (the
+whole timeline, or one group of clips per narration scene marker) is fit
+to its stretch of narration with, in order of preference:
+- a uniform speed change within an imperceptible range (auto/speed mode)
+- trimming the excess off the clip tails, proportionally to their length
+- holding the scene's last frame (freeze frame) for the remaining gap
+
+The result is written into the clips' start/end/speed/hold fields, so the
+render planner turns it into conform steps of the one render plan.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+MODE_AUTO = "auto"  # speed changes within [min_speed, max_speed], then trims / freeze frames
+MODE_SPEED = "speed"  # fit with speed changes alone where they stay within SPEED_LIMITS
+MODE_TRIM = "trim"  # trims and freeze frames only; clips keep their speed
+MODES = (MODE_AUTO, MODE_SPEED, MODE_TRIM)
+
+SPEED_LIMITS = (0.5, 2.0)  # Range atempo handles in a single filter instance
+MIN_CLIP_SECONDS = 0.5  # Trims never cut a clip shorter than this
+TOLERANCE = 0.01  # Mismatches below this are left alone
+
+
+@dataclass
+class AlignmentSpec:
+    """What to align a timeline to."""
+    target: float  # Narration duration in seconds
+    mode: str = MODE_AUTO
+    scenes: List[float] = field(default_factory=list)  # Narration times where scenes start
+    max_speed: float = 1.15
+    min_speed: float = 0.87
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "target": self.target,
+            "mode": self.mode,
+            "scenes": self.scenes,
+            "max_speed": self.max_speed,
+            "min_speed": self.min_speed,
+        }
+
+
+def parse_timestamp(value: Any) -> float:
+    """Seconds from 12.5, "12.5", "1:05" or "1:02:03"."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if not re.fullmatch(r"\d+(\.\d+)?(:\d{1,2}(\.\d+)?){0,2}", text):
+        raise ValueError(f"Invalid timestamp: {value}")
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def scene_markers(scenes: Optional[List[Any]]) -> List[float]:
+    """
+    Sorted scene start times from markers or SEO chapters.
+
+    Accepts seconds, timestamp strings or {"time": ..., "title": ...}
+    chapter dicts (the seo_chapters format).
+    """
+    markers = []
+    for scene in scenes or []:
+        value = scene.get("time", scene.get("start")) if isinstance(scene, dict) else scene
+        markers.append(parse_timestamp(value))
+    return sorted(set(markers))
+
+
+def _source_span(clip: Dict[str, Any], source_duration: Optional[float]) -> Optional[float]:
+    end = clip.get("end") if clip.get("end") is not None else source_duration
+    if end is None:
+        return None
+    return max(float(end) - float(clip.get("start") or 0.0), 0.0)
+
+
+def _transition_seconds(clip: Dict[str, Any]) -> float:
+    spec = clip.get("transition")
+    return float(spec.get("duration") or 0.5) if spec else 0.0
+
+
+def _group_clips(
+    clips: List[Dict[str, Any]],
+    markers: List[float],
+    target: float,
+    notes: List[str],
+) -> List[Tuple[int, float, float, List[int]]]:
+    """
+    Assign clips to scenes.
+
+    Clips carrying a "scene" index are grouped by it; otherwise scenes map
+    one-to-one onto clips when the counts match. Anything else aligns the
+    timeline as a whole. Returns (scene, start, duration, clip indexes).
+    """
+    markers = [m for m in markers if m < target]
+    if markers:
+        markers[0] = 0.0  # Narration before the first marker belongs to the first scene
+
+    assignment: Optional[List[int]] = None
+    if markers and all(clip.get("scene") is not None for clip in clips):
+        assignment = [min(max(int(clip["scene"]), 0), len(markers) - 1) for clip in clips]
+        if assignment != sorted(assignment):
+            notes.append("alignment: clip scene indexes are out of order; aligning the whole timeline")
+            assignment = None
+    elif markers and len(markers) == len(clips):
+        assignment = list(range(len(clips)))
+    elif len(markers) > 1:
+        notes.append(
+            f"alignment: {len(markers)} scene markers for {len(clips)} clips; aligning the whole timeline"
+        )
+
+    if not assignment:
+        return [(0, 0.0, target, list(range(len(clips))))]
+
+    used = sorted(set(assignment))
+    groups = []
+    for position, scene in enumerate(used):
+        start = 0.0 if position == 0 else markers[scene]
+        end = markers[used[position + 1]] if position + 1 < len(used) else target
+        groups.append((scene, start, end - start, [i for i, s in enumerate(assignment) if s == scene]))
+    return groups
+
+
+def _trim_tails(spans: List[float], excess: float) -> List[float]:
+    """Cut `excess` seconds off the spans in proportion to their length, keeping MIN_CLIP_SECONDS each."""
+    spans = list(spans)
+    while excess > 1e-6:
+        trimmable = [i for i, s in enumerate(spans) if s > MIN_CLIP_SECONDS + 1e-6]
+        if not trimmable:
+            break
+        total = sum(spans[i] for i in trimmable)
+        removed = 0.0
+        for i in trimmable:
+            cut = min(excess * spans[i] / total, spans[i] - MIN_CLIP_SECONDS)
+            spans[i] -= cut
+            removed += cut
+        excess -= removed
+        if removed < 1e-6:
+            break
+    return spans
+
+
+def _fit_scene(spans: List[float], needed: float, spec: AlignmentSpec) -> Tuple[float, List[float], float]:
+    """Speed, trimmed source spans and trailing hold that make `spans` last `needed` seconds."""
+    total = sum(spans)
+    speed = 1.0
+    if spec.mode != MODE_TRIM and needed > 0:
+        low, high = (spec.min_speed, spec.max_speed) if spec.mode == MODE_AUTO else SPEED_LIMITS
+        low, high = max(low, SPEED_LIMITS[0]), min(high, SPEED_LIMITS[1])
+        speed = round(min(max(total / needed, low), high), 4)
+        if abs(speed - 1.0) < 1e-3:
+            speed = 1.0
+
+    residual = needed - total / speed
+    hold = 0.0
+    if residual < -TOLERANCE:
+        # Too long even at the fastest allowed speed: cut source footage
+        spans = _trim_tails(spans, -residual * speed)
+        residual = needed - sum(spans) / speed
+    if residual > TOLERANCE:
+        hold = residual
+    return speed, spans, hold
+
+
+def align_clips(
+    clips: List[Dict[str, Any]],
+    source_durations: List[Optional[float]],
+    spec: AlignmentSpec,
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], List[str]]:
+    """
+    Retime normalized timeline clips so they cover the narration exactly.
+
+    Args:
+        clips: Normalized clip dicts ({"path", "start", "end", "transition", ...})
+        source_durations: Probed duration of each clip's file (None if unknown)
+        spec: Narration length, scene markers and fitting mode
+
+    Returns:
+        (clips with start/end/speed/hold set, alignment report or None if
+        the timeline couldn't be aligned, planner notes)
+    """
+    notes: List[str] = []
+    if spec.mode not in MODES:
+        raise ValueError(f"Unknown alignment mode: {spec.mode} (expected one of {', '.join(MODES)})")
+    spans = [_source_span(c, d) for c, d in zip(clips, source_durations)]
+    if any(s is None for s in spans):
+        notes.append("alignment skipped: unknown clip duration")
+        return clips, None, notes
+    if spec.target <= 0:
+        notes.append("alignment skipped: narration has no duration")
+        return clips, None, notes
+
+    aligned = [dict(c) for c in clips]
+    scenes = []
+    last = len(clips) - 1
+    for scene, start, duration, indexes in _group_clips(clips, scene_markers(spec.scenes), spec.target, notes):
+        # Transitions overlap neighbouring clips, so the scene needs that much more footage
+        overlap = sum(_transition_seconds(clips[i]) for i in indexes if i != last)
+        group_spans = [spans[i] for i in indexes]
+        speed, fitted, hold = _fit_scene(group_spans, duration + overlap, spec)
+        for i, span in zip(indexes, fitted):
+            clip = aligned[i]
+            if span < spans[i] - 1e-6:
+                clip["end"] = round(float(clip.get("start") or 0.0) + span, 3)
+            clip["speed"] = speed
+            clip["hold"] = 0.0
+        aligned[indexes[-1]]["hold"] = round(hold, 3)
+        scenes.append({
+            "scene": scene,
+            "start": round(start, 3),
+            "duration": round(duration, 3),
+            "clips": indexes,
+            "footage": round(sum(group_spans), 3),
+            "speed": speed,
+            "trimmed": round(sum(group_spans) - sum(fitted), 3),
+            "hold": round(hold, 3),
+        })
+
+    report = {
+        "target": spec.target,
+        "mode": spec.mode,
+        "markers": spec.scenes,
+        "timeline_before": round(sum(spans) - sum(_transition_seconds(c) for c in clips[:-1]), 3),
+        "scenes": scenes,
+    }
+    return aligned, report, notes
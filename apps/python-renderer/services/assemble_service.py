@@ -1,28 +1,70 @@
 import os
+import shutil
 import subprocess
+import uuid
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import replace
 from pathlib import Path
-from utils.file_utils import get_project_paths, save_clip, ensure_project_folder
-from utils.ffmpeg_utils import concat_videos, add_audio_to_video
+from utils.file_utils import get_project_paths, save_clip, save_music, ensure_project_folder
+from utils.project_manifest import media_kind
+from utils.ffmpeg_utils import concat_videos, concat_segments, run_ffmpeg
+from services.probe_service import get_duration, probe_media, probe_keyframes
+from services.render_planner import (
+    ACTION_COPY,
+    STRATEGY_CONCAT_COPY,
+    STRATEGY_SINGLE_PASS,
+    STRATEGY_SPLICE,
+    ClipPlan,
+    RenderPlan,
+    mark_segments_unmatched,
+    plan_render,
+)
+from services.render_graph import (
+    build_conform_command,
+    build_mix_command,
+    build_multi_output_command,
+    build_single_pass_command,
+    build_transition_command,
+)
+from services.audio_mix_service import AudioMix
+from services.alignment_planner import AlignmentSpec, scene_markers
+from services.proxy_service import PREVIEW_PROFILE, PREVIEW_TARGET, ensure_proxies
+from services.still_service import render_stills
+from services.render_profiles import RenderProfile, describe_output, faststart_args, get_profile
+from services.media_service import media_url
+from services.packaging_service import package_render
+from services.caption_service import prepare_captions, write_burn_in_script
+from services.ffmpeg_capabilities import has_filter
+from services.render_cache import load_cached_render, render_flight, render_key, store_cached_render
+from services.supabase_db import get_project_chapters, save_export_record
+from utils.metrics import ffmpeg_process, record_spans, stage, timed
 from config import RENDER_DIR, PROJECTS_DIR
 
 
+@timed("thumbnail")
 def extract_thumbnail(video_path: str, thumbnail_path: str) -> bool:
-    """Extract a thumbnail from video at 1 second mark."""
+    """Extract a thumbnail from video at the 1 second mark (or midpoint of shorter videos)."""
+    info = probe_media(video_path)
+    timestamp = 1.0
+    if info and info.get("duration"):
+        timestamp = min(timestamp, info["duration"] / 2)
     try:
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-y",
-                "-i", video_path,
-                "-ss", "00:00:01",
-                "-vframes", "1",
-                "-q:v", "2",  # High quality
-                str(thumbnail_path),
-            ],
-            check=True,
-            capture_output=True,
-        )
+        with ffmpeg_process():
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-ss", f"{timestamp:.3f}",
+                    "-i", video_path,
+                    "-vframes", "1",
+                    "-q:v", "2",  # High quality
+                    str(thumbnail_path),
+                ],
+                check=True,
+                capture_output=True,
+            )
         return True
     except subprocess.CalledProcessError as e:
         print(f"Thumbnail extraction error: {e.stderr.decode() if e.stderr else 'Unknown error'}")
@@ -58,110 +100,562 @@ def resolve_clip_path(clip: str, project_id: str) -> str:
     raise FileNotFoundError(f"Clip not found: {clip}")
 
 
-def build_ffmpeg_trim_commands(clips: list[dict], output_path: str) -> list[str]:
-    """Build FFmpeg command to trim and concatenate clips."""
-    filter_complex_parts = []
-    inputs = []
+class _UnmatchedSegment(Exception):
+    """A re-encoded segment's H.264 parameter sets differ from the copied clips'."""
+
+
+@timed("timeline")
+def execute_plan(plan: RenderPlan, output_path: str, work_dir: Path) -> bool:
+    """Run a render plan, writing the concatenated timeline (without narration) to output_path."""
+    if plan.strategy == STRATEGY_CONCAT_COPY:
+        return concat_videos([clip.path for clip in plan.clips], output_path)
     
-    for i, clip in enumerate(clips):
-        clip_path = clip["path"]
-        start = clip.get("start", 0)
-        end = clip.get("end")
-        
-        inputs += ["-i", clip_path]
+    if plan.strategy == STRATEGY_SINGLE_PASS:
+        return run_ffmpeg(build_single_pass_command(plan, output_path), "single-pass render")
+    
+    try:
+        if plan.strategy == STRATEGY_SPLICE:
+            return _execute_splice(plan, output_path, work_dir)
+        return _execute_segment_conform(plan, output_path, work_dir)
+    except _UnmatchedSegment as e:
+        # Copying it next to the clips would put two sets of parameter sets in one track
+        print(f"⚠️ Warning: {e}; re-encoding the whole timeline in one pass")
+        mark_segments_unmatched(plan)
+        plan.strategy = STRATEGY_SINGLE_PASS
+        plan.notes.append(f"{e}; re-encoded the whole timeline")
+        return run_ffmpeg(build_single_pass_command(plan, output_path), "single-pass render")
+
+
+def _check_segment(plan: RenderPlan, path: str, what: str) -> None:
+    """Raise _UnmatchedSegment unless an encoded segment's SPS/PPS match the copied clips'."""
+    if not plan.target.extradata_hash:
+        return
+    info = probe_media(path)
+    if not info or info.get("extradata_hash") != plan.target.extradata_hash:
+        raise _UnmatchedSegment(f"{what} doesn't match the clips' H.264 parameter sets")
+
+
+def _execute_segment_conform(plan: RenderPlan, output_path: str, work_dir: Path) -> bool:
+    """Re-encode only the mismatched clips, then stream-copy everything together."""
+    work_dir.mkdir(parents=True, exist_ok=True)
+    segment_paths = []
+    for clip in plan.clips:
+        if clip.action == ACTION_COPY:
+            segment_paths.append(clip.path)
+            continue
+        segment_path = str(work_dir / f"segment_{clip.index:04d}.mp4")
+        cmd = build_conform_command(clip, plan.target, segment_path, plan.profile)
+        if not run_ffmpeg(cmd, f"conform clip {clip.index}"):
+            return False
+        _check_segment(plan, segment_path, f"conformed clip {clip.index}")
+        segment_paths.append(segment_path)
+    
+    return concat_videos(segment_paths, output_path)
+
+
+@timed("timeline")
+def execute_multi_output(plans: list[RenderPlan], output_paths: list[str]) -> bool:
+    """Render one timeline into several outputs (one per plan) with a single decode."""
+    return run_ffmpeg(build_multi_output_command(plans, output_paths), f"{len(plans)}-output render")
+
+
+def _keyframe_at(path: str, t: float) -> tuple[float, float] | None:
+    """First (pts, dts) keyframe of a file at or after t (within half a millisecond)."""
+    return next((k for k in probe_keyframes(path) if k[0] >= t - 5e-4), None)
+
+
+def _execute_splice(plan: RenderPlan, output_path: str, work_dir: Path) -> bool:
+    """
+    Join clips with transitions while re-encoding as little as possible.
+
+    Mismatched clips are conformed first (with keyframes forced at their
+    transition boundaries). Each transition region is then rendered on its
+    own and spliced between the stream-copied clip bodies using concat
+    in/out points.
+    """
+    work_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Splice sources: untrimmed, target-format files for every clip
+    sources: list[ClipPlan] = []
+    for clip in plan.clips:
+        if clip.action == ACTION_COPY:
+            sources.append(clip)
+            continue
+        incoming = plan.transition_before(clip.index)
+        outgoing = plan.transition_after(clip.index)
+        boundaries = []
+        if incoming:
+            boundaries.append(incoming.head_end)
+        if outgoing:
+            boundaries.append(outgoing.tail_start)
+        extra_args = []
+        if boundaries:
+            extra_args += ["-force_key_frames", ",".join(f"{t:.3f}" for t in boundaries)]
+        segment_path = str(work_dir / f"segment_{clip.index:04d}.mp4")
+        cmd = build_conform_command(clip, plan.target, segment_path, plan.profile, extra_args)
+        if not run_ffmpeg(cmd, f"conform clip {clip.index}"):
+            return False
+        _check_segment(plan, segment_path, f"conformed clip {clip.index}")
+        sources.append(ClipPlan(
+            index=clip.index,
+            path=segment_path,
+            source_duration=clip.duration,
+            has_audio=True,
+        ))
+    
+    # Pin every transition to real keyframes of its sources (forced keyframes land on frame boundaries)
+    transitions = {}
+    for t in plan.transitions:
+        tail = _keyframe_at(sources[t.after].path, t.tail_start)
+        head = _keyframe_at(sources[t.after + 1].path, t.head_end)
+        if tail is None or head is None:
+            print(f"Splice error: no keyframe for transition after clip {t.after}")
+            return False
+        transitions[t.after] = (replace(t, tail_start=tail[0], head_end=head[0]), tail[1])
+    
+    segments = []
+    for source in sources:
+        incoming = transitions.get(source.index - 1)
+        outgoing = transitions.get(source.index)
+        inpoint = incoming[0].head_end if incoming else 0.0
+        body = {"path": source.path, "inpoint": inpoint}
+        if outgoing:
+            transition, tail_dts = outgoing
+            # The concat demuxer cuts on dts; the explicit duration keeps the timeline on pts
+            body["outpoint"] = tail_dts
+            body["duration"] = transition.tail_start - inpoint
+        if "duration" not in body or body["duration"] > 0:
+            segments.append(body)
         
-        # Build trim filter for video and audio
-        if end is not None and end > start:
-            # Trim both video and audio
-            filter_complex_parts.append(
-                f"[{i}:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{i}];"
-                f"[{i}:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{i}]"
-            )
-        elif start > 0:
-            # Only trim start
-            filter_complex_parts.append(
-                f"[{i}:v]trim=start={start},setpts=PTS-STARTPTS[v{i}];"
-                f"[{i}:a]atrim=start={start},asetpts=PTS-STARTPTS[a{i}]"
-            )
-        else:
-            # No trimming needed
-            filter_complex_parts.append(
-                f"[{i}:v]copy[v{i}];"
-                f"[{i}:a]acopy[a{i}]"
-            )
+        if outgoing:
+            region_path = str(work_dir / f"transition_{source.index:04d}.mp4")
+            cmd = build_transition_command(plan, transition, source, sources[source.index + 1], region_path)
+            if not run_ffmpeg(cmd, f"transition after clip {source.index}"):
+                return False
+            _check_segment(plan, region_path, f"transition after clip {source.index}")
+            segments.append({"path": region_path})
     
-    # Concatenate all trimmed clips
-    concat_inputs = "".join(f"[v{i}][a{i}]" for i in range(len(clips)))
-    filter_complex_parts.append(
-        f"{concat_inputs}concat=n={len(clips)}:v=1:a=1[outv][outa]"
+    return concat_segments(segments, output_path)
+
+
+def build_alignment(project_id: str, voice_path: str, options: dict | None) -> AlignmentSpec | None:
+    """
+    Alignment settings fitting the timeline to the project's narration.
+
+    Args:
+        project_id: Project ID
+        voice_path: Narration track
+        options: {"mode", "scenes", "useChapters", "minSpeed", "maxSpeed"}; scenes are
+            narration timestamps (seconds, "m:ss" or {"time"} chapter dicts). With
+            useChapters and no explicit scenes, the project's seo_chapters are used.
+
+    Returns:
+        AlignmentSpec, or None if no alignment was requested
+    """
+    if not options:
+        return None
+    options = {k: v for k, v in options.items() if v is not None}
+    narration = get_duration(voice_path)
+    if not narration:
+        raise ValueError("Cannot align the timeline: the project has no narration")
+    scenes = options.get("scenes") or []
+    if not scenes and options.get("useChapters"):
+        try:
+            with stage("chapters", "supabase"):
+                scenes = get_project_chapters(project_id)
+        except Exception as e:
+            print(f"Warning: Could not load chapters for {project_id}: {e}")
+    defaults = AlignmentSpec(target=narration)
+    return AlignmentSpec(
+        target=narration,
+        mode=options.get("mode", defaults.mode),
+        scenes=scene_markers(scenes),
+        max_speed=options.get("maxSpeed", defaults.max_speed),
+        min_speed=options.get("minSpeed", defaults.min_speed),
     )
+
+
+def _still_options(clip: dict | str) -> dict:
+    """Ken Burns settings of a still image clip (unset values use still_service defaults)."""
+    if isinstance(clip, str):
+        return {}
+    return {key: clip.get(key) for key in ("duration", "motion", "zoom")}
+
+
+def resolve_timeline_clips(project_id: str, clips: list[dict] | list[str] | None, project_media: list[str]) -> list[dict]:
+    """
+    Resolve requested clips (or the project's media) into local timeline clips with trim data.
+
+    Videos keep their trims; still images get a "still" entry with their
+    Ken Burns settings and are turned into motion clips by render_stills.
+    """
+    if not clips:
+        # Fallback to every video and image in the project clips directory
+        return [
+            {"path": clip, "start": 0.0, "end": None, **({"still": {}} if media_kind(clip) == "image" else {})}
+            for clip in project_media
+        ]
     
-    return [
-        "ffmpeg",
-        "-y",
-        *inputs,
-        "-filter_complex", "".join(filter_complex_parts),
-        "-map", "[outv]",
-        "-map", "[outa]",
-        "-c:v", "libx264",
-        "-c:a", "aac",
-        output_path,
-    ]
+    video_clips = []
+    for clip in clips:
+        if not clip:
+            continue
+        # Legacy requests send plain paths (strings) instead of trim dicts
+        clip_path = clip if isinstance(clip, str) else clip.get("path")
+        if not clip_path:
+            continue
+        try:
+            resolved_path = resolve_clip_path(clip_path, project_id)
+            kind = media_kind(resolved_path)
+            if kind is None:
+                continue
+            video_clips.append({
+                "path": resolved_path,
+                "start": 0.0 if isinstance(clip, str) or kind == "image" else clip.get("start", 0),
+                "end": None if isinstance(clip, str) or kind == "image" else clip.get("end"),
+                "transition": None if isinstance(clip, str) else clip.get("transition"),
+                "scene": None if isinstance(clip, str) else clip.get("scene"),
+                **({"still": _still_options(clip)} if kind == "image" else {}),
+            })
+        except Exception as e:
+            print(f"Warning: Skipping clip {clip_path}: {e}")
+            continue
+    return video_clips
+
+
+def plan_project_render(
+    project_id: str,
+    clips: list[dict] | list[str] | None = None,
+    profile: str | None = None,
+    audio: dict | None = None,
+    align: dict | None = None,
+) -> RenderPlan:
+    """
+    Resolve a project's timeline and build its render plan without executing it.
+
+    Still images are rendered to their (cached) motion clips first, since
+    the plan depends on them; the render reuses them.
+    """
+    render_profile = get_profile(profile)
+    paths = get_project_paths(project_id)
+    alignment = build_alignment(project_id, paths["audio"], align)
+    with stage("resolve_clips"):
+        video_clips = resolve_timeline_clips(project_id, clips, paths["clips"])
+    if not video_clips:
+        raise ValueError("No valid video clips found to assemble")
+    with stage("stills"):
+        video_clips = render_stills(project_id, video_clips, render_profile)
+    with stage("plan"):
+        return plan_render(
+            project_id,
+            video_clips,
+            profile=render_profile,
+            audio_mix=build_audio_mix(project_id, paths["audio"], audio),
+            alignment=alignment,
+        )
+
+
+def _faststart_in_place(video_path: Path, profile: RenderProfile) -> bool:
+    """Remux a file so its moov atom comes first (stream copy, no re-encode)."""
+    args = faststart_args(profile)
+    if not args:
+        return True
+    remuxed = video_path.with_name(f".{video_path.stem}.faststart.mp4")
+    if not run_ffmpeg(["ffmpeg", "-y", "-i", str(video_path), "-map", "0", "-c", "copy", *args, str(remuxed)], "faststart remux"):
+        remuxed.unlink(missing_ok=True)
+        return False
+    os.replace(remuxed, video_path)
+    return True
+
+
+def resolve_music_path(music: str, project_id: str) -> str:
+    """Resolve a music bed - URL (downloaded into the project), project-relative or absolute path."""
+    if music.startswith("http://") or music.startswith("https://"):
+        return save_music(project_id, music)
+    for candidate in (PROJECTS_DIR / project_id / "music" / music, PROJECTS_DIR / project_id / music, Path(music)):
+        if candidate.exists():
+            return str(candidate)
+    raise FileNotFoundError(f"Music not found: {music}")
+
+
+def build_audio_mix(project_id: str, voice_path: str, options: dict | None = None) -> AudioMix:
+    """
+    Soundtrack settings for a render.
+
+    Args:
+        project_id: Project ID
+        voice_path: Narration track (may not exist)
+        options: {"music", "musicVolume", "clipAudio", "clipVolume", "ducking", "targetLufs"};
+            volumes are dB relative to the loudness target, unset values use the defaults
+    """
+    options = {k: v for k, v in (options or {}).items() if v is not None}
+    defaults = AudioMix()
+    return AudioMix(
+        voice_path=voice_path,
+        music_path=resolve_music_path(options["music"], project_id) if options.get("music") else None,
+        clip_audio=options.get("clipAudio", defaults.clip_audio),
+        clip_gain_db=options.get("clipVolume", defaults.clip_gain_db),
+        music_gain_db=options.get("musicVolume", defaults.music_gain_db),
+        ducking=options.get("ducking", defaults.ducking),
+        target_lufs=options.get("targetLufs", defaults.target_lufs),
+    )
+
+
+@timed("mux")
+def mux_soundtrack(temp_video: Path, final_video_path: str, plan: RenderPlan) -> None:
+    """
+    Put the mixed soundtrack on the assembled timeline.
+
+    If the timeline encode already mixed it (single pass), the file is only
+    moved into place; otherwise the mix is the one audio encode here, with
+    the video stream-copied. Either way the output gets faststart.
+    """
+    if plan.audio_mix is not None and not plan.mixes_in_timeline:
+        cmd = build_mix_command(plan, str(temp_video), final_video_path, faststart_args(plan.profile))
+        if run_ffmpeg(cmd, "soundtrack mix"):
+            temp_video.unlink(missing_ok=True)
+            return
+        # If mixing fails, just use the timeline's own audio
+    if temp_video.exists():
+        os.replace(str(temp_video), final_video_path)
+        _faststart_in_place(Path(final_video_path), plan.profile)
 
 
-def assemble_video(project_id: str, clips: list[dict] | list[str] | None = None) -> dict:
-    """Assemble final video from clips and audio with optional trimming."""
+def assemble_preview(
+    project_id: str,
+    clips: list[dict] | list[str] | None = None,
+    audio: dict | None = None,
+    align: dict | None = None,
+) -> dict:
+    """Assemble a low-resolution preview from clip proxies (originals are left untouched)."""
+    with record_spans() as spans:
+        result = _assemble_preview(project_id, clips, audio, align)
+    result["timings"] = spans
+    return result
+
+
+@timed("preview")
+def _assemble_preview(
+    project_id: str,
+    clips: list[dict] | list[str] | None,
+    audio: dict | None,
+    align: dict | None,
+) -> dict:
     paths = get_project_paths(project_id)
-    audio_path = paths["audio"]
+    alignment = build_alignment(project_id, paths["audio"], align)
+    with stage("resolve_clips"):
+        video_clips = resolve_timeline_clips(project_id, clips, paths["clips"])
+    if not video_clips:
+        raise ValueError("No valid video clips found to assemble")
     
-    # Use provided clips or get from project paths
-    if clips and len(clips) > 0:
-        # Check if clips have trim data (dict) or are just paths (str)
-        has_trim_data = isinstance(clips[0], dict)
-        
-        if has_trim_data:
-            # Clips with trim data
-            processed_clips = []
-            for clip in clips:
-                if not clip or not clip.get("path"):
-                    continue
-                try:
-                    resolved_path = resolve_clip_path(clip["path"], project_id)
-                    # Verify it's a video file
-                    if resolved_path.lower().endswith((".mp4", ".mov", ".webm", ".avi")):
-                        processed_clips.append({
-                            "path": resolved_path,
-                            "start": clip.get("start", 0),
-                            "end": clip.get("end"),
-                        })
-                except Exception as e:
-                    print(f"Warning: Skipping clip {clip.get('path', clip)}: {e}")
-                    continue
-            video_clips = processed_clips
-        else:
-            # Legacy: just paths (strings)
-            video_clips = []
-            for clip in clips:
-                if not clip:
-                    continue
-                try:
-                    resolved_path = resolve_clip_path(clip, project_id)
-                    if resolved_path.lower().endswith((".mp4", ".mov", ".webm", ".avi")):
-                        video_clips.append(resolved_path)
-                except Exception as e:
-                    print(f"Warning: Skipping clip {clip}: {e}")
-                    continue
-    else:
-        # Fallback to project clips directory
-        all_clips = paths["clips"]
-        video_clips = [
-            clip for clip in all_clips
-            if clip.lower().endswith((".mp4", ".mov", ".webm", ".avi"))
-        ]
+    # Proxies share one format, so untrimmed ones are stream-copied straight into the preview
+    with stage("proxies"):
+        proxies = ensure_proxies(project_id, [clip["path"] for clip in video_clips if "still" not in clip])
+    preview_clips = [clip if "still" in clip else {**clip, "path": proxies[clip["path"]]} for clip in video_clips]
+    # Stills render straight to the proxy format
+    with stage("stills"):
+        preview_clips = render_stills(project_id, preview_clips, PREVIEW_PROFILE, PREVIEW_TARGET)
+    with stage("plan"):
+        plan = plan_render(
+            project_id,
+            preview_clips,
+            target=PREVIEW_TARGET,
+            profile=PREVIEW_PROFILE,
+            audio_mix=build_audio_mix(project_id, paths["audio"], audio),
+            alignment=alignment,
+        )
+    
+    output_path = RENDER_DIR / "previews" / f"{project_id}.mp4"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    token = uuid.uuid4().hex[:12]
+    temp_video = RENDER_DIR / "previews" / f"{project_id}_{token}_temp_concat.mp4"
+    temp_output = RENDER_DIR / "previews" / f".{project_id}_{token}.mp4"
+    work_dir = RENDER_DIR / "previews" / f"{project_id}_{token}_segments"
+    try:
+        if not execute_plan(plan, str(temp_video), work_dir):
+            raise RuntimeError("Failed to assemble preview")
+        mux_soundtrack(temp_video, str(temp_output), plan)
+        if temp_output.exists():
+            os.replace(temp_output, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        temp_video.unlink(missing_ok=True)
+        temp_output.unlink(missing_ok=True)
     
+    output_info = probe_media(str(output_path)) or {}
+    
+    return {
+        "videoUrl": media_url(output_path) if output_path.exists() else None,
+        "preview": True,
+        "size": output_path.stat().st_size if output_path.exists() else 0,
+        "duration": output_info.get("duration"),
+        "clips_used": len(plan.clips),
+        "plan": plan.to_dict(),
+    }
+
+
+def record_export(project_id: str, result: dict, profile: RenderProfile, output_info: dict) -> None:
+    """Store an exports row for a finished render (best effort; rendering doesn't depend on the database)."""
+    resolution = describe_output(
+        output_info.get("width") or 0,
+        output_info.get("height") or 0,
+        output_info.get("fps") or 0,
+        profile,
+    )
+    try:
+        with stage("export_record", "supabase"):
+            save_export_record(
+                project_id,
+                result["videoUrl"],
+                thumbnail_url=result.get("thumbnail"),
+                resolution=resolution,
+                duration=result.get("duration"),
+            )
+    except Exception as e:
+        print(f"Warning: Could not save export record for {project_id}: {e}")
+
+
+def assemble_video(
+    project_id: str,
+    clips: list[dict] | list[str] | None = None,
+    profile: str | None = None,
+    streaming: list[str] | None = None,
+    upload_streaming: bool = False,
+    captions: dict | None = None,
+    audio: dict | None = None,
+    align: dict | None = None,
+    outputs: list[str] | None = None,
+) -> dict:
+    """
+    Assemble final video from clips and audio with optional trimming, encoded with a render profile.
+
+    `streaming` optionally packages the render as an HLS/DASH ladder
+    ("hls", "dash"), uploaded via Supabase Storage if `upload_streaming`.
+    `captions` ({"script", "formats", "style", "burnIn"}) writes SRT/VTT
+    sidecars timed to the narration and optionally burns them into the
+    video within the render's single encode. `audio` configures the
+    soundtrack mix (see build_audio_mix): narration, clip audio and an
+    optional music bed, ducked and loudness-normalized. `align` (see
+    build_alignment) retimes the clips - trims, speed changes, freeze
+    frames, optionally per scene - so the video covers the narration exactly.
+    `outputs` names extra render profiles (e.g. "shorts_vertical", "draft")
+    written by the same FFmpeg pass, sharing the decode of every clip; each
+    gets its own exports row and is listed under "outputs".
+    The result includes per-stage timings (resolve_clips, plan, timeline,
+    mux, thumbnail, package, ...) for this render.
+    """
+    with record_spans() as spans:
+        result = _assemble_video(
+            project_id, clips, profile, streaming or [], upload_streaming, captions, audio, align, outputs or []
+        )
+    result["timings"] = spans
+    return result
+
+
+@timed("assemble")
+def _assemble_video(
+    project_id: str,
+    clips: list[dict] | list[str] | None,
+    profile: str | None,
+    streaming: list[str],
+    upload_streaming: bool,
+    captions: dict | None,
+    audio: dict | None,
+    align: dict | None,
+    outputs: list[str],
+) -> dict:
+    render_profile = get_profile(profile)
+    variants = [get_profile(name) for name in dict.fromkeys(outputs) if name != render_profile.name]
+    paths = get_project_paths(project_id)
+    audio_mix = build_audio_mix(project_id, paths["audio"], audio)
+    alignment = build_alignment(project_id, paths["audio"], align)
+    with stage("resolve_clips"):
+        video_clips = resolve_timeline_clips(project_id, clips, paths["clips"])
     if not video_clips:
         raise ValueError("No valid video clips found to assemble")
     
+    caption_track = None
+    if captions:
+        with stage("captions"):
+            caption_track = prepare_captions(
+                project_id, captions.get("script"), captions.get("formats"), captions.get("style") or "shorts"
+            )
+    burn_in = caption_track if captions and captions.get("burnIn") else None
+    if burn_in and not has_filter("ass"):
+        print("⚠️ Warning: FFmpeg has no ass filter (built without libass), captions not burned in")
+        burn_in = None
+    
+    # Unchanged inputs: reuse the existing output; identical in-flight request: wait for it
+    key = render_key(
+        project_id,
+        video_clips,
+        paths["audio"],
+        render_profile,
+        burn_in["digest"] if burn_in else None,
+        audio_mix.cache_key(),
+        alignment.to_dict() if alignment else None,
+        variants,
+    )
+    cached = load_cached_render(project_id, key)
+    if cached:
+        result = {**cached, "cached": True}
+        fresh = False
+    else:
+        result, shared = render_flight.do(
+            key,
+            lambda: _render_video(
+                project_id,
+                video_clips,
+                audio_mix,
+                render_profile,
+                key,
+                streaming,
+                upload_streaming,
+                burn_in,
+                alignment,
+                variants,
+            ),
+        )
+        result = {**result, "deduplicated": shared}
+        fresh = not shared
+    
+    # Cached or shared renders may not have been packaged in the formats asked for, or the
+    # package may have been garbage collected since; an existing package is reused as-is
+    if streaming and not fresh:
+        packaged = result.get("streaming") or {}
+        repackaged = package_render(
+            project_id,
+            str(RENDER_DIR / f"{project_id}.mp4"),
+            streaming,
+            render_profile,
+            upload_streaming and "remote" not in packaged,
+        )
+        if repackaged and "remote" in packaged:
+            repackaged["remote"] = packaged["remote"]
+        result["streaming"] = repackaged
+    if caption_track:
+        result["captions"] = {
+            "source": caption_track["source"],
+            "style": caption_track["style"],
+            "burned": burn_in is not None,
+            "cues": len(caption_track["cues"]),
+            **caption_track["urls"],
+        }
+    return result
+
+
+def _render_video(
+    project_id: str,
+    video_clips: list[dict],
+    audio_mix: AudioMix,
+    profile: RenderProfile,
+    key: str,
+    streaming: list[str],
+    upload_streaming: bool,
+    burn_in: dict | None = None,
+    alignment: AlignmentSpec | None = None,
+    variants: list[RenderProfile] | None = None,
+) -> dict:
     # Output to renders directory
     output_path = RENDER_DIR / f"{project_id}.mp4"
     thumbnail_path = RENDER_DIR / "thumbnails" / f"{project_id}.png"
@@ -169,56 +663,127 @@ def assemble_video(project_id: str, clips: list[dict] | list[str] | None = None)
     # Ensure thumbnail directory exists
     thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
     
-    # Step 1: Concatenate all video clips (with trimming if needed)
-    temp_video = RENDER_DIR / f"{project_id}_temp_concat.mp4"
+    # Intermediates are unique per render so concurrent renders never share files;
+    # finished files are moved into place atomically
+    token = uuid.uuid4().hex[:12]
+    temp_video = RENDER_DIR / f"{project_id}_{token}_temp_concat.mp4"
+    temp_output = RENDER_DIR / f".{project_id}_{token}.mp4"
+    temp_thumbnail = thumbnail_path.with_name(f".{project_id}_{token}.png")
+    work_dir = RENDER_DIR / f"{project_id}_{token}_segments"
     
-    # Check if we need trimming
-    needs_trimming = isinstance(video_clips[0], dict) and any(
-        clip.get("start", 0) > 0 or (clip.get("end") is not None)
-        for clip in video_clips
-    )
+    # Multi-output variants live next to each other under exports/<project>/
+    variants = variants or []
+    variant_dir = RENDER_DIR / "exports" / project_id
+    variant_paths = [variant_dir / f"{variant.name}.mp4" for variant in variants]
+    variant_temps = [
+        (variant_dir / f"{variant.name}_{token}_temp_concat.mp4", variant_dir / f".{variant.name}_{token}.mp4")
+        for variant in variants
+    ]
     
-    if needs_trimming:
-        # Use FFmpeg filter_complex for trimming and concatenation
-        try:
-            cmd = build_ffmpeg_trim_commands(video_clips, str(temp_video))
-            subprocess.run(cmd, check=True, capture_output=True)
-        except subprocess.CalledProcessError as e:
-            print(f"FFmpeg trim error: {e.stderr.decode() if e.stderr else 'Unknown error'}")
-            raise RuntimeError("Failed to trim and concatenate video clips")
-    else:
-        # Use simple concatenation (legacy path)
-        clip_paths = [clip if isinstance(clip, str) else clip["path"] for clip in video_clips]
-        if not concat_videos(clip_paths, str(temp_video)):
-            raise RuntimeError("Failed to concatenate video clips")
-    
-    # Step 2: Add audio track if it exists
-    final_video_path = str(output_path)
-    if os.path.exists(audio_path):
-        if not add_audio_to_video(str(temp_video), audio_path, final_video_path):
-            # If adding audio fails, just use the concatenated video
-            if temp_video.exists():
-                os.rename(str(temp_video), final_video_path)
-        else:
-            # Clean up temp file
-            if temp_video.exists():
-                temp_video.unlink()
-    else:
-        # No audio, just rename the concatenated video
-        if temp_video.exists():
-            os.rename(str(temp_video), final_video_path)
+    # Stills become cached motion clips in the render's target format
+    with stage("stills"):
+        video_clips = render_stills(project_id, video_clips, profile)
+    if not video_clips:
+        raise ValueError("No valid video clips found to assemble")
     
-    # Step 3: Extract thumbnail (only if video was created successfully)
-    if os.path.exists(final_video_path):
-        extract_thumbnail(final_video_path, str(thumbnail_path))
+    # Probe every clip once and decide per clip whether it can be stream-copied
+    with stage("plan"):
+        plans = [
+            plan_render(
+                project_id,
+                video_clips,
+                profile=output_profile,
+                subtitles=str(work_dir / f"captions_{output_profile.name}.ass") if burn_in else None,
+                audio_mix=audio_mix,
+                alignment=alignment,
+                outputs=1 + len(variants),
+            )
+            for output_profile in [profile, *variants]
+        ]
+    plan = plans[0]
+    try:
+        for output_plan in plans:
+            if output_plan.subtitles:
+                # Laid out for each output's size, then drawn by the same graph that encodes the timeline
+                work_dir.mkdir(parents=True, exist_ok=True)
+                write_burn_in_script(
+                    burn_in, output_plan.target.width, output_plan.target.height, Path(output_plan.subtitles)
+                )
+        
+        # Step 1: Concatenate all video clips, conforming only those that need it
+        if variants:
+            variant_dir.mkdir(parents=True, exist_ok=True)
+            timelines = [str(temp_video), *(str(temp) for temp, _ in variant_temps)]
+            if not execute_multi_output(plans, timelines):
+                raise RuntimeError("Failed to assemble video clips")
+        elif not execute_plan(plan, str(temp_video), work_dir):
+            raise RuntimeError("Failed to assemble video clips")
+        
+        # Step 2: Mix narration, clip audio and music onto the timeline (unless the timeline encode did)
+        mux_soundtrack(temp_video, str(temp_output), plan)
+        if not temp_output.exists():
+            raise RuntimeError("Failed to assemble video clips")
+        for variant_plan, (variant_temp, variant_output), final_path in zip(plans[1:], variant_temps, variant_paths):
+            mux_soundtrack(variant_temp, str(variant_output), variant_plan)
+            if not variant_output.exists():
+                raise RuntimeError(f"Failed to assemble {variant_plan.profile.name} output")
+            os.replace(variant_output, final_path)
+        os.replace(temp_output, output_path)
+        
+        # Step 3: Extract thumbnail, packaging the streaming ladder alongside if requested
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            # copy_context keeps both jobs' timing spans attached to this render
+            thumbnail_job = pool.submit(copy_context().run, extract_thumbnail, str(output_path), str(temp_thumbnail))
+            package_job = (
+                pool.submit(
+                    copy_context().run, package_render, project_id, str(output_path), streaming, plan.profile, upload_streaming
+                )
+                if streaming else None
+            )
+            if thumbnail_job.result():
+                os.replace(temp_thumbnail, thumbnail_path)
+            packaged = package_job.result() if package_job else None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        for leftover in (temp_video, temp_output, temp_thumbnail, *(p for pair in variant_temps for p in pair)):
+            leftover.unlink(missing_ok=True)
     
-    # Get file size
-    file_size = output_path.stat().st_size if output_path.exists() else 0
+    # Get file size and duration
+    file_size = output_path.stat().st_size
+    output_info = probe_media(str(output_path)) or {}
     
-    return {
-        "videoUrl": f"/renders/{project_id}.mp4",
-        "thumbnail": f"/renders/thumbnails/{project_id}.png" if thumbnail_path.exists() else None,
+    result = {
+        "videoUrl": media_url(output_path),
+        "thumbnail": media_url(thumbnail_path) if thumbnail_path.exists() else None,
         "size": file_size,
-        "clips_used": len(video_clips),
+        "duration": output_info.get("duration"),
+        "profile": plan.profile.name,
+        "clips_used": len(plan.clips),
+        "plan": plan.to_dict(),
     }
+    if packaged:
+        result["streaming"] = packaged
+    record_export(project_id, result, plan.profile, output_info)
+    if variants:
+        result["outputs"] = [
+            _variant_result(project_id, variant_plan, final_path, result["thumbnail"])
+            for variant_plan, final_path in zip(plans[1:], variant_paths)
+        ]
+    store_cached_render(project_id, key, str(output_path), result, [str(p) for p in variant_paths])
+    return result
+
 
+def _variant_result(project_id: str, plan: RenderPlan, output_path: Path, thumbnail: str | None) -> dict:
+    """Describe (and record an exports row for) one extra output of a multi-output render."""
+    output_info = probe_media(str(output_path)) or {}
+    result = {
+        "profile": plan.profile.name,
+        "videoUrl": media_url(output_path),
+        "thumbnail": thumbnail,
+        "size": output_path.stat().st_size,
+        "duration": output_info.get("duration"),
+        "width": output_info.get("width"),
+        "height": output_info.get("height"),
+    }
+    record_export(project_id, result, plan.profile, output_info)
+    return result
@@ -0,0 +1,243 @@
+"""
+Audio mixing for renders.
+
+Builds the filter chains that turn a timeline's own audio (the clip
+"bed"), the narration and an optional music bed into the final
+soundtrack:
+- every source is normalized towards the target loudness with a fixed
+  gain from a two-pass style EBU R128 measurement (loudnorm's analysis
+  pass), measured once per asset and cached until the file changes
+- clip audio sits under the narration and the music bed under both
+- the beds are side-chain compressed (ducked) while the narration speaks
+- a true-peak limiter caps the mix
+
+The chains are spliced into whichever FFmpeg command already encodes
+the render's audio (the single-pass timeline graph, or the final mux
+that stream-copies the video), so mixing never adds an audio encode.
+"""
+import json
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from config import AUDIO_TARGET_LUFS, AUDIO_TRUE_PEAK, PROBE_MAX_WORKERS, RENDER_DIR
+from services.ffmpeg_capabilities import has_filter
+from utils.metrics import cache_lookup, ffmpeg_process
+
+if TYPE_CHECKING:
+    from services.render_planner import RenderPlan
+
+LOUDNESS_INDEX = RENDER_DIR / ".loudness_index.json"
+SILENT_LUFS = -60.0  # Quieter than this is treated as silence and left alone
+MAX_GAIN_DB = 20.0
+
+# (path, size, mtime_ns) -> measurement
+_cache: Dict[Tuple[str, int, int], Optional[Dict[str, float]]] = {}
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class AudioMix:
+    """How a render's soundtrack is mixed."""
+    voice_path: Optional[str] = None  # Narration (skipped if missing)
+    music_path: Optional[str] = None  # Looped under the whole timeline
+    clip_audio: bool = True  # Keep the clips' own audio
+    clip_gain_db: float = -8.0  # Clip audio level relative to the target while there's narration
+    music_gain_db: float = -14.0  # Music bed level relative to the target
+    ducking: bool = True  # Compress the beds while the narration speaks
+    target_lufs: float = AUDIO_TARGET_LUFS
+    true_peak: float = AUDIO_TRUE_PEAK
+
+    @property
+    def has_voice(self) -> bool:
+        return bool(self.voice_path and os.path.exists(self.voice_path))
+
+    @property
+    def has_music(self) -> bool:
+        return bool(self.music_path and os.path.exists(self.music_path))
+
+    def cache_key(self) -> Dict[str, Any]:
+        """Everything about the mix that changes the output (voice is keyed by the render already)."""
+        key = asdict(self)
+        key["music"] = _file_key(self.music_path) if self.has_music else None
+        return key
+
+
+def _file_key(path: str) -> Optional[Tuple[str, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def _read_index() -> Dict[str, Any]:
+    try:
+        with open(LOUDNESS_INDEX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_in_index(key: Tuple[str, int, int], measurement: Optional[Dict[str, float]]) -> None:
+    with _lock:
+        index = _read_index()
+        index[key[0]] = {"size": key[1], "mtime_ns": key[2], "loudness": measurement}
+        tmp_path = LOUDNESS_INDEX.with_name(f".{LOUDNESS_INDEX.name}.{os.getpid()}.tmp")
+        try:
+            LOUDNESS_INDEX.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, LOUDNESS_INDEX)
+        except OSError as e:
+            print(f"Warning: Could not write loudness index {LOUDNESS_INDEX}: {e}")
+
+
+def _run_measurement(path: str) -> Optional[Dict[str, float]]:
+    """loudnorm analysis pass: integrated loudness, true peak, range and gate threshold."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-i", path, "-vn",
+        "-af", f"loudnorm=I={AUDIO_TARGET_LUFS}:TP={AUDIO_TRUE_PEAK}:print_format=json",
+        "-f", "null", "-",
+    ]
+    with ffmpeg_process():
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    match = re.search(r"\{[^{}]*\"input_i\"[^{}]*\}", proc.stderr)
+    if proc.returncode != 0 or not match:
+        return None
+    raw = json.loads(match.group(0))
+    return {
+        "integrated": float(raw["input_i"]),
+        "true_peak": float(raw["input_tp"]),
+        "lra": float(raw["input_lra"]),
+        "threshold": float(raw["input_thresh"]),
+    }
+
+
+def measure_loudness(path: str) -> Optional[Dict[str, float]]:
+    """
+    EBU R128 loudness of a file's audio, cached until the file changes.
+
+    Returns:
+        {"integrated", "true_peak", "lra", "threshold"} or None if it has no measurable audio
+    """
+    key = _file_key(path)
+    if key is None or not has_filter("loudnorm"):
+        return None
+    if key in _cache:
+        cache_lookup("loudness_memory", True)
+        return _cache[key]
+    entry = _read_index().get(key[0])
+    hit = bool(entry and entry.get("size") == key[1] and entry.get("mtime_ns") == key[2])
+    cache_lookup("loudness_index", hit)
+    if hit:
+        measurement = entry["loudness"]
+    else:
+        measurement = _run_measurement(path)
+        _store_in_index(key, measurement)
+    _cache[key] = measurement
+    return measurement
+
+
+def measure_many(paths: List[str]) -> Dict[str, Optional[Dict[str, float]]]:
+    """Measure several files concurrently (cached files return immediately)."""
+    unique = list(dict.fromkeys(paths))
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(PROBE_MAX_WORKERS, len(unique))) as pool:
+        return dict(zip(unique, pool.map(measure_loudness, unique)))
+
+
+def normalize_gain_db(measurement: Optional[Dict[str, float]], target_lufs: float) -> float:
+    """Fixed gain bringing a measured source to the target loudness (0 for silence)."""
+    if not measurement or measurement["integrated"] < SILENT_LUFS:
+        return 0.0
+    return max(-MAX_GAIN_DB, min(MAX_GAIN_DB, target_lufs - measurement["integrated"]))
+
+
+def _clip_gain_expression(plan: "RenderPlan", mix: AudioMix) -> str:
+    """Per-clip normalization of the timeline audio as a volume expression over timeline time."""
+    level = mix.target_lufs + (mix.clip_gain_db if mix.has_voice else 0.0)
+    loudness = measure_many([clip.path for clip in plan.clips if clip.has_audio])
+    gains = [
+        10 ** (normalize_gain_db(loudness.get(clip.path), level) / 20) if clip.has_audio else 1.0
+        for clip in plan.clips
+    ]
+    if len(set(round(g, 4) for g in gains)) == 1 or any(c.duration is None for c in plan.clips):
+        return f"{sum(gains) / len(gains):.4f}"
+
+    # Switch gains halfway through each transition
+    boundaries, position = [], 0.0
+    for clip in plan.clips[:-1]:
+        position += clip.duration
+        transition = plan.transition_after(clip.index)
+        if transition:
+            position -= transition.duration
+        boundaries.append(position + (transition.duration / 2 if transition else 0.0))
+    expression = f"{gains[-1]:.4f}"
+    for boundary, gain in reversed(list(zip(boundaries, gains))):
+        expression = f"if(lt(t,{boundary:.3f}),{gain:.4f},{expression})"
+    return expression
+
+
+def mix_graph(
+    plan: "RenderPlan",
+    mix: AudioMix,
+    bed_label: str,
+    next_input: int,
+    sample_rate: int = 48000,
+) -> Tuple[List[str], List[str], str]:
+    """
+    Filter chains mixing a timeline's audio with narration and music.
+
+    Args:
+        plan: The render plan (for per-clip normalization of the bed)
+        mix: Mix settings
+        bed_label: Filter label (or input stream specifier) of the timeline audio
+        next_input: Index the narration/music inputs will get in the command
+        sample_rate: Output sample rate
+
+    Returns:
+        (extra input args, filter chains, label of the mixed audio)
+    """
+    fmt = f"aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts=stereo"
+    inputs: List[str] = []
+    filters: List[str] = []
+
+    if mix.clip_audio:
+        filters.append(f"[{bed_label}]{fmt},volume='{_clip_gain_expression(plan, mix)}':eval=frame[mixbed]")
+    else:
+        filters.append(f"[{bed_label}]{fmt},volume=0[mixbed]")  # Keeps the timeline's length
+    bed = "mixbed"
+
+    if mix.has_music:
+        gain = normalize_gain_db(measure_loudness(mix.music_path), mix.target_lufs + mix.music_gain_db)
+        inputs += ["-stream_loop", "-1", "-i", mix.music_path]
+        filters.append(f"[{next_input}:a]{fmt},volume={gain:.2f}dB[mixmusic]")
+        filters.append(f"[{bed}][mixmusic]amix=inputs=2:duration=first:normalize=0[mixbeds]")
+        bed = "mixbeds"
+        next_input += 1
+
+    limiter = f"alimiter=limit={10 ** (mix.true_peak / 20):.4f}:level=0:latency=1"
+    if not mix.has_voice:
+        filters.append(f"[{bed}]{limiter}[mixout]")
+        return inputs, filters, "mixout"
+
+    gain = normalize_gain_db(measure_loudness(mix.voice_path), mix.target_lufs)
+    inputs += ["-i", mix.voice_path]
+    if mix.ducking:
+        filters.append(f"[{next_input}:a]{fmt},volume={gain:.2f}dB,asplit=2[mixvoice][mixkey]")
+        # The key is padded so the beds keep playing (unducked) after the narration ends
+        filters.append("[mixkey]apad[mixkeypad]")
+        filters.append(
+            f"[{bed}][mixkeypad]sidechaincompress=threshold=0.02:ratio=6:attack=20:release=400[mixducked]"
+        )
+        bed = "mixducked"
+    else:
+        filters.append(f"[{next_input}:a]{fmt},volume={gain:.2f}dB[mixvoice]")
+    filters.append(f"[{bed}][mixvoice]amix=inputs=2:duration=first:normalize=0,{limiter}[mixout]")
+    return inputs, filters, "mixout"
@@ -0,0 +1,389 @@
+"""
+Caption service.
+
+Derives word timings for a project's narration and turns them into
+captions:
+- from TTS timestamps when the provider returns them (ElevenLabs
+  character alignment, saved next to the narration when it's generated)
+- otherwise by aligning the script locally against audio.wav: speech
+  regions are found with FFmpeg's silencedetect and the script's words
+  are laid out over them in proportion to their length
+
+Timings are cached per narration file. Cues are written as SRT/WebVTT
+sidecars under RENDER_DIR/captions/<project>/ and, for burn-in, as an
+ASS script that the single-pass render graph draws with libass in the
+same encode as the rest of the timeline.
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import PROJECTS_DIR, RENDER_DIR
+from services.media_service import media_url
+from services.probe_service import probe_media
+from utils.metrics import ffmpeg_process, timed
+
+CAPTIONS_DIR = RENDER_DIR / "captions"
+CAPTION_FORMATS = ("srt", "vtt")
+ALIGNMENT_NAME = "alignment.json"
+
+SILENCE_THRESHOLD_DB = -35
+SILENCE_MIN_SECONDS = 0.25
+SENTENCE_END = (".", "!", "?", "…")
+
+# Cue layout and look for burned-in captions. Sizes are fractions of the video height.
+CAPTION_STYLES: Dict[str, Dict[str, Any]] = {
+    # Short-form vertical video: a few big words at a time, active word highlighted
+    "shorts": {
+        "max_chars": 18,
+        "max_words": 3,
+        "max_duration": 2.0,
+        "font": "DejaVu Sans",
+        "font_size": 0.055,
+        "bold": True,
+        "uppercase": True,
+        "primary": "&H0000E5FF",  # Highlighted (spoken) word: yellow
+        "secondary": "&H00FFFFFF",  # Upcoming words: white
+        "outline": 0.006,
+        "margin_v": 0.22,
+        "karaoke": True,
+    },
+    # Classic bottom-of-frame subtitles
+    "subtitle": {
+        "max_chars": 42,
+        "max_words": 12,
+        "max_duration": 4.0,
+        "font": "DejaVu Sans",
+        "font_size": 0.045,
+        "bold": False,
+        "uppercase": False,
+        "primary": "&H00FFFFFF",
+        "secondary": "&H00FFFFFF",
+        "outline": 0.003,
+        "margin_v": 0.06,
+        "karaoke": False,
+    },
+}
+DEFAULT_CAPTION_STYLE = "shorts"
+
+
+def _captions_project_dir(project_id: str) -> Path:
+    return PROJECTS_DIR / project_id / "captions"
+
+
+def _audio_fingerprint(audio_path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(audio_path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _write_if_changed(path: Path, content: str) -> None:
+    """Write a text file atomically, leaving it untouched (same mtime and URL) if unchanged."""
+    try:
+        if path.read_text() == content:
+            return
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
+
+
+def _save_alignment(project_id: str, audio_path: str, script: str, source: str, words: List[Dict[str, Any]]) -> None:
+    record = {
+        "audio": _audio_fingerprint(audio_path),
+        "script": script,
+        "source": source,
+        "words": words,
+    }
+    _write_if_changed(_captions_project_dir(project_id) / ALIGNMENT_NAME, json.dumps(record))
+
+
+def _load_alignment(project_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_captions_project_dir(project_id) / ALIGNMENT_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def words_from_characters(alignment: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Group provider character timings ({characters, character_start/end_times_seconds}) into words."""
+    chars = alignment.get("characters") or []
+    starts = alignment.get("character_start_times_seconds") or []
+    ends = alignment.get("character_end_times_seconds") or []
+    words: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    for char, start, end in zip(chars, starts, ends):
+        if char.isspace():
+            current = None
+            continue
+        if current is None:
+            current = {"text": "", "start": round(float(start), 3), "end": round(float(end), 3)}
+            words.append(current)
+        current["text"] += char
+        current["end"] = round(float(end), 3)
+    return words
+
+
+def save_tts_alignment(project_id: str, audio_path: str, script: str, alignment: Dict[str, Any]) -> None:
+    """Store word timings returned by a TTS provider alongside the narration it generated."""
+    words = words_from_characters(alignment)
+    if words:
+        _save_alignment(project_id, audio_path, script, "tts", words)
+
+
+def remember_script(project_id: str, audio_path: str, script: str) -> None:
+    """Record the script of narration generated without timestamps, for local alignment later."""
+    _save_alignment(project_id, audio_path, script, "script", [])
+
+
+def _speech_regions(audio_path: str, duration: float) -> List[List[float]]:
+    """Non-silent [start, end] regions of an audio file, via silencedetect."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-i", audio_path,
+        "-af", f"silencedetect=n={SILENCE_THRESHOLD_DB}dB:d={SILENCE_MIN_SECONDS}",
+        "-f", "null", "-",
+    ]
+    with ffmpeg_process():
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    regions, cursor = [], 0.0
+    for line in proc.stderr.splitlines():
+        start = re.search(r"silence_start: (-?[\d.]+)", line)
+        end = re.search(r"silence_end: (-?[\d.]+)", line)
+        if start:
+            silence_start = max(float(start.group(1)), 0.0)
+            if silence_start > cursor:
+                regions.append([cursor, silence_start])
+        elif end:
+            cursor = float(end.group(1))
+    if cursor < duration:
+        regions.append([cursor, duration])
+    return [r for r in regions if r[1] - r[0] > 0.05] or [[0.0, duration]]
+
+
+@timed("caption_align")
+def align_script(audio_path: str, script: str) -> List[Dict[str, Any]]:
+    """
+    Estimate word timings for a script read in an audio file.
+
+    Words are spread over the detected speech regions (never over pauses)
+    in proportion to their length, with sentence ends weighted as a short
+    pause so sentences tend to break where the speaker does.
+    """
+    info = probe_media(audio_path)
+    duration = (info or {}).get("duration")
+    tokens = script.split()
+    if not duration or not tokens:
+        return []
+    regions = _speech_regions(audio_path, duration)
+    speech_total = sum(end - start for start, end in regions)
+
+    weights = [len(t) + (3 if t.endswith(SENTENCE_END) else 1) for t in tokens]
+    scale = speech_total / sum(weights)
+
+    def to_time(speech_offset: float) -> float:
+        # Map an offset in concatenated speech onto the real timeline
+        for start, end in regions:
+            if speech_offset <= end - start:
+                return start + speech_offset
+            speech_offset -= end - start
+        return regions[-1][1]
+
+    words, offset = [], 0.0
+    for token, weight in zip(tokens, weights):
+        start = to_time(offset + 1e-6)
+        offset += weight * scale
+        words.append({"text": token, "start": round(start, 3), "end": round(to_time(offset), 3)})
+    return words
+
+
+def word_timings(project_id: str, script: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Word timings for the project's narration, reusing stored timings while audio.wav is unchanged.
+
+    Args:
+        project_id: Project ID
+        script: Narration script (defaults to the one the narration was generated from)
+
+    Returns:
+        {"source": "tts" | "local", "words": [{"text", "start", "end"}]}
+    """
+    audio_path = str(PROJECTS_DIR / project_id / "audio.wav")
+    fingerprint = _audio_fingerprint(audio_path)
+    if fingerprint is None:
+        raise ValueError(f"No narration found for project {project_id}")
+
+    stored = _load_alignment(project_id)
+    current = stored if stored and stored.get("audio") == fingerprint else None
+    if current and current["words"] and (script is None or script.split() == current["script"].split()):
+        return {"source": current["source"], "words": current["words"]}
+
+    script = script or (current or {}).get("script")
+    if not script:
+        raise ValueError("A script is required to caption narration generated without timestamps")
+    words = align_script(audio_path, script)
+    _save_alignment(project_id, audio_path, script, "local", words)
+    return {"source": "local", "words": words}
+
+
+def build_cues(words: List[Dict[str, Any]], style: str = DEFAULT_CAPTION_STYLE) -> List[Dict[str, Any]]:
+    """Group words into caption cues, breaking at sentence ends and the style's length limits."""
+    limits = CAPTION_STYLES[style]
+    cues: List[Dict[str, Any]] = []
+    current: List[Dict[str, Any]] = []
+
+    def flush():
+        if current:
+            cues.append({
+                "start": current[0]["start"],
+                "end": current[-1]["end"],
+                "text": " ".join(w["text"] for w in current),
+                "words": list(current),
+            })
+            current.clear()
+
+    for word in words:
+        if current:
+            text_length = len(" ".join(w["text"] for w in current)) + 1 + len(word["text"])
+            if (
+                text_length > limits["max_chars"]
+                or len(current) >= limits["max_words"]
+                or word["end"] - current[0]["start"] > limits["max_duration"]
+            ):
+                flush()
+        current.append(word)
+        if word["text"].endswith(SENTENCE_END):
+            flush()
+    flush()
+
+    # Hold each cue until the next one starts (up to a short gap) so captions don't flicker
+    for cue, following in zip(cues, cues[1:]):
+        if 0 < following["start"] - cue["end"] < 0.5:
+            cue["end"] = following["start"]
+    return cues
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def to_srt(cues: List[Dict[str, Any]]) -> str:
+    blocks = [
+        f"{i}\n{_timestamp(c['start'], ',')} --> {_timestamp(c['end'], ',')}\n{c['text']}\n"
+        for i, c in enumerate(cues, 1)
+    ]
+    return "\n".join(blocks)
+
+
+def to_vtt(cues: List[Dict[str, Any]]) -> str:
+    blocks = [f"{_timestamp(c['start'], '.')} --> {_timestamp(c['end'], '.')}\n{c['text']}\n" for c in cues]
+    return "WEBVTT\n\n" + "\n".join(blocks)
+
+
+def _ass_time(seconds: float) -> str:
+    centis = int(round(seconds * 100))
+    hours, centis = divmod(centis, 360_000)
+    minutes, centis = divmod(centis, 6000)
+    secs, centis = divmod(centis, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+
+def _ass_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("{", "(").replace("}", ")")
+
+
+def to_ass(cues: List[Dict[str, Any]], style: str, width: int, height: int) -> str:
+    """An ASS script laid out for a width x height video."""
+    s = CAPTION_STYLES[style]
+    font_size = max(int(height * s["font_size"]), 8)
+    outline = max(round(height * s["outline"], 1), 1)
+    margin_v = int(height * s["margin_v"])
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+        "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+        "MarginL, MarginR, MarginV, Encoding",
+        f"Style: Default,{s['font']},{font_size},{s['primary']},{s['secondary']},&H00000000,&H80000000,"
+        f"{-1 if s['bold'] else 0},0,0,0,100,100,0,0,1,{outline},0,2,{width // 20},{width // 20},{margin_v},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for cue in cues:
+        if s["karaoke"]:
+            # \k durations (centiseconds) highlight each word as it's spoken
+            parts, cursor = [], cue["start"]
+            for word in cue["words"]:
+                lead = max(int(round((word["end"] - cursor) * 100)), 1)
+                cursor = word["end"]
+                parts.append(f"{{\\k{lead}}}{_ass_escape(word['text'])}")
+            text = " ".join(parts)
+        else:
+            text = _ass_escape(cue["text"])
+        if s["uppercase"]:
+            text = re.sub(r"(^|})([^{]*)", lambda m: m.group(1) + m.group(2).upper(), text)
+        lines.append(f"Dialogue: 0,{_ass_time(cue['start'])},{_ass_time(cue['end'])},Default,,0,0,0,,{text}")
+    return "\n".join(lines) + "\n"
+
+
+def prepare_captions(
+    project_id: str,
+    script: Optional[str] = None,
+    formats: Optional[List[str]] = None,
+    style: str = DEFAULT_CAPTION_STYLE,
+) -> Dict[str, Any]:
+    """
+    Time the narration and write caption sidecars.
+
+    Args:
+        project_id: Project ID
+        script: Narration script (defaults to the one stored with the narration)
+        formats: Sidecar formats to write ("srt", "vtt")
+        style: Caption style (cue layout; also the look when burned in)
+
+    Returns:
+        dict with the timing source, cues, sidecar URLs and a digest of
+        the cues/style for render caching
+    """
+    if style not in CAPTION_STYLES:
+        raise ValueError(f"Unknown caption style '{style}'. Available: {', '.join(CAPTION_STYLES)}")
+    formats = [f for f in (formats if formats is not None else CAPTION_FORMATS) if f in CAPTION_FORMATS]
+
+    timings = word_timings(project_id, script)
+    cues = build_cues(timings["words"], style)
+
+    out_dir = CAPTIONS_DIR / project_id
+    urls = {}
+    for fmt in formats:
+        path = out_dir / f"captions.{fmt}"
+        _write_if_changed(path, to_srt(cues) if fmt == "srt" else to_vtt(cues))
+        urls[fmt] = media_url(path)
+
+    digest = hashlib.sha256(json.dumps({"cues": cues, "style": style}, sort_keys=True).encode()).hexdigest()[:16]
+    return {"source": timings["source"], "style": style, "cues": cues, "urls": urls, "digest": digest}
+
+
+def write_burn_in_script(captions: Dict[str, Any], width: int, height: int, path: Path) -> Path:
+    """Write the ASS script the render graph burns in."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(to_ass(captions["cues"], captions["style"], width, height))
+    return path
@@ -0,0 +1,256 @@
+"""
+FFmpeg capability detection.
+
+What the installed FFmpeg can do (its version, encoders, filters and
+hardware acceleration methods, which hardware H.264 encoders actually open
+on this box, and the CPU count encoders get to use) is probed once and
+cached on disk in FFMPEG_CAPABILITIES_PATH. The cache is keyed by the
+ffmpeg and ffprobe binaries (path, size, mtime), so upgrading FFmpeg
+triggers a fresh probe and restarts skip it. The startup warm-up loads it
+before the first request; everything else calls get_capabilities() and
+gets the in-memory copy.
+
+When FFmpeg can't be probed at all, has_filter()/has_encoder() answer
+True: callers then behave as they did before detection existed and the
+failing command reports the real error.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from config import FFMPEG_CAPABILITIES_PATH
+
+CAPABILITIES_VERSION = 1
+
+# Hardware H.264 encoders we know how to drive, in auto-detection preference order
+HARDWARE_ENCODERS = ("h264_nvenc", "h264_qsv", "h264_videotoolbox")
+
+PROBE_TIMEOUT = 20  # Seconds per probe command
+
+_FILTER_LINE = re.compile(r"^ [T.][S.][C.] (\S+)\s+\S*->\S*")
+_ENCODER_LINE = re.compile(r"^ [VAS][F.][S.][X.][B.][D.] (\S+)")
+
+
+@dataclass
+class FFmpegCapabilities:
+    """What the installed ffmpeg/ffprobe support."""
+    ffmpeg_version: Optional[str] = None  # None = ffmpeg missing or not runnable
+    ffprobe_version: Optional[str] = None
+    encoders: List[str] = field(default_factory=list)
+    filters: List[str] = field(default_factory=list)
+    hwaccels: List[str] = field(default_factory=list)
+    hardware_encoders: List[str] = field(default_factory=list)  # Compiled in *and* able to open a device
+    cpu_count: int = 1
+    fingerprint: Dict[str, Any] = field(default_factory=dict)
+    probed_at: float = 0.0
+    probe_seconds: float = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg_version is not None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def summary(self) -> dict:
+        """Short form for status endpoints (the full encoder/filter lists are long)."""
+        return {
+            "ffmpeg_version": self.ffmpeg_version,
+            "ffprobe_version": self.ffprobe_version,
+            "encoders": len(self.encoders),
+            "filters": len(self.filters),
+            "hwaccels": self.hwaccels,
+            "hardware_encoders": self.hardware_encoders,
+            "cpu_count": self.cpu_count,
+            "probed_at": self.probed_at,
+            "probe_seconds": self.probe_seconds,
+        }
+
+
+_capabilities: Optional[FFmpegCapabilities] = None
+_filters: frozenset = frozenset()
+_encoders: frozenset = frozenset()
+_lock = threading.Lock()
+
+
+def _cpu_count() -> int:
+    """CPUs this process may run on (respects affinity/cgroup cpusets where the OS exposes them)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def _binary_fingerprint(name: str) -> Optional[Dict[str, Any]]:
+    path = shutil.which(name)
+    if not path:
+        return None
+    real = os.path.realpath(path)
+    try:
+        st = os.stat(real)
+    except OSError:
+        return None
+    return {"path": real, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _fingerprint() -> Dict[str, Any]:
+    return {
+        "version": CAPABILITIES_VERSION,
+        "ffmpeg": _binary_fingerprint("ffmpeg"),
+        "ffprobe": _binary_fingerprint("ffprobe"),
+    }
+
+
+def _run(cmd: List[str]) -> Optional[str]:
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    except (subprocess.TimeoutExpired, OSError):
+        return None
+    return proc.stdout if proc.returncode == 0 else None
+
+
+def _version(binary: str) -> Optional[str]:
+    output = _run([binary, "-hide_banner", "-version"])
+    if not output:
+        return None
+    first = output.splitlines()[0]
+    match = re.match(rf"{binary} version (\S+)", first)
+    return match.group(1) if match else first.strip()
+
+
+def _parse(output: Optional[str], pattern: re.Pattern) -> List[str]:
+    names = []
+    for line in (output or "").splitlines():
+        match = pattern.match(line)
+        if match:
+            names.append(match.group(1))
+    return sorted(set(names))
+
+
+def _hwaccels() -> List[str]:
+    output = _run(["ffmpeg", "-hide_banner", "-hwaccels"]) or ""
+    lines = [line.strip() for line in output.splitlines()]
+    return [line for line in lines[1:] if line]  # First line is the "Hardware acceleration methods:" header
+
+
+def encoder_works(encoder: str) -> bool:
+    """Check an encoder can actually open (hardware encoders may be compiled in without a device)."""
+    try:
+        subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-v", "error",
+                "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1",
+                "-c:v", encoder, "-f", "null", "-",
+            ],
+            check=True,
+            capture_output=True,
+            timeout=PROBE_TIMEOUT,
+        )
+        return True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        return False
+
+
+def probe_capabilities() -> FFmpegCapabilities:
+    """Run the probe commands (uncached; a few hundred ms, plus a test encode per hardware encoder)."""
+    start = time.time()
+    fingerprint = _fingerprint()
+    ffmpeg_version = _version("ffmpeg") if fingerprint["ffmpeg"] else None
+    capabilities = FFmpegCapabilities(
+        ffmpeg_version=ffmpeg_version,
+        ffprobe_version=_version("ffprobe") if fingerprint["ffprobe"] else None,
+        cpu_count=_cpu_count(),
+        fingerprint=fingerprint,
+        probed_at=start,
+    )
+    if ffmpeg_version:
+        capabilities.encoders = _parse(_run(["ffmpeg", "-hide_banner", "-encoders"]), _ENCODER_LINE)
+        capabilities.filters = _parse(_run(["ffmpeg", "-hide_banner", "-filters"]), _FILTER_LINE)
+        capabilities.hwaccels = _hwaccels()
+        capabilities.hardware_encoders = [
+            encoder for encoder in HARDWARE_ENCODERS
+            if encoder in capabilities.encoders and encoder_works(encoder)
+        ]
+    capabilities.probe_seconds = round(time.time() - start, 3)
+    return capabilities
+
+
+def _load_cached(fingerprint: Dict[str, Any]) -> Optional[FFmpegCapabilities]:
+    try:
+        with open(FFMPEG_CAPABILITIES_PATH) as f:
+            data = json.load(f)
+        if data.get("fingerprint") != fingerprint:
+            return None
+        return FFmpegCapabilities(**data)
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _store(capabilities: FFmpegCapabilities) -> None:
+    tmp_path = FFMPEG_CAPABILITIES_PATH.with_name(f".{FFMPEG_CAPABILITIES_PATH.name}.{os.getpid()}.tmp")
+    try:
+        FFMPEG_CAPABILITIES_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(capabilities.to_dict(), f)
+        os.replace(tmp_path, FFMPEG_CAPABILITIES_PATH)
+    except OSError as e:
+        print(f"Warning: Could not write FFmpeg capabilities {FFMPEG_CAPABILITIES_PATH}: {e}")
+
+
+def _set(capabilities: FFmpegCapabilities) -> None:
+    global _capabilities, _filters, _encoders
+    _filters = frozenset(capabilities.filters)
+    _encoders = frozenset(capabilities.encoders)
+    _capabilities = capabilities
+
+
+def get_capabilities(refresh: bool = False) -> FFmpegCapabilities:
+    """
+    FFmpeg capabilities, from memory, the on-disk cache, or a fresh probe.
+
+    Args:
+        refresh: Ignore both caches and probe again
+
+    Returns:
+        FFmpegCapabilities (available is False when ffmpeg isn't installed)
+    """
+    if _capabilities is not None and not refresh:
+        return _capabilities
+    with _lock:
+        if _capabilities is not None and not refresh:
+            return _capabilities
+        fingerprint = _fingerprint()
+        if not fingerprint["ffmpeg"]:
+            # Not installed (yet): don't remember that, so installing FFmpeg needs no restart
+            return FFmpegCapabilities(cpu_count=_cpu_count(), fingerprint=fingerprint)
+        capabilities = None if refresh else _load_cached(fingerprint)
+        if capabilities is None:
+            capabilities = probe_capabilities()
+            if not capabilities.available:
+                print("⚠️ Warning: FFmpeg is installed but could not be probed")
+                return capabilities
+            _store(capabilities)
+            print(
+                f"✅ Probed FFmpeg {capabilities.ffmpeg_version}: {len(capabilities.encoders)} encoders, "
+                f"{len(capabilities.filters)} filters in {capabilities.probe_seconds:.2f}s"
+            )
+        _set(capabilities)
+        return capabilities
+
+
+def has_filter(name: str) -> bool:
+    """Whether ffmpeg has a filter (True when FFmpeg couldn't be probed)."""
+    capabilities = get_capabilities()
+    return not capabilities.available or name in _filters
+
+
+def has_encoder(name: str) -> bool:
+    """Whether ffmpeg has an encoder compiled in (True when FFmpeg couldn't be probed)."""
+    capabilities = get_capabilities()
+    return not capabilities.available or name in _encoders
@@ -1,59 +1,292 @@
+"""
+Image generation.
+
+Providers are backends with one signature, (prompt, model, size,
+project_id) -> GeneratedImage, registered in BACKENDS:
+- dalle: OpenAI DALL-E 3 (one image per request; the API rejects n > 1)
+- sdxl: Stable Diffusion XL (placeholder; requests for it are served, and
+  cached, as local when SDXL_LOCAL_STANDIN is set)
+- local: deterministic gradient stills rendered with FFmpeg, for tests
+  and offline development
+
+Batches run their prompts concurrently (IMAGE_MAX_CONCURRENCY) while the
+shared rate limiter keeps provider requests within the provider's limit
+(the "dalle" bucket); each worker downloads its own result, so downloads
+overlap the remaining generations. Every result is kept in IMAGE_CACHE_DIR keyed by (provider,
+model, prompt, size): regenerating the same prompt copies the cached file
+into the project instead of paying for another API call.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
 import requests
-from config import OPENAI_API_KEY
-from utils.file_utils import save_image
 
+from config import (
+    IMAGE_CACHE_DIR,
+    IMAGE_MAX_CONCURRENCY,
+    OPENAI_API_KEY,
+    PROJECTS_DIR,
+    SDXL_LOCAL_STANDIN,
+)
+from services.rate_limiter import provider_request
+from services.storage_gc import note_access
+from utils.file_utils import save_image_file
+from utils.metrics import cache_lookup, ffmpeg_process, timed
 
-def generate_image(project_id: str, prompt: str, provider: str = "dalle") -> dict:
-    """Generate image using DALL-E or SDXL."""
-    if provider == "dalle":
-        return generate_dalle_image(project_id, prompt)
-    elif provider == "sdxl":
-        return generate_sdxl_image(project_id, prompt)
-    else:
-        raise ValueError(f"Unknown image provider: {provider}")
+DEFAULT_SIZE = "1024x1024"
+DEFAULT_MODELS = {"dalle": "dall-e-3", "sdxl": "sdxl", "local": "gradients"}
+
+
+@dataclass
+class GeneratedImage:
+    """A backend's result: a URL to download or the image bytes themselves."""
+    url: Optional[str] = None
+    data: Optional[bytes] = None
+    extension: str = ".png"
+    revised_prompt: Optional[str] = None
+
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(key: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _parse_size(size: str) -> tuple:
+    try:
+        width, height = (int(v) for v in size.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid image size: {size} (expected WIDTHxHEIGHT)")
+    return width, height
 
 
-def generate_dalle_image(project_id: str, prompt: str) -> dict:
+@timed("image_generate", "dalle")
+def generate_dalle_image(prompt: str, model: str, size: str, project_id: Optional[str] = None) -> GeneratedImage:
     """Generate image using DALL-E 3."""
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY not configured")
-    
+
     url = "https://api.openai.com/v1/images/generations"
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json",
     }
-    
+
     payload = {
-        "model": "dall-e-3",
+        "model": model,
         "prompt": prompt,
         "n": 1,
-        "size": "1024x1024",
-    }
-    
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    
-    data = response.json()
-    image_url = data["data"][0]["url"]
-    
-    # Download and save image
-    image_path = save_image(project_id, image_url)
-    
-    return {
-        "image": image_path,
-        "url": image_url,
+        "size": size,
     }
 
+    response = provider_request("dalle", "POST", url, project_id, headers=headers, json=payload, timeout=120)
+
+    image = response.json()["data"][0]
+    return GeneratedImage(url=image["url"], revised_prompt=image.get("revised_prompt"))
+
 
-def generate_sdxl_image(project_id: str, prompt: str) -> dict:
+@timed("image_generate", "sdxl")
+def generate_sdxl_image(prompt: str, model: str, size: str, project_id: Optional[str] = None) -> GeneratedImage:
     """Generate image using Stable Diffusion XL (via Replicate or similar)."""
     # This is a placeholder - you'll need to implement SDXL API integration
     # For example, using Replicate API:
     # import replicate
     # output = replicate.run("stability-ai/sdxl:...", input={"prompt": prompt})
-    # image_path = save_image(project_id, output[0])
-    # return {"image": image_path, "url": output[0]}
-    
-    raise NotImplementedError("SDXL integration not yet implemented")
+    # return GeneratedImage(url=output[0])
+
+    raise NotImplementedError("SDXL integration not yet implemented (set SDXL_LOCAL_STANDIN=true to use the local backend)")
+
+
+@timed("image_generate", "local")
+def generate_local_image(prompt: str, model: str, size: str, project_id: Optional[str] = None) -> GeneratedImage:
+    """Render a gradient still seeded by the prompt, so the same prompt always gives the same image."""
+    width, height = _parse_size(size)
+    seed = int(hashlib.sha1(prompt.encode()).hexdigest()[:8], 16)
+    c0, c1 = f"0x{seed & 0xFFFFFF:06x}", f"0x{(seed >> 8) & 0xFFFFFF ^ 0xFFFFFF:06x}"
+    fd, path = tempfile.mkstemp(suffix=".png")
+    os.close(fd)
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"gradients=s={width}x{height}:c0={c0}:c1={c1}:seed={seed}",
+        "-frames:v", "1",
+        path,
+    ]
+    try:
+        with ffmpeg_process():
+            subprocess.run(cmd, check=True, capture_output=True)
+        return GeneratedImage(data=Path(path).read_bytes())
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Local image backend failed: {e.stderr.decode().strip() if e.stderr else 'Unknown error'}")
+    finally:
+        os.unlink(path)
+
+
+BACKENDS: Dict[str, Callable[[str, str, str, Optional[str]], GeneratedImage]] = {
+    "dalle": generate_dalle_image,
+    "sdxl": generate_sdxl_image,
+    "local": generate_local_image,
+}
+
 
+def cache_key(provider: str, model: str, prompt: str, size: str) -> str:
+    """Cache key of a generation: identical requests give the same key."""
+    spec = json.dumps([provider, model, prompt.strip(), size.lower()])
+    return hashlib.sha1(spec.encode()).hexdigest()[:20]
+
+
+def _cached(key: str) -> Optional[Dict[str, Any]]:
+    """The cache entry for `key` if both its metadata and its image exist."""
+    try:
+        with open(IMAGE_CACHE_DIR / f"{key}.json") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry if (IMAGE_CACHE_DIR / entry["file"]).exists() else None
+
+
+@timed("download", "http")
+def _download(url: str, path: Path) -> None:
+    response = requests.get(url, stream=True, timeout=120)
+    response.raise_for_status()
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+
+
+def _generate_cached(provider: str, model: str, prompt: str, size: str, project_id: str) -> tuple:
+    """
+    Cache entry for a prompt, generating and downloading it on a miss. Returns (entry, cached).
+
+    The returned entry's "url" is the provider's URL for a fresh generation and
+    None on a hit: provider URLs (DALL-E's signed links) expire, so they are
+    never persisted and a cached image is only served from its local copy.
+    """
+    key = cache_key(provider, model, prompt, size)
+    with _lock_for(key):
+        entry = _cached(key)
+        cache_lookup("image", entry is not None)
+        if entry:
+            note_access(IMAGE_CACHE_DIR / entry["file"])
+            # Entries written before provider URLs were dropped still carry one
+            return dict(entry, url=None), True
+
+        image = BACKENDS[provider](prompt, model, size, project_id)
+
+        IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        extension = Path(image.url.split("?")[0]).suffix if image.url else image.extension
+        filename = f"{key}{extension if extension in ('.png', '.jpg', '.jpeg', '.webp') else '.png'}"
+        tmp_path = IMAGE_CACHE_DIR / f".{filename}.tmp"
+        try:
+            if image.url:
+                _download(image.url, tmp_path)
+            else:
+                tmp_path.write_bytes(image.data or b"")
+            os.replace(tmp_path, IMAGE_CACHE_DIR / filename)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        entry = {
+            "provider": provider,
+            "model": model,
+            "prompt": prompt,
+            "size": size,
+            "file": filename,
+            "revised_prompt": image.revised_prompt,
+            "created_at": time.time(),
+        }
+        with open(IMAGE_CACHE_DIR / f".{key}.json.tmp", "w") as f:
+            json.dump(entry, f)
+        os.replace(IMAGE_CACHE_DIR / f".{key}.json.tmp", IMAGE_CACHE_DIR / f"{key}.json")
+        return dict(entry, url=image.url), False
+
+
+def _project_copy(project_id: str, filename: str) -> str:
+    """Copy a cached image into the project's clips folder (once)."""
+    source = IMAGE_CACHE_DIR / filename
+    existing = PROJECTS_DIR / project_id / "clips" / f"img_{filename}"
+    if existing.exists() and existing.stat().st_size == source.stat().st_size:
+        return str(existing)
+    return save_image_file(project_id, str(source), existing.name)
+
+
+def generate_images(
+    project_id: str,
+    prompts: List[str],
+    provider: str = "dalle",
+    size: Optional[str] = None,
+    model: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Generate one image per prompt into a project's clips folder.
+
+    Prompts run concurrently under the provider's rate limit; repeated
+    prompts (in the batch or from earlier requests) are served from the
+    image cache.
+
+    Args:
+        project_id: Project ID
+        prompts: One prompt per image, e.g. one per template scene
+        provider: dalle, sdxl or local
+        size: WIDTHxHEIGHT (default 1024x1024)
+        model: Provider model (default per provider)
+
+    Returns:
+        One result per prompt, in order: {"prompt", "image", "url", "cached"}
+        or {"prompt", "error"} for prompts that failed. "url" is the provider's
+        short-lived URL, only set for images generated by this request; "image"
+        is the durable local copy.
+    """
+    if provider not in BACKENDS:
+        raise ValueError(f"Unknown image provider: {provider}")
+    if provider == "sdxl" and SDXL_LOCAL_STANDIN:
+        # Key the cache by the stand-in, so a real SDXL backend never serves its stills
+        provider, model = "local", None
+    size = size or DEFAULT_SIZE
+    _parse_size(size)
+    model = model or DEFAULT_MODELS[provider]
+
+    def generate(prompt: str) -> Dict[str, Any]:
+        try:
+            entry, cached = _generate_cached(provider, model, prompt, size, project_id)
+            image_path = _project_copy(project_id, entry["file"])
+        except Exception as e:
+            print(f"Warning: Image generation failed for prompt {prompt[:60]!r}: {e}")
+            return {"prompt": prompt, "error": str(e)}
+        return {
+            "prompt": prompt,
+            "image": image_path,
+            "url": entry["url"],
+            "revised_prompt": entry.get("revised_prompt"),
+            "cached": cached,
+        }
+
+    unique = list(dict.fromkeys(prompts))
+    if not unique:
+        return []
+    with ThreadPoolExecutor(max_workers=min(IMAGE_MAX_CONCURRENCY, len(unique))) as pool:
+        results = dict(zip(unique, pool.map(generate, unique)))
+    return [results[prompt] for prompt in prompts]
+
+
+def generate_image(project_id: str, prompt: str, provider: str = "dalle") -> dict:
+    """Generate image using DALL-E or SDXL."""
+    result = generate_images(project_id, [prompt], provider)[0]
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return {
+        "image": result["image"],
+        "url": result["url"],
+        "cached": result["cached"],
+    }
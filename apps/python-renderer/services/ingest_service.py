@@ -0,0 +1,43 @@
+"""
+Clip ingest service.
+
+Runs derived-asset work in the background as soon as a clip lands in a
+project, so renders and previews find it already done: probe metadata,
+the preview proxy and the poster/filmstrip thumbnails.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from config import INGEST_MAX_WORKERS
+from services.probe_service import probe_media
+from services.proxy_service import generate_proxy
+from services.thumbnail_service import generate_clip_thumbnails
+from utils.file_utils import register_clip_saved_hook
+from utils.project_manifest import VIDEO_EXTENSIONS, record_probe
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_MAX_WORKERS, thread_name_prefix="ingest")
+
+
+def ingest_clip(project_id: str, clip_path: str) -> dict:
+    """Probe a clip and build its preview proxy and thumbnails."""
+    info = probe_media(clip_path)
+    if info:
+        record_probe(project_id, clip_path, info)
+    if not info or not info.get("has_video"):
+        return {"clip": clip_path, "probe": info, "proxy": None, "thumbnails": None}
+    return {
+        "clip": clip_path,
+        "probe": info,
+        "proxy": generate_proxy(project_id, clip_path),
+        "thumbnails": generate_clip_thumbnails(project_id, clip_path),
+    }
+
+
+def schedule_ingest(project_id: str, clip_path: str) -> Optional[Future]:
+    """Queue ingest work for a newly saved clip without blocking the caller."""
+    if not clip_path.lower().endswith(VIDEO_EXTENSIONS):
+        return None
+    return _executor.submit(ingest_clip, project_id, clip_path)
+
+
+register_clip_saved_hook(schedule_ingest)
@@ -6,8 +6,10 @@ REQUIRES GPU - Will be implemented when Alienware arrives
 import os
 from pathlib import Path
 from config import PROJECTS_DIR
+from utils.metrics import timed
 
 
+@timed("voice_train", "local")
 def train_local_voice(project_id: str, audio_data: bytes, voice_name: str) -> dict:
     """
     Train a local voice model using XTTS-v2.
@@ -31,7 +33,7 @@ def train_local_voice(project_id: str, audio_data: bytes, voice_name: str) -> di
     # 4. Return model path
     
     voice_models_dir = PROJECTS_DIR / "voice_models"
-    voice_models_dir.mkdir(exist_ok=True)
+    voice_models_dir.mkdir(parents=True, exist_ok=True)
     
     # Placeholder - will be implemented with XTTS-v2
     model_path = voice_models_dir / f"{voice_name.replace(' ', '_')}.pth"
@@ -51,6 +53,7 @@ def train_local_voice(project_id: str, audio_data: bytes, voice_name: str) -> di
     }
 
 
+@timed("voice_generate", "local")
 def generate_voice_local(
     model_path: str,
     text: str,
@@ -0,0 +1,191 @@
+"""
+Media serving for /renders.
+
+Every file under RENDER_DIR is addressed two ways:
+- /renders/<path>: always the current file; revalidated on every use via
+  a strong ETag derived from the file's content hash
+- /renders/v/<hash>/<path>: a versioned URL for one exact version,
+  cached by browsers and CDNs as immutable. If the file has since been
+  replaced, the request is redirected to the current version.
+
+Responses honour single `Range` requests (206/416) and `If-None-Match`/
+`If-Range`, and the body is sent with the ASGI zero-copy extension
+(sendfile) when the server offers it, or streamed in chunks otherwise.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import RedirectResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from config import RENDER_DIR
+from services.storage_gc import note_access
+
+CHUNK_SIZE = 256 * 1024
+VERSION_PREFIX = "v/"
+VERSION_LENGTH = 16
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Directories whose paths already include a content version (streaming packages)
+IMMUTABLE_PREFIXES = ("streams/",)
+REVALIDATE_CACHE = "no-cache"
+
+mimetypes.add_type("text/vtt", ".vtt")
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("application/dash+xml", ".mpd")
+mimetypes.add_type("video/iso.segment", ".m4s")
+
+# (path, size, mtime_ns) -> content hash
+_hashes: Dict[Tuple[str, int, int], str] = {}
+_hashes_lock = threading.Lock()
+
+
+def content_hash(path: Path, st: Optional[os.stat_result] = None) -> str:
+    """Content hash of a file, cached until its size or mtime changes."""
+    st = st or path.stat()
+    key = (str(path), st.st_size, st.st_mtime_ns)
+    cached = _hashes.get(key)
+    if cached:
+        return cached
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _hashes_lock:
+        # Drop entries for older versions of the same file
+        for stale in [k for k in _hashes if k[0] == key[0]]:
+            del _hashes[stale]
+        _hashes[key] = value
+    return value
+
+
+def media_url(path: Path | str) -> str:
+    """Versioned (immutable) URL for a file under RENDER_DIR."""
+    path = Path(path)
+    relative = path.resolve().relative_to(RENDER_DIR.resolve()).as_posix()
+    return f"/renders/{VERSION_PREFIX}{content_hash(path)[:VERSION_LENGTH]}/{relative}"
+
+
+def _resolve(relative: str) -> Optional[Path]:
+    """Map a URL path to a file inside RENDER_DIR (None for traversal or missing files)."""
+    root = RENDER_DIR.resolve()
+    candidate = (root / relative).resolve()
+    if root not in candidate.parents or not candidate.is_file():
+        return None
+    return candidate
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range` header into an inclusive (start, end).
+
+    Returns:
+        (start, end), or None to serve the whole file (absent/multi-range/malformed)
+
+    Raises:
+        ValueError: if the range is unsatisfiable
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    if not (first or last) or not (first.isdigit() or first == "") or not (last.isdigit() or last == ""):
+        return None
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length <= 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class MediaFileResponse(Response):
+    """A (partial) file response sent with zero-copy sendfile when available."""
+
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: Dict[str, str], send_body: bool):
+        self.path = path
+        self.start = start
+        self.length = max(end - start + 1, 0)
+        self.send_body = send_body
+        super().__init__(content=None, status_code=status_code, headers={**headers, "content-length": str(self.length)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": self.length,
+                })
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                remaining = remaining - len(chunk) if chunk else 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+
+async def serve_media(request: Request, url_path: str) -> Response:
+    """Serve a file under RENDER_DIR with ETag, Cache-Control and Range support."""
+    version = None
+    if url_path.startswith(VERSION_PREFIX):
+        version, _, url_path = url_path[len(VERSION_PREFIX):].partition("/")
+
+    path = _resolve(url_path)
+    if path is None:
+        return Response(status_code=404)
+
+    st = path.stat()
+    note_access(path)
+    digest = await anyio.to_thread.run_sync(content_hash, path, st)
+    etag = f'"{digest}"'
+    if version is not None and version != digest[:VERSION_LENGTH]:
+        # The file was replaced since this URL was issued
+        return RedirectResponse(f"/renders/{VERSION_PREFIX}{digest[:VERSION_LENGTH]}/{url_path}", status_code=307)
+
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE if version or url_path.startswith(IMMUTABLE_PREFIXES) else REVALIDATE_CACHE,
+        "content-type": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "content-type"})
+
+    send_body = request.method != "HEAD"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, st.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={"content-range": f"bytes */{st.st_size}", "accept-ranges": "bytes"})
+        if byte_range:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{st.st_size}"
+            return MediaFileResponse(path, start, end, 206, headers, send_body)
+
+    return MediaFileResponse(path, 0, st.st_size - 1, 200, headers, send_body)
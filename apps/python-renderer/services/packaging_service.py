@@ -0,0 +1,180 @@
+"""
+Adaptive streaming packaging.
+
+Turns a finished render into an HLS/DASH bitrate ladder with a single
+FFmpeg pass: the source is decoded once, split and scaled to each rung
+that fits under the source height, and muxed with FFmpeg's DASH muxer
+into shared fMP4 segments described by both a DASH manifest (manifest.mpd)
+and an HLS master playlist (master.m3u8).
+
+Packages live in RENDER_DIR/streams/<project>/<render hash>/, so a new
+render never overwrites segments a player is still reading, and are
+optionally uploaded via supabase_storage.
+"""
+import os
+import shutil
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import RENDER_DIR, STREAMING_SEGMENT_SECONDS
+from services.media_service import content_hash
+from services.probe_service import probe_media
+from services.render_profiles import RenderProfile, get_profile, video_encoder_args
+from utils.ffmpeg_utils import run_ffmpeg
+from utils.metrics import timed
+
+STREAMS_DIR = RENDER_DIR / "streams"
+STREAMING_FORMATS = ("hls", "dash")
+
+# (height, video bitrate) from the top of the ladder down
+LADDER = [
+    (2160, "14000k"),
+    (1440, "8000k"),
+    (1080, "5000k"),
+    (720, "2800k"),
+    (480, "1400k"),
+    (360, "800k"),
+]
+AUDIO_BITRATE = "128k"
+MAX_RUNGS = 4
+
+
+def choose_ladder(width: int, height: int) -> List[Dict[str, Any]]:
+    """Rungs at or below the source resolution (the source size itself is always included)."""
+    # Vertical renders: ladder heights apply to the short side
+    short_side = min(width, height)
+    rungs = [(h, rate) for h, rate in LADDER if h <= short_side]
+    if not rungs or rungs[0][0] < short_side:
+        # Top rung at the native size, using the bitrate of the next rung up
+        above = [rate for h, rate in LADDER if h > short_side]
+        rungs.insert(0, (short_side, above[-1] if above else LADDER[0][1]))
+    ladder = []
+    for short, rate in rungs[:MAX_RUNGS]:
+        scale = short / short_side
+        ladder.append({
+            "width": int(width * scale) // 2 * 2,
+            "height": int(height * scale) // 2 * 2,
+            "bitrate": rate,
+        })
+    return ladder
+
+
+def _package_dir(project_id: str, video_path: str) -> Path:
+    return STREAMS_DIR / project_id / content_hash(Path(video_path))[:16]
+
+
+def _urls(out_dir: Path, formats: List[str]) -> Dict[str, str]:
+    base = "/renders/" + out_dir.relative_to(RENDER_DIR).as_posix()
+    urls = {}
+    if "hls" in formats:
+        urls["hls"] = f"{base}/master.m3u8"
+    if "dash" in formats:
+        urls["dash"] = f"{base}/manifest.mpd"
+    return urls
+
+
+def build_package_command(
+    video_path: str,
+    out_dir: Path,
+    ladder: List[Dict[str, Any]],
+    fps: float,
+    has_audio: bool,
+    profile: RenderProfile,
+) -> List[str]:
+    """One decode, N scaled encodes, muxed as DASH + HLS over shared fMP4 segments."""
+    n = len(ladder)
+    top = ladder[0]
+    filters = [f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    for i, rung in enumerate(ladder):
+        # Even dimensions can't always keep the exact aspect ratio; pin the display
+        # aspect to the top rung's so all rungs share one adaptation set
+        filters.append(f"[s{i}]scale={rung['width']}:{rung['height']},setdar={top['width']}/{top['height']}[o{i}]")
+
+    # Keyframes exactly on segment boundaries so every rung switches cleanly
+    ladder_profile = replace(
+        profile, crf=None, video_bitrate=None, gop_seconds=float(STREAMING_SEGMENT_SECONDS), fixed_gop=True
+    )
+    cmd = ["ffmpeg", "-y", "-i", video_path, "-filter_complex", ";".join(filters)]
+    for i in range(n):
+        cmd += ["-map", f"[o{i}]"]
+    if has_audio:
+        cmd += ["-map", "0:a:0"]
+    cmd += video_encoder_args(ladder_profile, fps or 30.0)
+    cmd += ["-pix_fmt", "yuv420p"]
+    for i, rung in enumerate(ladder):
+        rate = rung["bitrate"]
+        bufsize = f"{int(rate.rstrip('k')) * 2}k"
+        cmd += [f"-b:v:{i}", rate, f"-maxrate:v:{i}", rate, f"-bufsize:v:{i}", bufsize]
+    if has_audio:
+        cmd += ["-c:a", "aac", "-b:a", AUDIO_BITRATE, "-ac", "2"]
+
+    adaptation_sets = "id=0,streams=v" + (" id=1,streams=a" if has_audio else "")
+    cmd += [
+        "-f", "dash",
+        "-seg_duration", str(STREAMING_SEGMENT_SECONDS),
+        "-use_template", "1",
+        "-use_timeline", "1",
+        "-adaptation_sets", adaptation_sets,
+        "-hls_playlist", "1",
+        "-init_seg_name", "init_$RepresentationID$.m4s",
+        "-media_seg_name", "chunk_$RepresentationID$_$Number%05d$.m4s",
+        str(out_dir / "manifest.mpd"),
+    ]
+    return cmd
+
+
+@timed("package")
+def package_render(
+    project_id: str,
+    video_path: str,
+    formats: List[str],
+    profile: Optional[RenderProfile] = None,
+    upload: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """
+    Package a render as an adaptive bitrate ladder (reused if already packaged).
+
+    Args:
+        project_id: Project ID
+        video_path: Finished render
+        formats: Any of "hls", "dash"
+        profile: Render profile supplying encoder speed settings
+        upload: Also upload the package via supabase_storage
+
+    Returns:
+        dict with manifest URLs, the ladder and (if uploaded) remote URLs, or None on failure
+    """
+    formats = [f for f in formats if f in STREAMING_FORMATS]
+    if not formats:
+        return None
+    info = probe_media(video_path)
+    if not info or not info.get("has_video"):
+        return None
+
+    out_dir = _package_dir(project_id, video_path)
+    ladder = choose_ladder(info["width"], info["height"])
+    if not (out_dir / "manifest.mpd").exists():
+        tmp_dir = out_dir.with_name(f".{out_dir.name}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        cmd = build_package_command(
+            video_path, tmp_dir, ladder, info.get("fps"), bool(info.get("has_audio")), profile or get_profile(None)
+        )
+        if not run_ffmpeg(cmd, f"streaming package for {project_id}"):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+        try:
+            os.replace(tmp_dir, out_dir)
+        except OSError:
+            # A concurrent packager finished first; its output is identical
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    result: Dict[str, Any] = {"formats": formats, "ladder": ladder, **_urls(out_dir, formats)}
+    if upload:
+        from services.supabase_storage import upload_stream_package
+        try:
+            result["remote"] = upload_stream_package(project_id, out_dir.name, out_dir, formats)
+        except Exception as e:
+            print(f"Warning: Could not upload streaming package for {project_id}: {e}")
+    return result
@@ -0,0 +1,316 @@
+"""
+Media probe service.
+
+Runs ffprobe once per asset and caches the normalized metadata keyed by
+path + mtime + size. Results live in an in-memory cache and in an on-disk
+index per probed folder (RENDER_DIR/.probe_index/<folder hash>.json), so a
+restarted renderer doesn't have to probe the same clips again. The indexes
+are kept out of the probed folders: writing into a project's clips folder
+would change its mtime, which the project manifest uses to detect new files.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import PROBE_MAX_WORKERS, RENDER_DIR
+from utils.metrics import cache_lookup, ffmpeg_process
+
+PROBE_INDEX_DIR = RENDER_DIR / ".probe_index"
+PROBE_VERSION = 2  # Bump when _normalize gains fields, so older index entries are probed again
+
+# (path, mtime_ns, size) -> probe result
+_cache: Dict[tuple, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def _cache_key(path: str) -> Optional[tuple]:
+    """Build the cache key for a file, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _parse_rate(rate: Optional[str]) -> Optional[float]:
+    """Parse an ffprobe rational like '30000/1001' into a float."""
+    if not rate or rate == "0/0":
+        return None
+    try:
+        if "/" in rate:
+            num, den = rate.split("/", 1)
+            return round(float(num) / float(den), 3) if float(den) else None
+        return float(rate)
+    except ValueError:
+        return None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalize(raw: dict, size: int) -> Dict[str, Any]:
+    """Reduce raw ffprobe JSON to the fields the renderer cares about."""
+    streams = raw.get("streams", [])
+    fmt = raw.get("format", {})
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    duration = _to_float(fmt.get("duration"))
+    if duration is None and video:
+        duration = _to_float(video.get("duration"))
+
+    info: Dict[str, Any] = {
+        "duration": duration,
+        "video_duration": _to_float(video.get("duration")) if video else None,
+        "audio_duration": _to_float(audio.get("duration")) if audio else None,
+        "size": size,
+        "format": fmt.get("format_name"),
+        "bit_rate": int(fmt["bit_rate"]) if fmt.get("bit_rate", "").isdigit() else None,
+        "has_video": video is not None,
+        "has_audio": audio is not None,
+        "width": None,
+        "height": None,
+        "fps": None,
+        "pix_fmt": None,
+        "vcodec": None,
+        "vprofile": None,
+        "vlevel": None,
+        "extradata_hash": None,
+        "time_base": None,
+        "acodec": None,
+        "sample_rate": None,
+        "channels": None,
+    }
+
+    if video:
+        info.update({
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "fps": _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+            "pix_fmt": video.get("pix_fmt"),
+            "vcodec": video.get("codec_name"),
+            "vprofile": video.get("profile"),
+            "vlevel": video.get("level"),
+            "extradata_hash": video.get("extradata_hash"),  # Hash of the SPS/PPS for H.264
+            "time_base": video.get("time_base"),
+        })
+    if audio:
+        info.update({
+            "acodec": audio.get("codec_name"),
+            "sample_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+            "channels": audio.get("channels"),
+        })
+
+    return info
+
+
+def _run_ffprobe(path: str) -> dict:
+    """Run ffprobe and return its JSON output."""
+    with ffmpeg_process("ffprobe"):
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v", "error",
+                "-print_format", "json",
+                "-show_format",
+                "-show_streams",
+                "-show_data_hash", "sha256",
+                path,
+            ],
+            check=True,
+            capture_output=True,
+        )
+    return json.loads(result.stdout or b"{}")
+
+
+def _index_path(path: str) -> Path:
+    folder = os.path.dirname(os.path.abspath(path))
+    return PROBE_INDEX_DIR / f"{hashlib.sha1(folder.encode()).hexdigest()[:16]}.json"
+
+
+def _read_index(index_path: Path) -> Dict[str, Any]:
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _load_from_index(key: tuple) -> Optional[Dict[str, Any]]:
+    """Look up a probe result in the index of the file's folder."""
+    abs_path, mtime_ns, size = key
+    entry = _read_index(_index_path(abs_path)).get(os.path.basename(abs_path))
+    if (
+        entry
+        and entry.get("version") == PROBE_VERSION
+        and entry.get("mtime_ns") == mtime_ns
+        and entry.get("size") == size
+    ):
+        return entry.get("probe")
+    return None
+
+
+def _write_index(index_path: Path, index: Dict[str, Any]) -> None:
+    """Atomically replace a folder's probe index (best effort)."""
+    tmp_path = index_path.with_name(f".{index_path.name}.{os.getpid()}.tmp")
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        print(f"Warning: Could not write probe index {index_path}: {e}")
+
+
+def _store_in_index(key: tuple, info: Dict[str, Any]) -> None:
+    """Write a probe result into its folder's index."""
+    abs_path, mtime_ns, size = key
+    index_path = _index_path(abs_path)
+    with _lock:
+        index = _read_index(index_path)
+        index[os.path.basename(abs_path)] = {
+            "version": PROBE_VERSION,
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "probe": info,
+        }
+        _write_index(index_path, index)
+
+
+def probe_media(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Probe a media file, using cached results when the file is unchanged.
+
+    Args:
+        path: Path to a local media file
+
+    Returns:
+        Normalized metadata (duration, width, height, fps, pix_fmt, codecs,
+        has_audio, ...) or None if the file is missing or can't be probed
+    """
+    key = _cache_key(path)
+    if key is None:
+        return None
+
+    cached = _cache.get(key)
+    cache_lookup("probe_memory", cached is not None)
+    if cached is not None:
+        return cached
+
+    info = _load_from_index(key)
+    cache_lookup("probe_index", info is not None)
+    if info is None:
+        try:
+            info = _normalize(_run_ffprobe(path), key[2])
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            stderr = getattr(e, "stderr", None)
+            print(f"ffprobe error for {path}: {stderr.decode() if stderr else e}")
+            return None
+        _store_in_index(key, info)
+
+    _cache[key] = info
+    return info
+
+
+def probe_many(paths: List[str], max_workers: int = PROBE_MAX_WORKERS) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Probe several files concurrently.
+
+    Cached files return immediately; only the misses spawn ffprobe processes.
+
+    Returns:
+        Mapping of path -> probe result (None for unprobeable files)
+    """
+    unique = list(dict.fromkeys(paths))
+    if len(unique) <= 1:
+        return {p: probe_media(p) for p in unique}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as pool:
+        return dict(zip(unique, pool.map(probe_media, unique)))
+
+
+def probe_keyframes(path: str) -> List[Tuple[float, float]]:
+    """
+    List the keyframes of a file's first video stream as (pts, dts) pairs.
+
+    Only packet headers are read (no decoding), and results are cached
+    alongside the probe data. Used to find points where a clip can be cut
+    without re-encoding; the dts is what the concat demuxer cuts on.
+    """
+    key = _cache_key(path)
+    if key is None:
+        return []
+
+    cache_key = ("keyframes",) + key
+    cached = _cache.get(cache_key)
+    cache_lookup("keyframes", cached is not None)
+    if cached is not None:
+        return cached
+
+    # Make sure the file has an index entry to attach the keyframes to
+    if probe_media(path) is None:
+        return []
+
+    abs_path = key[0]
+    index_path = _index_path(abs_path)
+    entry = _read_index(index_path).get(os.path.basename(abs_path)) or {}
+    keyframes = entry.get("keyframes") if entry.get("mtime_ns") == key[1] else None
+
+    if keyframes is None:
+        try:
+            with ffmpeg_process("ffprobe"):
+                result = subprocess.run(
+                    [
+                        "ffprobe",
+                        "-v", "error",
+                        "-select_streams", "v:0",
+                        "-show_entries", "packet=pts_time,dts_time,flags",
+                        "-of", "csv=p=0",
+                        path,
+                    ],
+                    check=True,
+                    capture_output=True,
+                )
+        except (subprocess.CalledProcessError, OSError) as e:
+            stderr = getattr(e, "stderr", None)
+            print(f"ffprobe keyframe error for {path}: {stderr.decode() if stderr else e}")
+            return []
+        keyframes = []
+        for line in result.stdout.decode().splitlines():
+            fields = line.strip().split(",")
+            if len(fields) < 3 or "K" not in fields[2]:
+                continue
+            pts, dts = _to_float(fields[0]), _to_float(fields[1])
+            if pts is not None:
+                keyframes.append([pts, dts if dts is not None else pts])
+        keyframes.sort()
+        with _lock:
+            index = _read_index(index_path)
+            entry = index.get(os.path.basename(abs_path))
+            if entry and entry.get("mtime_ns") == key[1] and entry.get("size") == key[2]:
+                entry["keyframes"] = keyframes
+                _write_index(index_path, index)
+
+    keyframes = [tuple(k) for k in keyframes]
+    _cache[cache_key] = keyframes
+    return keyframes
+
+
+def get_duration(path: str) -> Optional[float]:
+    """Convenience accessor for a file's duration in seconds."""
+    info = probe_media(path)
+    return info.get("duration") if info else None
+
+
+def clear_cache() -> None:
+    """Drop the in-memory cache (on-disk indexes are kept)."""
+    _cache.clear()
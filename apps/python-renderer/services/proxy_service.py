@@ -0,0 +1,128 @@
+"""
+Preview proxy service.
+
+Generates low-resolution, fast-to-decode proxies of each clip (the
+"preview" render profile: 360p, ultrafast, a keyframe every half second) so the timeline editor can
+assemble previews in a fraction of the time of a full render. Every proxy
+is encoded to the same PREVIEW_TARGET, which lets untrimmed proxies be
+stream-copied straight into a preview. Final renders keep using originals.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from config import PROJECTS_DIR, INGEST_MAX_WORKERS
+from services.probe_service import probe_media
+from services.render_planner import ClipPlan, TargetFormat
+from services.render_graph import build_conform_command
+from services.render_profiles import faststart_args, get_profile
+from services.storage_gc import note_access
+from utils.ffmpeg_utils import run_ffmpeg
+from utils.metrics import cache_lookup, stage
+
+PREVIEW_PROFILE = get_profile("preview")
+PREVIEW_TARGET = TargetFormat(
+    width=PREVIEW_PROFILE.width,
+    height=PREVIEW_PROFILE.height,
+    fps=PREVIEW_PROFILE.fps,
+    sample_rate=48000,
+    channels=2,
+    timescale=15360,
+)
+
+# Proxy path -> [lock, callers holding or waiting for it]
+_locks: Dict[str, list] = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _proxy_lock(path: str) -> Iterator[None]:
+    """Serialize builds of one proxy; the entry is dropped once nobody holds or waits for it."""
+    with _locks_guard:
+        entry = _locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[path]
+
+
+def proxy_path_for(project_id: str, clip_path: str) -> Path:
+    """Where the proxy for a clip lives: PROJECTS_DIR/<id>/proxies/<stem>_<hash>.mp4"""
+    abs_path = os.path.abspath(clip_path)
+    digest = hashlib.sha1(abs_path.encode()).hexdigest()[:8]
+    return PROJECTS_DIR / project_id / "proxies" / f"{Path(clip_path).stem}_{digest}.mp4"
+
+
+def is_proxy_fresh(clip_path: str, proxy_path: Path) -> bool:
+    """A proxy is fresh if it exists and is newer than its source clip."""
+    try:
+        return proxy_path.stat().st_mtime >= os.stat(clip_path).st_mtime
+    except OSError:
+        return False
+
+
+def generate_proxy(project_id: str, clip_path: str) -> Optional[str]:
+    """
+    Generate (or reuse) the preview proxy for a clip.
+
+    Args:
+        project_id: Project ID
+        clip_path: Local path of the original clip
+
+    Returns:
+        Path to the proxy, or None if the clip couldn't be transcoded
+    """
+    proxy_path = proxy_path_for(project_id, clip_path)
+    with _proxy_lock(str(proxy_path)):
+        fresh = is_proxy_fresh(clip_path, proxy_path)
+        cache_lookup("proxy", fresh)
+        if fresh:
+            note_access(proxy_path)
+            return str(proxy_path)
+
+        info = probe_media(clip_path)
+        if not info or not info.get("has_video"):
+            return None
+
+        clip = ClipPlan(
+            index=0,
+            path=clip_path,
+            source_duration=info.get("duration"),
+            has_audio=bool(info.get("has_audio")),
+        )
+        proxy_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = proxy_path.with_name(f".{proxy_path.stem}.tmp.mp4")
+        cmd = build_conform_command(
+            clip, PREVIEW_TARGET, str(tmp_path), PREVIEW_PROFILE, faststart_args(PREVIEW_PROFILE)
+        )
+        with stage("proxy"):
+            ok = run_ffmpeg(cmd, f"proxy for {clip_path}")
+        if not ok:
+            tmp_path.unlink(missing_ok=True)
+            return None
+        os.replace(tmp_path, proxy_path)
+        return str(proxy_path)
+
+
+def ensure_proxies(project_id: str, clip_paths: List[str]) -> Dict[str, str]:
+    """
+    Make sure every clip has a proxy, generating missing ones concurrently.
+
+    Returns:
+        Mapping of clip path -> proxy path (the original path if proxying failed)
+    """
+    unique = list(dict.fromkeys(clip_paths))
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(INGEST_MAX_WORKERS, len(unique))) as pool:
+        proxies = list(pool.map(lambda p: generate_proxy(project_id, p), unique))
+    return {path: proxy or path for path, proxy in zip(unique, proxies)}
@@ -0,0 +1,435 @@
+"""
+Outbound provider rate limiting.
+
+Every call to a generation provider (OpenAI, ElevenLabs, Pika, Runway)
+goes through provider_request(), which waits for the provider bucket's
+permission before sending. That way a batch of scenes sits at the
+provider's limit instead of producing a storm of 429s. Each bucket
+(PROVIDER_RATE_LIMITS) has:
+- a token bucket of requests per minute, with a burst of BURST_FRACTION
+  of a minute's requests
+- optionally a concurrency limit: leases held for the duration of a call,
+  or from submit until the job finishes for video providers (job leases
+  carry a TTL so a crashed worker can't leak them)
+
+The state lives in Redis and is updated by a single Lua script, so every
+worker process shares one budget per provider; the script uses Redis' own
+clock. Waiters are served fairly across projects: while several projects
+wait on a bucket, the one served least recently goes next, so one large
+batch can't starve everyone else.
+
+Responses feed back into the bucket. A 429/503 Retry-After, or a rate-limit
+header saying no requests remain before a reset, blocks the bucket for
+every worker until then; the call is retried up to RATE_LIMIT_MAX_RETRIES
+times, with exponential backoff when the provider gives no hint.
+
+If Redis is unreachable the limiter keeps working with process-local
+state (limits then apply per process) and retries Redis periodically.
+"""
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from prometheus_client import Counter
+
+from config import PROVIDER_RATE_LIMITS, RATE_LIMIT_MAX_RETRIES
+from services.redis_client import get_sync_redis_client
+from utils.metrics import stage
+
+KEY_PREFIX = "OMEGAFRAME_RATELIMIT_"
+BURST_FRACTION = 0.1  # Bucket capacity as a fraction of a minute's requests (at least 1)
+CALL_LEASE_TTL = 300.0  # Seconds a per-call concurrency lease survives a crashed worker
+WAITER_TTL = 10.0  # Seconds a waiter stays in the fair queue without re-checking
+MAX_SLEEP = 2.0  # Waiters re-check at least this often (keeps their queue entry alive)
+TURN_WAIT = 0.05  # Re-check delay when another project has the turn
+SLOT_WAIT = 0.25  # Re-check delay when all concurrency slots are taken
+MAX_BACKOFF = 60.0
+REDIS_RETRY_INTERVAL = 30.0  # Seconds on the local fallback before trying Redis again
+THROTTLE_STATUSES = (429, 503)
+
+PROVIDER_THROTTLED = Counter(
+    "renderer_provider_throttled_total",
+    "Provider responses that asked us to slow down",
+    ["provider", "status"],
+)
+
+# KEYS: bucket, waiting, served, blocked, active
+# ARGV: rate/s, capacity, project, waiter, concurrency limit, lease, lease ttl,
+#       waiter ttl, turn wait, slot wait
+# Returns "0" when granted, otherwise the seconds to wait before asking again.
+# A project waits its turn while another waiting project was served less recently.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+local project, limit, lease = ARGV[3], tonumber(ARGV[5]), ARGV[6]
+
+local blocked = tonumber(redis.call('GET', KEYS[4]) or '0')
+if blocked > now then
+    return tostring(blocked - now)
+end
+
+local member = project .. '|' .. ARGV[4]
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[8]), member)
+redis.call('EXPIRE', KEYS[2], 3600)
+local mine = tonumber(redis.call('HGET', KEYS[3], project) or '0')
+for _, waiter in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    local waiting_project = string.match(waiter, '^(.*)|[^|]*$')
+    if tonumber(redis.call('HGET', KEYS[3], waiting_project) or '0') < mine then
+        return ARGV[9]
+    end
+end
+
+if limit > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[5], '-inf', now)
+    if not redis.call('ZSCORE', KEYS[5], lease) and redis.call('ZCARD', KEYS[5]) >= limit then
+        return ARGV[10]
+    end
+end
+
+if rate > 0 then
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+    if tokens < 1 then
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        return tostring((1 - tokens) / rate)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], 3600)
+end
+
+if limit > 0 then
+    redis.call('ZADD', KEYS[5], now + tonumber(ARGV[7]), lease)
+    redis.call('EXPIRE', KEYS[5], math.ceil(tonumber(ARGV[7])) + 60)
+end
+redis.call('ZREM', KEYS[2], member)
+redis.call('HSET', KEYS[3], project, tostring(now))
+redis.call('EXPIRE', KEYS[3], 3600)
+return '0'
+"""
+
+# KEYS: blocked. ARGV: seconds. Extends (never shortens) the block.
+_BLOCK_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local until_ts = now + tonumber(ARGV[1])
+if until_ts > tonumber(redis.call('GET', KEYS[1]) or '0') then
+    redis.call('SET', KEYS[1], tostring(until_ts), 'PX', math.ceil(tonumber(ARGV[1]) * 1000))
+end
+return 1
+"""
+
+# KEYS: active. ARGV: old lease, new lease. Keeps the slot and its expiry.
+_RENAME_SCRIPT = """
+local expiry = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if expiry then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('ZADD', KEYS[1], expiry, ARGV[2])
+end
+return 1
+"""
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    """Requests per minute and concurrent leases of one bucket (0 = unlimited)."""
+    per_minute: float
+    concurrency: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.per_minute * BURST_FRACTION)
+
+
+def parse_limit(value: str) -> BucketLimit:
+    """BucketLimit from "requests_per_minute/concurrent" (e.g. "10/2" or just "10")."""
+    per_minute, _, concurrency = value.partition("/")
+    return BucketLimit(float(per_minute or 0), int(concurrency or 0))
+
+
+LIMITS: Dict[str, BucketLimit] = {bucket: parse_limit(value) for bucket, value in PROVIDER_RATE_LIMITS.items()}
+
+
+def bucket_limit(bucket: str) -> BucketLimit:
+    if bucket not in LIMITS:
+        raise ValueError(f"No rate limit configured for {bucket}")
+    return LIMITS[bucket]
+
+
+def _keys(bucket: str) -> List[str]:
+    prefix = f"{KEY_PREFIX}{bucket}_"
+    return [prefix + name for name in ("bucket", "waiting", "served", "blocked", "active")]
+
+
+class _LocalState:
+    """Process-local equivalent of the Redis state, used while Redis is unreachable."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens: Dict[str, Tuple[float, float]] = {}  # bucket -> (tokens, updated)
+        self.waiting: Dict[str, Dict[Tuple[str, str], float]] = {}  # bucket -> {(project, waiter): expiry}
+        self.served: Dict[str, Dict[str, float]] = {}  # bucket -> {project: last served}
+        self.blocked: Dict[str, float] = {}
+        self.active: Dict[str, Dict[str, float]] = {}  # bucket -> {lease: expiry}
+
+    def try_acquire(self, bucket: str, limit: BucketLimit, project: str, waiter: str, lease: str, lease_ttl: float) -> float:
+        now = time.monotonic()
+        with self.lock:
+            if self.blocked.get(bucket, 0.0) > now:
+                return self.blocked[bucket] - now
+
+            waiting = self.waiting.setdefault(bucket, {})
+            for key in [k for k, expiry in waiting.items() if expiry <= now]:
+                del waiting[key]
+            waiting[(project, waiter)] = now + WAITER_TTL
+            served = self.served.setdefault(bucket, {})
+            mine = served.get(project, 0.0)
+            if any(served.get(p, 0.0) < mine for p, _ in waiting):
+                return TURN_WAIT
+
+            active = self.active.setdefault(bucket, {})
+            if limit.concurrency > 0:
+                for key in [k for k, expiry in active.items() if expiry <= now]:
+                    del active[key]
+                if lease not in active and len(active) >= limit.concurrency:
+                    return SLOT_WAIT
+
+            if limit.rate > 0:
+                tokens, updated = self.tokens.get(bucket, (limit.capacity, now))
+                tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+                if tokens < 1:
+                    self.tokens[bucket] = (tokens, now)
+                    return (1 - tokens) / limit.rate
+                self.tokens[bucket] = (tokens - 1, now)
+
+            if limit.concurrency > 0:
+                active[lease] = now + lease_ttl
+            del waiting[(project, waiter)]
+            served[project] = now
+            return 0.0
+
+    def block(self, bucket: str, seconds: float) -> None:
+        with self.lock:
+            self.blocked[bucket] = max(self.blocked.get(bucket, 0.0), time.monotonic() + seconds)
+
+    def release(self, bucket: str, lease: str) -> None:
+        with self.lock:
+            self.active.get(bucket, {}).pop(lease, None)
+
+    def rename(self, bucket: str, old: str, new: str) -> None:
+        with self.lock:
+            active = self.active.get(bucket, {})
+            if old in active:
+                active[new] = active.pop(old)
+
+
+_local = _LocalState()
+_scripts: Dict[str, object] = {}
+_redis_down_until = 0.0
+_redis_lock = threading.Lock()
+
+
+def _redis_call(script: str, keys: List[str], args: List) -> Optional[str]:
+    """Run a Lua script on Redis, or return None (switching to local state for a while) if it's down."""
+    global _redis_down_until
+    if time.monotonic() < _redis_down_until:
+        return None
+    try:
+        client = get_sync_redis_client()
+        with _redis_lock:
+            if script not in _scripts:
+                _scripts[script] = client.register_script(script)
+        return _scripts[script](keys=keys, args=args)
+    except Exception as e:
+        print(f"Warning: Rate limiter can't reach Redis, limiting per process for {REDIS_RETRY_INTERVAL:.0f}s: {e}")
+        _redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+        return None
+
+
+def _try_acquire(bucket: str, limit: BucketLimit, project: str, waiter: str, lease: str, lease_ttl: float) -> float:
+    args = [limit.rate, limit.capacity, project, waiter, limit.concurrency, lease, lease_ttl, WAITER_TTL, TURN_WAIT, SLOT_WAIT]
+    result = _redis_call(_ACQUIRE_SCRIPT, _keys(bucket), args)
+    if result is None:
+        return _local.try_acquire(bucket, limit, project, waiter, lease, lease_ttl)
+    return float(result)
+
+
+def acquire(bucket: str, project_id: Optional[str] = None, lease: Optional[str] = None, lease_ttl: float = CALL_LEASE_TTL) -> str:
+    """
+    Block until `bucket` allows another request.
+
+    Args:
+        bucket: Rate limit bucket (PROVIDER_RATE_LIMITS key)
+        project_id: Project the request is for (fairness across projects)
+        lease: Concurrency lease to take or refresh (default: a new one)
+        lease_ttl: Seconds until the lease expires if never released
+
+    Returns:
+        The lease id, to pass to release() (it only holds a slot if the
+        bucket has a concurrency limit)
+    """
+    limit = bucket_limit(bucket)
+    lease = lease or uuid.uuid4().hex
+    waiter = uuid.uuid4().hex[:12]
+    with stage("rate_limit_wait", bucket):
+        while True:
+            wait = _try_acquire(bucket, limit, project_id or "", waiter, lease, lease_ttl)
+            if wait <= 0:
+                return lease
+            time.sleep(min(wait, MAX_SLEEP))
+
+
+def release(bucket: str, lease: Optional[str]) -> None:
+    """Free a concurrency lease."""
+    if not lease or bucket_limit(bucket).concurrency <= 0:
+        return
+    if _redis_call("return redis.call('ZREM', KEYS[1], ARGV[1])", [_keys(bucket)[4]], [lease]) is None:
+        _local.release(bucket, lease)
+
+
+def rename_lease(bucket: str, old: str, new: str) -> None:
+    """Re-key a held lease (e.g. to a provider job id once it's known), keeping its slot."""
+    if bucket_limit(bucket).concurrency <= 0:
+        return
+    if _redis_call(_RENAME_SCRIPT, [_keys(bucket)[4]], [old, new]) is None:
+        _local.rename(bucket, old, new)
+
+
+def block(bucket: str, seconds: float) -> None:
+    """Hold every worker's requests to `bucket` for `seconds`."""
+    if seconds <= 0:
+        return
+    if _redis_call(_BLOCK_SCRIPT, [_keys(bucket)[3]], [seconds]) is None:
+        _local.block(bucket, seconds)
+
+
+@contextmanager
+def limited(bucket: str, project_id: Optional[str] = None) -> Iterator[str]:
+    """Hold a request permit (and concurrency slot) of `bucket` for the duration of a block."""
+    lease = acquire(bucket, project_id)
+    try:
+        yield lease
+    finally:
+        release(bucket, lease)
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Seconds from "20", "1.5", "20ms", "6m0s" or "1h2m3s"."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(n) * units[u] for n, u in parts)
+
+
+def retry_after(headers: requests.structures.CaseInsensitiveDict) -> Optional[float]:
+    """Seconds a response asks us to wait: Retry-After (seconds or HTTP date) or a rate-limit reset."""
+    value = headers.get("Retry-After")
+    if value:
+        seconds = _parse_duration(value)
+        if seconds is not None:
+            return max(seconds, 0.0)
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return _reset_when_exhausted(headers)
+
+
+def _reset_when_exhausted(headers: requests.structures.CaseInsensitiveDict) -> Optional[float]:
+    """Seconds until the reset, if the rate-limit headers say no requests remain."""
+    for remaining_name, reset_name in (
+        ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),  # OpenAI
+        ("x-ratelimit-remaining", "x-ratelimit-reset"),
+        ("ratelimit-remaining", "ratelimit-reset"),  # IETF draft
+    ):
+        remaining, reset = headers.get(remaining_name), headers.get(reset_name)
+        if remaining is None or reset is None:
+            continue
+        try:
+            if float(remaining) > 0:
+                return None
+        except ValueError:
+            continue
+        seconds = _parse_duration(reset)
+        if seconds is not None and seconds > 1e9:
+            seconds -= time.time()  # An epoch timestamp rather than a delay
+        return max(seconds, 0.0) if seconds is not None else None
+    return None
+
+
+def provider_request(
+    bucket: str,
+    method: str,
+    url: str,
+    project_id: Optional[str] = None,
+    lease: Optional[str] = None,
+    lease_ttl: float = CALL_LEASE_TTL,
+    **kwargs,
+) -> requests.Response:
+    """
+    Make an outbound provider call through the rate limiter.
+
+    Waits for the bucket, sends the request, blocks the bucket for every
+    worker when the provider says so, and retries throttled (429/503)
+    responses after their Retry-After (or exponential backoff).
+
+    Args:
+        bucket: Rate limit bucket (PROVIDER_RATE_LIMITS key)
+        method: HTTP method
+        url: Request URL
+        project_id: Project the request is for (fairness across projects)
+        lease: Concurrency lease that outlives the call (e.g. a video job's);
+            by default a lease is taken for the call and released after it
+        lease_ttl: Seconds until `lease` expires if never released
+        **kwargs: Passed to requests.request (a 60s timeout by default)
+
+    Returns:
+        The successful response (raise_for_status() has passed)
+    """
+    kwargs.setdefault("timeout", 60)
+    call_lease = lease or uuid.uuid4().hex
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        acquire(bucket, project_id, call_lease, lease_ttl if lease else CALL_LEASE_TTL)
+        try:
+            response = requests.request(method, url, **kwargs)
+        except Exception:
+            if not lease:
+                release(bucket, call_lease)
+            raise
+        if not lease:
+            release(bucket, call_lease)
+
+        wait = retry_after(response.headers)
+        if response.status_code in THROTTLE_STATUSES:
+            PROVIDER_THROTTLED.labels(bucket, str(response.status_code)).inc()
+            if wait is None:
+                wait = min(2 ** attempt, MAX_BACKOFF) + random.uniform(0, 1)
+            block(bucket, wait)
+            if attempt < RATE_LIMIT_MAX_RETRIES:
+                print(f"Warning: {bucket} returned {response.status_code}; retrying in {wait:.1f}s")
+                continue
+        elif wait:
+            block(bucket, wait)  # Succeeded, but it was the last request before a reset
+        response.raise_for_status()
+        return response
+    raise RuntimeError("unreachable")
@@ -2,11 +2,14 @@
 Redis client for pub/sub messaging.
 """
 import os
+import redis as redis_sync
 import redis.asyncio as redis
 from typing import Optional
 
 # Redis connection
 redis_client: Optional[redis.Redis] = None
+# Blocking client for code running in worker threads (e.g. the rate limiter)
+sync_redis_client: Optional[redis_sync.Redis] = None
 
 CHANNEL_PREFIX = "OMEGAFRAME_JOB_"
 
@@ -24,6 +27,21 @@ async def get_redis_client() -> redis.Redis:
     return redis_client
 
 
+def get_sync_redis_client() -> redis_sync.Redis:
+    """Get or create the blocking Redis client."""
+    global sync_redis_client
+    if sync_redis_client is None:
+        sync_redis_client = redis_sync.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", "6379")),
+            decode_responses=True,
+            db=0,
+            socket_connect_timeout=2,
+            socket_timeout=2,
+        )
+    return sync_redis_client
+
+
 async def close_redis():
     """Close Redis connection."""
     global redis_client
@@ -0,0 +1,315 @@
+"""
+Smart reframing (e.g. 16:9 clips into 9:16 shorts).
+
+Each clip is analyzed once, on a tiny grayscale version of its frames
+sampled a few times per second. Per sample, a saliency energy made of
+edge contrast and frame-to-frame motion is summed per column and per
+row. These profiles don't depend on the output aspect ratio, so one
+analysis serves every export shape. The ingest thumbnail pass writes the
+analysis while it decodes the clip anyway; otherwise it is made on first
+use. Either way it is cached until the clip changes.
+
+A crop track for an output shape is derived from the profiles by
+sliding the crop window over them, smoothing the result and keeping
+only real moves (a dead zone plus short pans between held positions).
+Render graphs apply it with a time-based `crop` expression.
+"""
+import hashlib
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import PROBE_MAX_WORKERS, RENDER_DIR
+from utils.metrics import cache_lookup, ffmpeg_process, timed
+
+ANALYSIS_FPS = 5
+ANALYSIS_VERSION = 1
+GRID_WIDTH = 64  # Analysis frames are GRID_WIDTH cells wide (height follows the aspect ratio)
+MOTION_WEIGHT = 2  # Motion counts double relative to edge contrast
+CENTER_BIAS = 0.15  # Preference for central framing when saliency is flat
+SMOOTH_SAMPLES = 5  # Moving-average window over the per-sample crop positions
+DEAD_ZONE = 0.08  # Fraction of the crop's travel the subject must move before the crop follows
+PAN_SECONDS = 0.6  # Duration of a crop move
+
+REFRAME_DIR = RENDER_DIR / "reframe"
+
+# (path, size, mtime_ns, width, height, out aspect) -> track
+_tracks: Dict[Tuple, Optional[Dict[str, Any]]] = {}
+
+
+def analysis_path(project_id: str, clip_path: str) -> Path:
+    """Where a clip's saliency analysis lives: RENDER_DIR/reframe/<id>/<stem>_<hash>.json"""
+    digest = hashlib.sha1(os.path.abspath(clip_path).encode()).hexdigest()[:8]
+    return REFRAME_DIR / project_id / f"{Path(clip_path).stem}_{digest}.json"
+
+
+def grid_size(info: Dict[str, Any]) -> Tuple[int, int]:
+    """Analysis grid (columns, rows) for a clip's geometry."""
+    height = round(GRID_WIDTH * info["height"] / info["width"]) if info.get("width") else GRID_WIDTH * 9 // 16
+    return GRID_WIDTH, max(height, 8)
+
+
+def saliency_filter(info: Dict[str, Any]) -> str:
+    """Filter chain (after `fps=ANALYSIS_FPS`) producing the gray analysis frames for rawvideo output."""
+    columns, rows = grid_size(info)
+    return f"scale={columns}:{rows}:flags=area,format=gray"
+
+
+def _file_key(clip_path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(clip_path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _profiles(raw: bytes, columns: int, rows: int) -> Tuple[List[List[int]], List[List[int]]]:
+    """Per-sample column and row sums of edge contrast plus motion."""
+    frame_size = columns * rows
+    column_profiles, row_profiles = [], []
+    previous = None
+    for offset in range(0, len(raw) - frame_size + 1, frame_size):
+        frame = raw[offset:offset + frame_size]
+        column_sums = [0] * columns
+        row_sums = [0] * rows
+        for y in range(rows):
+            base = y * columns
+            row_total = 0
+            for x in range(columns):
+                i = base + x
+                value = frame[i]
+                energy = 0
+                if x:
+                    energy += abs(value - frame[i - 1])
+                if y:
+                    energy += abs(value - frame[i - columns])
+                if previous is not None:
+                    energy += MOTION_WEIGHT * abs(value - previous[i])
+                column_sums[x] += energy
+                row_total += energy
+            row_sums[y] = row_total
+        column_profiles.append(column_sums)
+        row_profiles.append(row_sums)
+        previous = frame
+    return column_profiles, row_profiles
+
+
+def store_analysis(project_id: str, clip_path: str, info: Dict[str, Any], raw_path: Path) -> Optional[Dict[str, Any]]:
+    """Turn rawvideo output of saliency_filter() into the cached analysis (removes raw_path)."""
+    key = _file_key(clip_path)
+    try:
+        raw = raw_path.read_bytes()
+    except OSError:
+        return None
+    finally:
+        raw_path.unlink(missing_ok=True)
+    if key is None or not raw:
+        return None
+    columns, rows = grid_size(info)
+    column_profiles, row_profiles = _profiles(raw, columns, rows)
+    analysis = {
+        "version": ANALYSIS_VERSION,
+        "key": key,
+        "fps": ANALYSIS_FPS,
+        "grid": [columns, rows],
+        "columns": column_profiles,
+        "rows": row_profiles,
+    }
+    path = analysis_path(project_id, clip_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(analysis, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write reframe analysis {path}: {e}")
+    return analysis
+
+
+@timed("reframe_analysis")
+def _analyze(project_id: str, clip_path: str, info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Decode the clip at analysis size (used when ingest didn't already produce the analysis)."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-v", "error",
+        "-i", clip_path,
+        "-vf", f"fps={ANALYSIS_FPS},{saliency_filter(info)}",
+        "-f", "rawvideo", "-",
+    ]
+    with ffmpeg_process():
+        proc = subprocess.run(cmd, capture_output=True)
+    if proc.returncode != 0:
+        print(f"FFmpeg error (reframe analysis for {clip_path}): {proc.stderr.decode(errors='replace')}")
+        return None
+    raw_path = analysis_path(project_id, clip_path).with_suffix(".raw")
+    raw_path.parent.mkdir(parents=True, exist_ok=True)
+    raw_path.write_bytes(proc.stdout)
+    return store_analysis(project_id, clip_path, info, raw_path)
+
+
+def load_analysis(project_id: str, clip_path: str, info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A clip's saliency analysis, computed if missing or stale."""
+    try:
+        with open(analysis_path(project_id, clip_path)) as f:
+            analysis = json.load(f)
+        if analysis.get("version") == ANALYSIS_VERSION and analysis.get("key") == _file_key(clip_path):
+            cache_lookup("reframe_analysis", True)
+            return analysis
+    except (OSError, ValueError):
+        pass
+    cache_lookup("reframe_analysis", False)
+    return _analyze(project_id, clip_path, info)
+
+
+def _best_window(profile: List[int], window: int) -> float:
+    """Offset of the most salient window as a fraction of the possible travel (0 = left/top)."""
+    cells = len(profile)
+    travel = cells - window
+    if travel <= 0:
+        return 0.5
+    total = sum(profile)
+    if total == 0:
+        return 0.5
+    sums = [sum(profile[:window])]
+    for start in range(1, travel + 1):
+        sums.append(sums[-1] - profile[start - 1] + profile[start + window - 1])
+    middle = travel / 2
+    scores = [
+        s / total + CENTER_BIAS * (1 - abs(start - middle) / max(middle, 1))
+        for start, s in enumerate(sums)
+    ]
+    return scores.index(max(scores)) / travel
+
+
+def _smooth(values: List[float]) -> List[float]:
+    half = SMOOTH_SAMPLES // 2
+    return [
+        sum(values[max(0, i - half):i + half + 1]) / len(values[max(0, i - half):i + half + 1])
+        for i in range(len(values))
+    ]
+
+
+def _keyframes(positions: List[float], fps: float) -> List[Tuple[float, float]]:
+    """Reduce per-sample positions to held positions joined by short pans."""
+    keyframes = [(0.0, positions[0])]
+    for i, position in enumerate(positions[1:], start=1):
+        time, current = i / fps, keyframes[-1][1]
+        if abs(position - current) <= DEAD_ZONE:
+            continue
+        pan_start = time - PAN_SECONDS
+        if pan_start > keyframes[-1][0]:
+            keyframes.append((round(pan_start, 3), current))
+        keyframes.append((round(time, 3), position))
+    return keyframes
+
+
+def crop_track(
+    project_id: str,
+    clip_path: str,
+    info: Optional[Dict[str, Any]],
+    out_width: int,
+    out_height: int,
+) -> Optional[Dict[str, Any]]:
+    """
+    Crop track reframing a clip to the output's aspect ratio.
+
+    Args:
+        project_id: Project ID (analysis is stored per project)
+        clip_path: Local path of the clip
+        info: The clip's probe data
+        out_width: Output width
+        out_height: Output height
+
+    Returns:
+        {"w", "h", "keyframes": [[time, x, y], ...]} in source pixels and
+        source time, or None if the clip already has the output's aspect
+        ratio (or can't be analyzed)
+    """
+    if not info or not info.get("width") or not info.get("height"):
+        return None
+    src_w, src_h = info["width"], info["height"]
+    aspect = out_width / out_height
+    if abs(src_w / src_h - aspect) < 0.01:
+        return None
+    key = (os.path.abspath(clip_path), *(_file_key(clip_path) or []), src_w, src_h, round(aspect, 4))
+    if key in _tracks:
+        return _tracks[key]
+
+    if src_w / src_h > aspect:
+        crop_w, crop_h = int(src_h * aspect) // 2 * 2, src_h
+        axis, travel = "x", src_w - crop_w
+    else:
+        crop_w, crop_h = src_w, int(src_w / aspect) // 2 * 2
+        axis, travel = "y", src_h - crop_h
+
+    analysis = load_analysis(project_id, clip_path, info)
+    profiles = (analysis or {}).get("columns" if axis == "x" else "rows") or []
+    if profiles:
+        cells = len(profiles[0])
+        window = max(1, round(cells * (crop_w / src_w if axis == "x" else crop_h / src_h)))
+        positions = _smooth([_best_window(p, window) for p in profiles])
+        keyframes = _keyframes(positions, analysis["fps"])
+    else:
+        keyframes = [(0.0, 0.5)]  # Unanalyzable: center crop
+
+    def offset(fraction: float) -> int:
+        return int(fraction * travel) // 2 * 2
+
+    track = {
+        "w": crop_w,
+        "h": crop_h,
+        "keyframes": [
+            [t, offset(f), 0] if axis == "x" else [t, 0, offset(f)]
+            for t, f in keyframes
+        ],
+    }
+    _tracks[key] = track
+    return track
+
+
+def crop_tracks(
+    project_id: str,
+    clips: List[Tuple[str, Optional[Dict[str, Any]]]],
+    out_width: int,
+    out_height: int,
+) -> List[Optional[Dict[str, Any]]]:
+    """crop_track() for several (path, probe) clips concurrently."""
+    if not clips:
+        return []
+    with ThreadPoolExecutor(max_workers=min(PROBE_MAX_WORKERS, len(clips))) as pool:
+        return list(pool.map(lambda c: crop_track(project_id, c[0], c[1], out_width, out_height), clips))
+
+
+def _position_expression(points: List[Tuple[float, int]]) -> str:
+    """Piecewise-linear expression over t through (time, value) points."""
+    if len({v for _, v in points}) == 1:
+        return str(points[0][1])
+    expression = str(points[-1][1])
+    for (t0, v0), (t1, v1) in reversed(list(zip(points, points[1:]))):
+        if v0 == v1:
+            segment = str(v0)
+        else:
+            segment = f"{v0}+{v1 - v0}*(t-{t0:.3f})/{t1 - t0:.3f}"
+        expression = f"if(lt(t,{t1:.3f}),{segment},{expression})"
+    return expression
+
+
+def crop_filter(track: Dict[str, Any], start: float = 0.0, speed: float = 1.0) -> str:
+    """`crop` filter applying a track to input that starts `start` seconds into the clip, played at `speed`."""
+    keyframes = track["keyframes"]
+    # Position at the trim point, then every later keyframe relative to it
+    before = [k for k in keyframes if k[0] <= start]
+    after = [k for k in keyframes if k[0] > start]
+    first = before[-1] if before else keyframes[0]
+    if after and before:
+        t0, x0, y0 = first
+        t1, x1, y1 = after[0]
+        ratio = (start - t0) / (t1 - t0)
+        first = [t0, round(x0 + (x1 - x0) * ratio), round(y0 + (y1 - y0) * ratio)]
+    points = [(0.0, first[1], first[2])] + [((t - start) / speed, x, y) for t, x, y in after]
+    x = _position_expression([(t, x) for t, x, _ in points])
+    y = _position_expression([(t, y) for t, _, y in points])
+    return f"crop=w={track['w']}:h={track['h']}:x='{x}':y='{y}'"
@@ -0,0 +1,181 @@
+"""
+Render deduplication.
+
+Renders are identified by a key hashed from everything that affects the
+output: each clip's path, size and mtime, its trims and transition, the
+narration track, the render profile(s), the soundtrack mix and the
+narration alignment. Identical requests that arrive while a render is
+running attach to it (single-flight) instead of starting another encode,
+and finished renders are remembered in a small sidecar
+(`RENDER_DIR/<project>.render.json`) so an unchanged timeline returns the
+existing output immediately.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import RENDER_DIR
+from services.render_profiles import RenderProfile, select_encoder
+from services.storage_gc import note_access
+from utils.metrics import cache_lookup
+
+# Bump when graph construction changes in a way that should invalidate old renders
+RENDER_CACHE_VERSION = 2
+
+
+def _file_fingerprint(path: str) -> Optional[List[Any]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+def render_key(
+    project_id: str,
+    clips: List[Dict[str, Any]],
+    audio_path: str,
+    profile: RenderProfile,
+    captions: Optional[str] = None,
+    mix: Optional[Dict[str, Any]] = None,
+    alignment: Optional[Dict[str, Any]] = None,
+    outputs: Optional[List[RenderProfile]] = None,
+) -> str:
+    """
+    Hash the inputs of a render.
+
+    Args:
+        project_id: Project the render belongs to (its output path and URL are per project)
+        clips: Resolved timeline clips ({"path", "start", "end", "transition"})
+        audio_path: Narration track (may not exist)
+        profile: Render profile
+        captions: Digest of burned-in captions, if any
+        mix: AudioMix.cache_key() of the soundtrack mix
+        alignment: AlignmentSpec.to_dict() if the clips are fit to the narration
+        outputs: Extra profiles rendered by the same pass (multi-output export)
+
+    Returns:
+        Hex digest identifying the render output
+    """
+    payload = {
+        "version": RENDER_CACHE_VERSION,
+        "project_id": project_id,
+        "clips": [
+            {
+                "file": _file_fingerprint(clip["path"]),
+                "start": float(clip.get("start") or 0.0),
+                "end": clip.get("end"),
+                "transition": clip.get("transition"),
+                "scene": clip.get("scene"),
+                "still": clip.get("still"),
+            }
+            for clip in clips
+        ],
+        "audio": _file_fingerprint(audio_path),
+        "profile": asdict(profile),
+        "encoder": select_encoder(),
+        "captions": captions,
+        "mix": mix,
+        "alignment": alignment,
+        "outputs": [asdict(p) for p in outputs or []],
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:24]
+
+
+def _record_path(project_id: str) -> Path:
+    return RENDER_DIR / f"{project_id}.render.json"
+
+
+def load_cached_render(project_id: str, key: str) -> Optional[Dict[str, Any]]:
+    """Return the stored result if the project's current output was rendered from `key`."""
+    try:
+        with open(_record_path(project_id)) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        cache_lookup("render_result", False)
+        return None
+    variants = record.get("variants") or {}
+    hit = (
+        record.get("key") == key
+        and _file_fingerprint(record.get("output", "")) == record.get("output_fingerprint")
+        and all(_file_fingerprint(path) == fingerprint for path, fingerprint in variants.items())
+    )
+    cache_lookup("render_result", hit)
+    if not hit:
+        return None
+    for path in [record["output"], *variants]:
+        note_access(path)
+    return record.get("result")
+
+
+def store_cached_render(
+    project_id: str,
+    key: str,
+    output_path: str,
+    result: Dict[str, Any],
+    variant_paths: Optional[List[str]] = None,
+) -> None:
+    """Remember which inputs produced the project's current output (and its multi-output variants)."""
+    record = {
+        "key": key,
+        "output": output_path,
+        "output_fingerprint": _file_fingerprint(output_path),
+        "variants": {path: _file_fingerprint(path) for path in variant_paths or []},
+        "result": result,
+    }
+    record_path = _record_path(project_id)
+    tmp_path = record_path.with_name(f".{record_path.name}.tmp")
+    try:
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, record_path)
+    except OSError as e:
+        print(f"Warning: Could not write render record {record_path}: {e}")
+
+
+class SingleFlight:
+    """Run a function once per key at a time; concurrent callers with the same key share the result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (result, shared) - shared is True if this call attached to an in-flight run
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+render_flight = SingleFlight()
@@ -0,0 +1,382 @@
+"""
+FFmpeg command builders for render plans.
+
+Shared by final renders and the proxy/preview tier so every segment that
+is meant to be concatenated is encoded with identical parameters.
+"""
+from dataclasses import replace
+
+from services.audio_mix_service import mix_graph
+from services.reframe_service import crop_filter
+from services.render_planner import ClipPlan, RenderPlan, TargetFormat, TransitionPlan
+from services.render_profiles import SOFTWARE_ENCODER, RenderProfile, select_encoder, video_encoder_args
+from utils.ffmpeg_utils import escape_filter_path
+
+# ffprobe's H.264 profile names -> libx264 -profile:v values
+X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+
+def _clip_input_args(clip: ClipPlan) -> list[str]:
+    """Input options for a clip; trims are applied as input seeks so FFmpeg skips undecoded footage."""
+    args = []
+    if clip.start > 0:
+        args += ["-ss", f"{clip.start:.3f}"]
+    if clip.end is not None and clip.source_span is not None:
+        args += ["-t", f"{clip.source_span:.3f}"]
+    return args + ["-i", clip.path]
+
+
+def _retime_filters(clip: ClipPlan) -> str:
+    """Speed change, applied first so every later filter (including the crop track) sees output time."""
+    return f"setpts=(PTS-STARTPTS)/{clip.speed}," if clip.speed != 1.0 else ""
+
+
+def _geometry_filters(clip: ClipPlan, target: TargetFormat) -> str:
+    """Fit the clip into the target frame: letterbox, or follow its crop track when reframing."""
+    w, h = target.width, target.height
+    if clip.crop:
+        # Reframed: the crop window follows the clip's subject, then fills the frame
+        return f"{crop_filter(clip.crop, clip.start, clip.speed)},scale={w}:{h},setsar=1,"
+    return (
+        f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+        f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+    )
+
+
+def _finish_filters(clip: ClipPlan, target: TargetFormat, label: str) -> str:
+    """Frame rate, pixel format and freeze-frame hold, producing [label]."""
+    video = f"fps={target.fps},format={target.pix_fmt},"
+    if clip.hold > 0:
+        video += f"tpad=stop_mode=clone:stop_duration={clip.hold:.3f},"
+    return video + f"setpts=PTS-STARTPTS[{label}]"
+
+
+def _audio_filters(clip: ClipPlan, target: TargetFormat, input_index: int, label: str) -> str:
+    """Bring one clip's audio (or silence for clips without any) to the target format as [a<label>]."""
+    duration = f"{clip.duration:.3f}" if clip.duration is not None else None
+    if not clip.has_audio:
+        return f"anullsrc=r={target.sample_rate}:cl=stereo,atrim=duration={duration or 0}[a{label}]"
+    audio = (
+        f"[{input_index}:a]aresample={target.sample_rate},"
+        f"aformat=sample_fmts=fltp:channel_layouts=stereo,asetpts=PTS-STARTPTS"
+    )
+    if clip.speed != 1.0:
+        audio += f",atempo={clip.speed}"  # Pitch-preserving
+    if duration:
+        # Pad short audio and cut long audio (or atempo's overshoot) to the video's
+        # length, so segments keep A/V in sync when concatenated
+        audio += f",apad=whole_dur={duration},atrim=duration={duration}"
+    return audio + f"[a{label}]"
+
+
+def _conform_filters(clip: ClipPlan, target: TargetFormat, input_index: int, label: str) -> list[str]:
+    """Filter chains that bring one clip to the target format, producing [v<label>] and [a<label>]."""
+    video = (
+        f"[{input_index}:v]{_retime_filters(clip)}{_geometry_filters(clip, target)}"
+        f"{_finish_filters(clip, target, f'v{label}')}"
+    )
+    return [video, _audio_filters(clip, target, input_index, label)]
+
+
+def _encode_args(target: TargetFormat, profile: RenderProfile, segment: bool = True) -> list[str]:
+    """
+    Encoder options producing segments that can be stream-copied alongside the target clips.
+
+    Segments get the copied clips' H.264 profile and level (libx264 only), so
+    their parameter sets have a chance to match; whole-timeline encodes
+    (`segment=False`) keep the encoder's own choice.
+    """
+    args = video_encoder_args(profile, target.fps)
+    if segment and select_encoder() == SOFTWARE_ENCODER:
+        if target.vprofile in X264_PROFILES:
+            args += ["-profile:v", X264_PROFILES[target.vprofile]]
+        if target.vlevel:
+            args += ["-level", f"{target.vlevel / 10:g}"]
+    args += [
+        "-pix_fmt", target.pix_fmt,
+        "-c:a", "aac",
+        "-b:a", profile.audio_bitrate,
+        "-ar", str(target.sample_rate),
+        "-ac", str(target.channels),
+    ]
+    if target.timescale:
+        args += ["-video_track_timescale", str(target.timescale)]
+    return args
+
+
+def build_conform_command(
+    clip: ClipPlan,
+    target: TargetFormat,
+    output_path: str,
+    profile: RenderProfile,
+    extra_args: list[str] | None = None,
+) -> list[str]:
+    """Build FFmpeg command that conforms a single clip to the target format."""
+    return [
+        "ffmpeg",
+        "-y",
+        *_clip_input_args(clip),
+        "-filter_complex", ";".join(_conform_filters(clip, target, 0, "0")),
+        "-map", "[v0]",
+        "-map", "[a0]",
+        *_encode_args(target, profile),
+        *(extra_args or []),
+        output_path,
+    ]
+
+
+def _timeline_filters(
+    plan: RenderPlan,
+    tag: str = "",
+    video: bool = True,
+    audio: bool = True,
+) -> tuple[list[str], str | None, str | None]:
+    """
+    Join the conformed clips [v<tag><i>][a<tag><i>] into one timeline.
+
+    Without transitions this is a single n-way concat. With transitions the
+    clips are folded left to right: xfade/acrossfade where a transition is
+    requested (offset = timeline length so far minus the fade), a two-way
+    concat elsewhere. `video`/`audio` limit the join to one kind of stream
+    (multi-output renders join the audio once and the video per output).
+    Returns (filters, video label, audio label).
+    """
+    n = len(plan.clips)
+    kinds = (["v"] if video else []) + (["a"] if audio else [])
+    media = f"v={int(video)}:a={int(audio)}"
+    if not plan.transitions:
+        concat_inputs = "".join(f"[{k}{tag}{i}]" for i in range(n) for k in kinds)
+        outputs = "".join(f"[out{k}{tag}]" for k in kinds)
+        return (
+            [f"{concat_inputs}concat=n={n}:{media}{outputs}"],
+            f"outv{tag}" if video else None,
+            f"outa{tag}" if audio else None,
+        )
+
+    parts = []
+    current = {k: f"{k}{tag}0" for k in kinds}
+    length = plan.clips[0].duration or 0.0
+    for i in range(1, n):
+        transition = plan.transition_before(i)
+        if transition:
+            offset = max(length - transition.duration, 0.0)
+            if video:
+                # concat outputs the AV_TIME_BASE timebase; xfade needs both inputs on the same one
+                parts.append(f"[{current['v']}]settb=AVTB[vm{tag}{i}]")
+                parts.append(f"[v{tag}{i}]settb=AVTB[vn{tag}{i}]")
+                parts.append(
+                    f"[vm{tag}{i}][vn{tag}{i}]xfade=transition={transition.xfade}:"
+                    f"duration={transition.duration}:offset={offset:.3f}[vx{tag}{i}]"
+                )
+            if audio:
+                parts.append(f"[{current['a']}][a{tag}{i}]acrossfade=d={transition.duration}[ax{tag}{i}]")
+            length += (plan.clips[i].duration or 0.0) - transition.duration
+        else:
+            pair = "".join(f"[{current[k]}]" for k in kinds) + "".join(f"[{k}{tag}{i}]" for k in kinds)
+            parts.append(f"{pair}concat=n=2:{media}" + "".join(f"[{k}x{tag}{i}]" for k in kinds))
+            length += plan.clips[i].duration or 0.0
+        current = {k: f"{k}x{tag}{i}" for k in kinds}
+    return parts, current.get("v"), current.get("a")
+
+
+def build_single_pass_command(plan: RenderPlan, output_path: str) -> list[str]:
+    """Build FFmpeg command that conforms and joins every clip (with transitions) in one filter graph."""
+    inputs = []
+    filter_complex_parts = []
+    for i, clip in enumerate(plan.clips):
+        inputs += _clip_input_args(clip)
+        filter_complex_parts += _conform_filters(clip, plan.target, i, str(i))
+    
+    timeline_parts, video_label, audio_label = _timeline_filters(plan)
+    filter_complex_parts += timeline_parts
+    if plan.subtitles:
+        filter_complex_parts.append(f"[{video_label}]ass=filename='{escape_filter_path(plan.subtitles)}'[subv]")
+        video_label = "subv"
+    if plan.audio_mix:
+        mix_inputs, mix_filters, audio_label = mix_graph(
+            plan, plan.audio_mix, audio_label, len(plan.clips), plan.target.sample_rate
+        )
+        inputs += mix_inputs
+        filter_complex_parts += mix_filters
+    
+    return [
+        "ffmpeg",
+        "-y",
+        *inputs,
+        "-filter_complex", ";".join(filter_complex_parts),
+        "-map", f"[{video_label}]",
+        "-map", f"[{audio_label}]",
+        *_encode_args(plan.target, plan.profile, segment=False),
+        output_path,
+    ]
+
+
+def build_multi_output_command(plans: list[RenderPlan], output_paths: list[str]) -> list[str]:
+    """
+    Build one FFmpeg command rendering the same timeline into several outputs.
+
+    `plans` are plans of one timeline for different profiles (same clips,
+    trims, retiming and transitions). Every clip is decoded and retimed
+    once, then split into a geometry/frame-rate branch per output; the
+    audio is conformed, joined and mixed once and split to each encoder.
+    """
+    base, count = plans[0], len(plans)
+    inputs = []
+    filter_complex_parts = []
+    for i, clip in enumerate(base.clips):
+        inputs += _clip_input_args(clip)
+        branches = "".join(f"[d{k}_{i}]" for k in range(count))
+        filter_complex_parts.append(f"[{i}:v]{_retime_filters(clip)}split={count}{branches}")
+        for k, plan in enumerate(plans):
+            branch_clip = plan.clips[i]  # Same timing, but its own crop track for this output's shape
+            filter_complex_parts.append(
+                f"[d{k}_{i}]{_geometry_filters(branch_clip, plan.target)}"
+                f"{_finish_filters(branch_clip, plan.target, f'v{k}_{i}')}"
+            )
+        filter_complex_parts.append(_audio_filters(clip, base.target, i, str(i)))
+
+    audio_parts, _, audio_label = _timeline_filters(base, video=False)
+    filter_complex_parts += audio_parts
+    if base.audio_mix:
+        mix_inputs, mix_filters, audio_label = mix_graph(
+            base, base.audio_mix, audio_label, len(base.clips), base.target.sample_rate
+        )
+        inputs += mix_inputs
+        filter_complex_parts += mix_filters
+    filter_complex_parts.append(f"[{audio_label}]asplit={count}" + "".join(f"[aout{k}]" for k in range(count)))
+
+    outputs = []
+    for k, (plan, output_path) in enumerate(zip(plans, output_paths)):
+        video_parts, video_label, _ = _timeline_filters(plan, tag=f"{k}_", audio=False)
+        filter_complex_parts += video_parts
+        if plan.subtitles:
+            filter_complex_parts.append(
+                f"[{video_label}]ass=filename='{escape_filter_path(plan.subtitles)}'[subv{k}]"
+            )
+            video_label = f"subv{k}"
+        outputs += [
+            "-map", f"[{video_label}]",
+            "-map", f"[aout{k}]",
+            *_encode_args(plan.target, plan.profile, segment=False),
+            output_path,
+        ]
+
+    return [
+        "ffmpeg",
+        "-y",
+        *inputs,
+        "-filter_complex", ";".join(filter_complex_parts),
+        *outputs,
+    ]
+
+
+def build_mix_command(plan: RenderPlan, video_path: str, output_path: str, extra_args: list[str] | None = None) -> list[str]:
+    """
+    Build FFmpeg command that mixes plan.audio_mix onto an assembled timeline, stream-copying its video.
+
+    The clip audio bed is joined again from the source clips, as the single
+    pass does, rather than taken from the timeline: its conformed segments'
+    audio has already been through one AAC encode.
+    """
+    inputs = ["-i", video_path]
+    filter_complex_parts = []
+    if plan.audio_mix.clip_audio:
+        for i, clip in enumerate(plan.clips):
+            inputs += _clip_input_args(clip)
+            filter_complex_parts.append(_audio_filters(clip, plan.target, i + 1, str(i)))
+        audio_parts, _, bed_label = _timeline_filters(plan, video=False)
+        filter_complex_parts += audio_parts
+        next_input = 1 + len(plan.clips)
+    else:
+        bed_label, next_input = "0:a", 1  # Muted by the mix; only sets the soundtrack's length
+    mix_inputs, mix_filters, audio_label = mix_graph(
+        plan, plan.audio_mix, bed_label, next_input, plan.target.sample_rate
+    )
+    return [
+        "ffmpeg",
+        "-y",
+        *inputs,
+        *mix_inputs,
+        "-filter_complex", ";".join(filter_complex_parts + mix_filters),
+        "-map", "0:v",
+        "-map", f"[{audio_label}]",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-b:a", plan.profile.audio_bitrate,
+        "-ar", str(plan.target.sample_rate),
+        "-ac", str(plan.target.channels),
+        *(extra_args or []),
+        output_path,
+    ]
+
+
+def build_still_command(
+    image_path: str,
+    video_filter: str,
+    duration: float,
+    target: TargetFormat,
+    profile: RenderProfile,
+    output_path: str,
+    extra_args: list[str] | None = None,
+) -> list[str]:
+    """Build FFmpeg command rendering a still image through `video_filter` into a target-format clip with silent audio."""
+    return [
+        "ffmpeg",
+        "-y",
+        "-i", image_path,
+        "-f", "lavfi", "-i", f"anullsrc=r={target.sample_rate}:cl=stereo",
+        "-filter_complex", f"[0:v]{video_filter}[v]",
+        "-map", "[v]",
+        "-map", "1:a",
+        "-t", f"{duration:.3f}",
+        *_encode_args(target, profile),
+        *(extra_args or []),
+        output_path,
+    ]
+
+
+def build_transition_command(
+    plan: RenderPlan,
+    transition: TransitionPlan,
+    outgoing: ClipPlan,
+    incoming: ClipPlan,
+    output_path: str,
+) -> list[str]:
+    """
+    Build FFmpeg command rendering only the region around one transition.
+
+    `outgoing`/`incoming` describe the untrimmed splice sources (original
+    clips or conformed intermediates). The region runs from the outgoing
+    clip's tail keyframe to the incoming clip's head keyframe, so it slots
+    between the stream-copied bodies of both clips. B-frames are disabled
+    so the region's timestamps start exactly at zero.
+    """
+    tail = replace(outgoing, start=transition.tail_start, end=None)
+    head = replace(incoming, start=0.0, end=transition.head_end)
+    offset = max((tail.duration or 0.0) - transition.duration, 0.0)
+    filter_complex_parts = [
+        *_conform_filters(tail, plan.target, 0, "0"),
+        *_conform_filters(head, plan.target, 1, "1"),
+        f"[v0][v1]xfade=transition={transition.xfade}:duration={transition.duration}:offset={offset:.3f}[outv]",
+        f"[a0][a1]acrossfade=d={transition.duration}[outa]",
+    ]
+    return [
+        "ffmpeg",
+        "-y",
+        *_clip_input_args(tail),
+        *_clip_input_args(head),
+        "-filter_complex", ";".join(filter_complex_parts),
+        "-map", "[outv]",
+        "-map", "[outa]",
+        *_encode_args(plan.target, plan.profile),
+        "-bf", "0",  # dts == pts, so the region splices cleanly after a copied body
+        output_path,
+    ]
@@ -0,0 +1,271 @@
+"""
+Render jobs shared by the API (dispatcher) and render workers.
+
+In render farm mode (RENDER_DISPATCH) the API process doesn't run FFmpeg.
+/assemble and /assemble/preview enqueue a job in Redis and wait for it
+(or return its id straight away), and `python worker.py` processes pop
+jobs, render them with their own concurrency limit and publish progress
+through job_publish, which the API's job event listener forwards to the
+/ws/job/<id> WebSockets. Workers can run on the API box or on others that
+share the projects and render storage.
+
+Redis layout:
+- OMEGAFRAME_RENDER_QUEUE: queued job ids (LPUSH in, BRPOPLPUSH out, oldest first)
+- OMEGAFRAME_RENDER_JOB_<id>: hash with kind, request, status, progress,
+  worker, attempts, result or error and timestamps
+- OMEGAFRAME_RENDER_PROCESSING_<worker>: job ids a worker has taken; put
+  back on the queue if the worker stops heartbeating
+- OMEGAFRAME_RENDER_WORKERS: sorted set of worker ids by last heartbeat
+  (Redis server time, so hosts with skewed clocks agree on who is alive)
+- OMEGAFRAME_RENDER_WORKER_<worker>: hash with the worker's capacity and
+  running jobs (expires when heartbeats stop)
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from config import RENDER_JOB_TIMEOUT, RENDER_JOB_TTL, RENDER_WORKER_HEARTBEAT
+from services.assemble_service import assemble_preview, assemble_video
+from services.job_publish import publish_status
+from services.redis_client import get_redis_client
+
+QUEUE_KEY = "OMEGAFRAME_RENDER_QUEUE"
+JOB_KEY_PREFIX = "OMEGAFRAME_RENDER_JOB_"
+PROCESSING_KEY_PREFIX = "OMEGAFRAME_RENDER_PROCESSING_"
+WORKERS_KEY = "OMEGAFRAME_RENDER_WORKERS"
+WORKER_KEY_PREFIX = "OMEGAFRAME_RENDER_WORKER_"
+
+# Job kinds
+RENDER_ASSEMBLE = "assemble"
+RENDER_PREVIEW = "preview"
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+QUEUE_FULL_RETRY_AFTER = 30  # Retry-After (seconds) when RENDER_QUEUE_MAX is reached
+WAIT_POLL_INTERVAL = 0.5  # Seconds between job status checks of a waiting request
+WORKER_TIMEOUT = 3 * RENDER_WORKER_HEARTBEAT  # Missed heartbeats before a worker counts as dead
+
+# Put a dead worker's jobs back at the consuming end of the queue (the
+# oldest one it took is consumed first again) and forget the worker,
+# atomically so two reapers can't both requeue a job. BRPOPLPUSH leaves the
+# newest job at the head of the processing list.
+_REQUEUE_SCRIPT = """
+local count = 0
+while true do
+    local job = redis.call('LPOP', KEYS[1])
+    if not job then break end
+    redis.call('RPUSH', KEYS[2], job)
+    count = count + 1
+end
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('DEL', KEYS[4])
+return count
+"""
+
+
+def job_key(job_id: str) -> str:
+    return f"{JOB_KEY_PREFIX}{job_id}"
+
+
+def processing_key(worker_id: str) -> str:
+    return f"{PROCESSING_KEY_PREFIX}{worker_id}"
+
+
+def worker_key(worker_id: str) -> str:
+    return f"{WORKER_KEY_PREFIX}{worker_id}"
+
+
+async def redis_time(redis) -> float:
+    """Redis server time in seconds: one clock for every worker and API host."""
+    seconds, microseconds = await redis.time()
+    return seconds + microseconds / 1_000_000
+
+
+def run_render(kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a render in this process.
+
+    Args:
+        kind: RENDER_ASSEMBLE or RENDER_PREVIEW
+        request: AssembleRequest fields (as dumped by the API)
+
+    Returns:
+        The assemble_video / assemble_preview result
+    """
+    if kind == RENDER_PREVIEW:
+        return assemble_preview(
+            request["projectId"],
+            request.get("clips"),
+            request.get("audio"),
+            request.get("align"),
+        )
+    if kind == RENDER_ASSEMBLE:
+        return assemble_video(
+            request["projectId"],
+            request.get("clips"),
+            request.get("profile") or "standard",
+            streaming=request.get("streaming"),
+            upload_streaming=bool(request.get("uploadStreaming")),
+            captions=request.get("captions"),
+            audio=request.get("audio"),
+            align=request.get("align"),
+            outputs=request.get("outputs"),
+        )
+    raise ValueError(f"Unknown render job kind: {kind}")
+
+
+def _decode_job(job_id: str, raw: Dict[str, str]) -> Dict[str, Any]:
+    job: Dict[str, Any] = {
+        "id": job_id,
+        "kind": raw.get("kind"),
+        "status": raw.get("status"),
+        "progress": int(raw.get("progress") or 0),
+        "message": raw.get("message", ""),
+        "worker": raw.get("worker") or None,
+        "attempts": int(raw.get("attempts") or 0),
+    }
+    for field in ("created_at", "started_at", "finished_at"):
+        job[field] = float(raw[field]) if raw.get(field) else None
+    if raw.get("result"):
+        job["result"] = json.loads(raw["result"])
+    if raw.get("error"):
+        job["error"] = raw["error"]
+    return job
+
+
+async def queue_depth() -> int:
+    """Jobs waiting for a worker."""
+    redis = await get_redis_client()
+    return await redis.llen(QUEUE_KEY)
+
+
+async def enqueue_render(kind: str, request: Dict[str, Any], job_id: Optional[str] = None) -> str:
+    """
+    Queue a render for the workers.
+
+    Args:
+        kind: RENDER_ASSEMBLE or RENDER_PREVIEW
+        request: AssembleRequest fields
+        job_id: Id to use (lets a client subscribe to /ws/job/<id> before
+            posting); a new one is generated if omitted
+
+    Returns:
+        The job id
+    """
+    job_id = job_id or uuid.uuid4().hex
+    redis = await get_redis_client()
+    key = job_key(job_id)
+    if await redis.exists(key):
+        raise ValueError(f"Render job {job_id} already exists")
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(key, mapping={
+        "kind": kind,
+        "request": json.dumps(request),
+        "status": QUEUED,
+        "progress": 0,
+        "attempts": 0,
+        "created_at": time.time(),
+    })
+    pipe.expire(key, RENDER_JOB_TTL)
+    pipe.lpush(QUEUE_KEY, job_id)
+    await pipe.execute()
+    await publish_status(job_id, QUEUED, "Waiting for a render worker...")
+    return job_id
+
+
+async def get_render_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """A render job's status, progress and (once finished) result or error; None if unknown or expired."""
+    redis = await get_redis_client()
+    raw = await redis.hgetall(job_key(job_id))
+    return _decode_job(job_id, raw) if raw else None
+
+
+async def wait_for_render(job_id: str, timeout: float = RENDER_JOB_TIMEOUT) -> Dict[str, Any]:
+    """
+    Wait (without holding a thread) until a render job finishes.
+
+    Returns:
+        The finished job (see get_render_job)
+
+    Raises:
+        TimeoutError: if it hasn't finished within `timeout` seconds
+        KeyError: if the job record is gone
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await get_render_job(job_id)
+        if job is None:
+            raise KeyError(f"Render job {job_id} not found")
+        if job["status"] in (COMPLETED, FAILED):
+            return job
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Render job {job_id} still {job['status']} after {timeout:.0f}s")
+        await asyncio.sleep(WAIT_POLL_INTERVAL)
+
+
+async def requeue_worker(worker_id: str) -> int:
+    """
+    Put a worker's taken jobs back at the front of the queue and forget the worker.
+
+    Returns:
+        Number of jobs requeued
+    """
+    redis = await get_redis_client()
+    return await redis.eval(
+        _REQUEUE_SCRIPT, 4, processing_key(worker_id), QUEUE_KEY, WORKERS_KEY, worker_key(worker_id), worker_id
+    )
+
+
+async def requeue_dead_workers() -> int:
+    """
+    Put jobs held by workers that stopped heartbeating back on the queue.
+
+    Returns:
+        Number of jobs requeued
+    """
+    redis = await get_redis_client()
+    dead = await redis.zrangebyscore(WORKERS_KEY, "-inf", await redis_time(redis) - WORKER_TIMEOUT)
+    requeued = 0
+    for worker_id in dead:
+        count = await requeue_worker(worker_id)
+        if count:
+            print(f"♻️ Requeued {count} render job(s) from dead worker {worker_id}")
+        requeued += count
+    return requeued
+
+
+async def list_workers() -> List[Dict[str, Any]]:
+    """Live render workers with their capacity and running jobs."""
+    redis = await get_redis_client()
+    cutoff = await redis_time(redis) - WORKER_TIMEOUT
+    workers = []
+    for worker_id, heartbeat in await redis.zrange(WORKERS_KEY, 0, -1, withscores=True):
+        if heartbeat < cutoff:
+            continue
+        raw = await redis.hgetall(worker_key(worker_id))
+        if not raw:
+            continue
+        worker = json.loads(raw.get("info") or "{}")
+        worker.update(id=worker_id, heartbeat=heartbeat, jobs=json.loads(raw.get("jobs") or "[]"))
+        workers.append(worker)
+    return workers
+
+
+async def farm_status() -> Dict[str, Any]:
+    """Queue depth and the live workers' total and free render slots."""
+    workers = await list_workers()
+    slots = sum(w.get("slots", 0) for w in workers)
+    active = sum(len(w["jobs"]) for w in workers)
+    return {
+        "queued": await queue_depth(),
+        "slots": slots,
+        "active": active,
+        "free": max(0, slots - active),
+        "workers": workers,
+    }
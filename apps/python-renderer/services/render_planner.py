@@ -0,0 +1,567 @@
+"""
+Render planner.
+
+Turns a list of timeline clips into an explicit execution plan for
+`assemble_video`. Using probe metadata it decides, per clip, whether the
+clip can be stream-copied into the output or must be conformed (trimmed,
+scaled, frame-rate converted, given a silent audio track) to the shared
+target format, and picks the overall strategy that transcodes the least.
+Given the narration's length it can also retime the clips (trims, speed
+changes, freeze frames) so the timeline covers the narration exactly;
+see services/alignment_planner.py. Profiles that crop instead of
+letterboxing get a smart-reframe crop track per clip
+(services/reframe_service.py).
+"""
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+from services.alignment_planner import AlignmentSpec, align_clips
+from services.ffmpeg_capabilities import has_filter
+from services.probe_service import get_duration, probe_many, probe_keyframes
+from services.reframe_service import crop_tracks
+from services.render_profiles import SOFTWARE_ENCODER, RenderProfile, get_profile, select_encoder
+
+# Strategies, from cheapest to most expensive
+STRATEGY_CONCAT_COPY = "concat_copy"  # every clip stream-copied via the concat demuxer
+STRATEGY_SEGMENT_CONFORM = "segment_conform"  # conform only mismatched clips, then concat copy
+STRATEGY_SPLICE = "splice"  # stream-copy clip bodies, re-encode only transition regions
+STRATEGY_SINGLE_PASS = "single_pass"  # one filter graph re-encoding the whole timeline
+
+ACTION_COPY = "copy"
+ACTION_CONFORM = "conform"
+
+COPYABLE_VIDEO_CODECS = ("h264",)
+COPYABLE_AUDIO_CODECS = ("aac",)
+# (clips' extradata hash, profile, encoder) whose re-encoded segments came out with other parameter sets
+_unmatched_streams: set = set()
+
+ALIGNMENT_PASSES = 10  # Re-fits of an aligned timeline to the transition durations the planner keeps
+AV_DURATION_TOLERANCE = 0.1  # Seconds audio may run past or stop short of the video (encoder delay) in a copied clip
+
+# Timeline transition names -> FFmpeg xfade transitions
+TRANSITIONS = {
+    "crossfade": "fade",
+    "dissolve": "dissolve",
+    "dip_to_black": "fadeblack",
+    "dip_to_white": "fadewhite",
+    "wipe_left": "wipeleft",
+    "wipe_right": "wiperight",
+    "wipe_up": "wipeup",
+    "wipe_down": "wipedown",
+    "slide_left": "slideleft",
+    "slide_right": "slideright",
+}
+
+
+@dataclass
+class TargetFormat:
+    """The format every segment of the output timeline must share."""
+    width: int = 1920
+    height: int = 1080
+    fps: float = 30.0
+    pix_fmt: str = "yuv420p"
+    vcodec: str = "h264"
+    # H.264 stream parameters of the copied clips (None = not derived from clips)
+    vprofile: Optional[str] = None
+    vlevel: Optional[int] = None
+    extradata_hash: Optional[str] = None
+    acodec: str = "aac"
+    sample_rate: int = 48000
+    channels: int = 2
+    timescale: Optional[int] = None
+    fit: str = "pad"  # How clips of another aspect ratio fill the frame: "pad" or "crop"
+
+    @property
+    def resolution(self) -> str:
+        return f"{self.width}x{self.height}"
+
+
+@dataclass
+class ClipPlan:
+    """What to do with one clip of the timeline."""
+    index: int
+    path: str
+    start: float = 0.0
+    end: Optional[float] = None
+    source_duration: Optional[float] = None
+    has_audio: bool = True
+    speed: float = 1.0  # Playback speed (retimed to fit the narration)
+    hold: float = 0.0  # Seconds the last frame is held (freeze frame) after the clip ends
+    crop: Optional[Dict[str, Any]] = None  # Reframing crop track (reframe_service.crop_track)
+    action: str = ACTION_COPY
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def trimmed(self) -> bool:
+        return self.start > 0 or self.end is not None
+
+    @property
+    def retimed(self) -> bool:
+        return self.speed != 1.0 or self.hold > 0
+
+    @property
+    def source_span(self) -> Optional[float]:
+        """Seconds of the source file this clip plays."""
+        end = self.end if self.end is not None else self.source_duration
+        if end is None:
+            return None
+        return max(end - self.start, 0.0)
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Duration of this clip in the output timeline."""
+        span = self.source_span
+        if span is None:
+            return None
+        return span / self.speed + self.hold
+
+
+@dataclass
+class TransitionPlan:
+    """A transition from clip `after` into clip `after + 1`.
+
+    Times are relative to each clip's own (trimmed) timeline. The outgoing
+    clip is re-encoded from `tail_start` to its end and the incoming clip
+    from its start to `head_end`; both points sit on keyframes so the rest
+    of each clip can be stream-copied.
+    """
+    after: int
+    type: str
+    xfade: str
+    duration: float
+    tail_start: Optional[float] = None
+    head_end: Optional[float] = None
+
+
+@dataclass
+class RenderPlan:
+    """An inspectable execution plan for one render."""
+    project_id: str
+    target: TargetFormat
+    clips: List[ClipPlan]
+    strategy: str
+    profile: RenderProfile = field(default_factory=get_profile)
+    transitions: List[TransitionPlan] = field(default_factory=list)
+    subtitles: Optional[str] = None  # ASS script burned into the timeline
+    audio_mix: Optional[Any] = None  # AudioMix; mixed in the graph that encodes the timeline's audio
+    alignment: Optional[Dict[str, Any]] = None  # How the clips were retimed to the narration
+    notes: List[str] = field(default_factory=list)
+
+    def transition_after(self, index: int) -> Optional[TransitionPlan]:
+        return next((t for t in self.transitions if t.after == index), None)
+
+    def transition_before(self, index: int) -> Optional[TransitionPlan]:
+        return self.transition_after(index - 1) if index > 0 else None
+
+    @property
+    def conform_clips(self) -> List[ClipPlan]:
+        return [c for c in self.clips if c.action == ACTION_CONFORM]
+
+    @property
+    def mixes_in_timeline(self) -> bool:
+        """True if the soundtrack is mixed by the timeline encode itself (otherwise by the final mux)."""
+        return self.audio_mix is not None and self.strategy == STRATEGY_SINGLE_PASS
+
+    @property
+    def duration(self) -> Optional[float]:
+        durations = [c.duration for c in self.clips]
+        if any(d is None for d in durations):
+            return None
+        return sum(durations) - sum(t.duration for t in self.transitions)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "project_id": self.project_id,
+            "strategy": self.strategy,
+            "target": asdict(self.target),
+            "profile": self.profile.to_dict(),
+            "encoder": select_encoder(),
+            "duration": self.duration,
+            "copy_count": len(self.clips) - len(self.conform_clips),
+            "conform_count": len(self.conform_clips),
+            "clips": [
+                {**asdict(c), "duration": c.duration}
+                for c in self.clips
+            ],
+            "transitions": [asdict(t) for t in self.transitions],
+            "subtitles": self.subtitles,
+            "audio_mix": asdict(self.audio_mix) if self.audio_mix else None,
+            "mixes_in_timeline": self.mixes_in_timeline,
+            "alignment": self.alignment,
+            "notes": self.notes,
+        }
+
+
+def normalize_clips(clips: List[Any]) -> List[Dict[str, Any]]:
+    """Accept legacy path strings or trim dicts and return trim dicts."""
+    normalized = []
+    for clip in clips:
+        if isinstance(clip, str):
+            normalized.append({
+                "path": clip, "start": 0.0, "end": None, "transition": None, "scene": None, "speed": 1.0, "hold": 0.0,
+            })
+        else:
+            normalized.append({
+                "path": clip["path"],
+                "start": float(clip.get("start") or 0.0),
+                "end": clip.get("end"),
+                "transition": clip.get("transition"),
+                "scene": clip.get("scene"),
+                "speed": float(clip.get("speed") or 1.0),
+                "hold": float(clip.get("hold") or 0.0),
+            })
+    return normalized
+
+
+def _timescale(time_base: Optional[str]) -> Optional[int]:
+    """'1/15360' -> 15360"""
+    if not time_base or "/" not in time_base:
+        return None
+    try:
+        return int(time_base.split("/", 1)[1])
+    except ValueError:
+        return None
+
+
+def choose_target(probes: List[Optional[Dict[str, Any]]], profile: Optional[RenderProfile] = None) -> TargetFormat:
+    """
+    Pick the target format that lets the most footage be stream-copied.
+
+    Video geometry and frame rate come from whichever (width, height, fps)
+    combination covers the most seconds of the timeline, and the H.264
+    profile, level and parameter sets from the clips of that geometry;
+    audio parameters from the most common sample rate among clips that have
+    audio. A profile with a fixed resolution or frame rate overrides the
+    clip-derived values.
+    """
+    target = TargetFormat()
+    weights: Counter = Counter()
+    timescales: Counter = Counter()
+    streams: Counter = Counter()
+    for info in probes:
+        if not info or not info.get("has_video") or not info.get("width"):
+            continue
+        key = (info["width"], info["height"], info.get("fps") or target.fps)
+        weights[key] += info.get("duration") or 1.0
+        if info.get("time_base"):
+            timescales[(key, _timescale(info["time_base"]))] += 1
+        if info.get("vcodec") in COPYABLE_VIDEO_CODECS:
+            stream = (info.get("vprofile"), info.get("vlevel"), info.get("extradata_hash"))
+            streams[(key, stream)] += info.get("duration") or 1.0
+
+    if weights:
+        (target.width, target.height, target.fps), _ = weights.most_common(1)[0]
+    if profile and profile.width and profile.height:
+        target.width, target.height = profile.width, profile.height
+    if profile and profile.fps:
+        target.fps = profile.fps
+    if profile:
+        target.fit = profile.fit
+
+    if weights:
+        key = (target.width, target.height, target.fps)
+        matching = [(ts, n) for (k, ts), n in timescales.items() if k == key and ts]
+        if matching:
+            target.timescale = max(matching, key=lambda m: m[1])[0]
+        # Clips copied into one output must share the decoder configuration of its first one
+        matching = [(stream, seconds) for (k, stream), seconds in streams.items() if k == key]
+        if matching:
+            target.vprofile, target.vlevel, target.extradata_hash = max(matching, key=lambda m: m[1])[0]
+
+    rates = Counter(
+        info["sample_rate"] for info in probes
+        if info and info.get("has_audio") and info.get("sample_rate")
+    )
+    if rates:
+        target.sample_rate = rates.most_common(1)[0][0]
+
+    return target
+
+
+def _clip_duration(info: Optional[Dict[str, Any]]) -> Optional[float]:
+    """A clip's length on the timeline: its video's, which audio is trimmed or padded to."""
+    if not info:
+        return None
+    return info.get("video_duration") or info.get("duration")
+
+
+def conform_reasons(info: Optional[Dict[str, Any]], target: TargetFormat, trimmed: bool) -> List[str]:
+    """List why a clip can't be stream-copied into the target format (empty = copyable)."""
+    if not info:
+        return ["unprobeable"]
+
+    reasons = []
+    if trimmed:
+        reasons.append("trimmed")
+    if info.get("vcodec") not in COPYABLE_VIDEO_CODECS:
+        reasons.append(f"vcodec:{info.get('vcodec')}")
+    if (info.get("width"), info.get("height")) != (target.width, target.height):
+        reasons.append(f"resolution:{info.get('width')}x{info.get('height')}")
+    if abs((info.get("fps") or 0) - target.fps) > 0.01:
+        reasons.append(f"fps:{info.get('fps')}")
+    if info.get("pix_fmt") != target.pix_fmt:
+        reasons.append(f"pix_fmt:{info.get('pix_fmt')}")
+    if target.timescale and _timescale(info.get("time_base")) != target.timescale:
+        reasons.append(f"timescale:{info.get('time_base')}")
+    if target.vprofile and info.get("vprofile") != target.vprofile:
+        reasons.append(f"vprofile:{info.get('vprofile')}")
+    if target.vlevel and info.get("vlevel") != target.vlevel:
+        reasons.append(f"vlevel:{info.get('vlevel')}")
+    if target.extradata_hash and info.get("extradata_hash") != target.extradata_hash:
+        reasons.append("extradata")
+    if not info.get("has_audio"):
+        reasons.append("no_audio")
+    else:
+        if info.get("acodec") not in COPYABLE_AUDIO_CODECS:
+            reasons.append(f"acodec:{info.get('acodec')}")
+        if info.get("sample_rate") != target.sample_rate:
+            reasons.append(f"sample_rate:{info.get('sample_rate')}")
+        if info.get("channels") != target.channels:
+            reasons.append(f"channels:{info.get('channels')}")
+        video_duration, audio_duration = info.get("video_duration"), info.get("audio_duration")
+        if video_duration and audio_duration and abs(audio_duration - video_duration) > AV_DURATION_TOLERANCE:
+            reasons.append(f"audio_duration:{audio_duration:.3f}")
+    return reasons
+
+
+def segments_can_match(target: TargetFormat, profile: RenderProfile) -> bool:
+    """
+    Whether re-encoded segments may share a track with the copied clips.
+
+    One MP4 track carries one set of H.264 parameter sets, so segments must
+    reproduce the clips' SPS/PPS exactly. Only libx264 is given the clips'
+    profile and level; a combination whose segments already failed to
+    match (see mark_segments_unmatched) isn't tried again.
+    """
+    if not target.extradata_hash:
+        return True
+    encoder = select_encoder()
+    return encoder == SOFTWARE_ENCODER and (target.extradata_hash, profile.name, encoder) not in _unmatched_streams
+
+
+def mark_segments_unmatched(plan: "RenderPlan") -> None:
+    """Remember that this target's segments don't reproduce the clips' parameter sets."""
+    _unmatched_streams.add((plan.target.extradata_hash, plan.profile.name, select_encoder()))
+
+
+def _plan_transitions(clips: List[Dict[str, Any]], plans: List[ClipPlan], notes: List[str]) -> List[TransitionPlan]:
+    """Validate requested transitions and clamp their durations to what the clips allow."""
+    transitions = []
+    if any(clip.get("transition") for clip in clips[:-1]) and not has_filter("xfade"):
+        notes.append("transitions dropped: this FFmpeg build has no xfade filter")
+        return transitions
+    for i, clip in enumerate(clips[:-1]):
+        spec = clip.get("transition")
+        if not spec:
+            continue
+        name = spec.get("type", "crossfade")
+        xfade = TRANSITIONS.get(name, name)
+        duration = float(spec.get("duration") or 0.5)
+        outgoing, incoming = plans[i].duration, plans[i + 1].duration
+        if outgoing is None or incoming is None:
+            notes.append(f"transition after clip {i} dropped: unknown clip duration")
+            continue
+        # A clip can't give more than half of itself to each of its two transitions
+        duration = min(duration, outgoing / 2, incoming / 2)
+        if duration <= 0:
+            notes.append(f"transition after clip {i} dropped: clip too short")
+            continue
+        transitions.append(TransitionPlan(after=i, type=name, xfade=xfade, duration=round(duration, 3)))
+    return transitions
+
+
+def _with_planned_transitions(clips: List[Dict[str, Any]], transitions: List[TransitionPlan]) -> List[Dict[str, Any]]:
+    """Clips whose transitions carry the planned (clamped) durations; dropped transitions are removed."""
+    planned = {t.after: t.duration for t in transitions}
+    result = []
+    for i, clip in enumerate(clips[:-1]):
+        spec = clip.get("transition")
+        if spec:
+            spec = {**spec, "duration": planned[i]} if i in planned else None
+        result.append({**clip, "transition": spec})
+    return result + clips[-1:]
+
+
+def _snap_transitions(plans: List[ClipPlan], transitions: List[TransitionPlan]) -> bool:
+    """
+    Place each transition's re-encode region on keyframes.
+
+    Conformed clips are re-encoded anyway, so keyframes are forced exactly at
+    the transition boundaries. Stream-copied clips use their real keyframes:
+    the last one at or before the fade starts and the first one at or after
+    it ends. Returns False if a clip's regions would overlap.
+    """
+    for t in transitions:
+        outgoing, incoming = plans[t.after], plans[t.after + 1]
+
+        fade_start = outgoing.duration - t.duration
+        if outgoing.action == ACTION_CONFORM:
+            t.tail_start = round(fade_start, 3)
+        else:
+            candidates = [pts for pts, _ in probe_keyframes(outgoing.path) if pts <= fade_start + 1e-3]
+            if not candidates:
+                return False
+            t.tail_start = candidates[-1]
+
+        if incoming.action == ACTION_CONFORM:
+            t.head_end = t.duration
+        else:
+            candidates = [pts for pts, _ in probe_keyframes(incoming.path) if pts >= t.duration - 1e-3]
+            if not candidates:
+                return False
+            t.head_end = candidates[0]
+
+    for i, clip in enumerate(plans):
+        incoming = next((t for t in transitions if t.after == i - 1), None)
+        outgoing = next((t for t in transitions if t.after == i), None)
+        body_start = incoming.head_end if incoming else 0.0
+        body_end = outgoing.tail_start if outgoing else clip.duration
+        if body_end < body_start:
+            return False
+    return True
+
+
+def _plan_clips(
+    clips: List[Dict[str, Any]],
+    probes: List[Optional[Dict[str, Any]]],
+    target: TargetFormat,
+    profile: RenderProfile,
+) -> List[ClipPlan]:
+    """Per-clip plans: copy clips that already match the target, conform the rest."""
+    plans = []
+    for i, (clip, info) in enumerate(zip(clips, probes)):
+        plan = ClipPlan(
+            index=i,
+            path=clip["path"],
+            start=clip["start"],
+            end=clip["end"],
+            source_duration=_clip_duration(info),
+            has_audio=bool(info and info.get("has_audio")),
+            speed=clip["speed"],
+            hold=clip["hold"],
+        )
+        plan.reasons = conform_reasons(info, target, plan.trimmed)
+        if plan.retimed and info:
+            plan.reasons.append("retimed")
+        if not profile.allow_copy:
+            plan.reasons.append(f"profile:{profile.name}")
+        plan.action = ACTION_CONFORM if plan.reasons else ACTION_COPY
+        plans.append(plan)
+    return plans
+
+
+def plan_render(
+    project_id: str,
+    clips: List[Any],
+    target: Optional[TargetFormat] = None,
+    profile: Optional[RenderProfile] = None,
+    subtitles: Optional[str] = None,
+    audio_mix: Optional[Any] = None,
+    alignment: Optional[AlignmentSpec] = None,
+    outputs: int = 1,
+) -> RenderPlan:
+    """
+    Build the execution plan for a render.
+
+    Args:
+        project_id: Project ID
+        clips: Resolved local clip paths or {"path", "start", "end", "transition"} dicts
+        target: Force a target format instead of deriving one from the clips
+        profile: Render profile for re-encoded segments (default: standard)
+        subtitles: ASS script to burn in; the timeline is then drawn in one encode
+        audio_mix: AudioMix for the soundtrack (narration, music bed, clip audio)
+        alignment: Retime the clips so the timeline covers the narration exactly
+        outputs: Number of outputs rendered from the timeline together; more
+            than one shares the decode in a single multi-output pass
+
+    Returns:
+        RenderPlan describing per-clip actions and the overall strategy
+    """
+    normalized = normalize_clips(clips)
+    probes = probe_many([c["path"] for c in normalized])
+    clip_probes = [probes.get(c["path"]) for c in normalized]
+
+    notes: List[str] = []
+    report = None
+    requested = normalized
+    if alignment is not None:
+        normalized, report, alignment_notes = align_clips(
+            normalized, [_clip_duration(info) for info in clip_probes], alignment
+        )
+        notes += alignment_notes
+
+    profile = profile or get_profile(None)
+    if target is None:
+        target = choose_target(clip_probes, profile)
+
+    plans = _plan_clips(normalized, clip_probes, target, profile)
+    transition_notes: List[str] = []
+    transitions = _plan_transitions(normalized, plans, transition_notes)
+    for _ in range(ALIGNMENT_PASSES if report is not None else 0):
+        # Alignment budgeted the requested transitions; the planner may clamp or drop
+        # some, which would leave the timeline longer than the narration. Fit again
+        # with the durations it kept until they stop changing.
+        kept = _with_planned_transitions(requested, transitions)
+        if [c.get("transition") for c in kept] == [c.get("transition") for c in requested]:
+            break
+        requested = kept
+        normalized, report, _ = align_clips(kept, [_clip_duration(info) for info in clip_probes], alignment)
+        plans = _plan_clips(normalized, clip_probes, target, profile)
+        transition_notes = []
+        transitions = _plan_transitions(normalized, plans, transition_notes)
+    notes += transition_notes
+
+    if target.fit == "crop":
+        tracks = crop_tracks(project_id, list(zip((p.path for p in plans), clip_probes)), target.width, target.height)
+        for plan, track in zip(plans, tracks):
+            plan.crop = track
+
+    conform_count = sum(1 for p in plans if p.action == ACTION_CONFORM)
+    if outputs > 1:
+        # Every output re-encodes the timeline anyway; one graph decodes each clip once for all of them
+        notes.append(f"multi-output export: {outputs} outputs share one decode of every clip")
+        strategy = STRATEGY_SINGLE_PASS
+    elif subtitles:
+        # Burned-in captions touch every frame, so draw them in the one encode of the whole timeline
+        notes.append("burning in captions; re-encoding the whole timeline in one pass")
+        strategy = STRATEGY_SINGLE_PASS
+    elif conform_count == len(plans):
+        # Nothing to copy: one graph over all inputs beats N encodes + concat
+        strategy = STRATEGY_SINGLE_PASS
+    elif (conform_count or transitions) and not segments_can_match(target, profile):
+        notes.append("re-encoded segments can't match the clips' H.264 parameter sets; re-encoding the whole timeline")
+        strategy = STRATEGY_SINGLE_PASS
+    elif transitions:
+        if _snap_transitions(plans, transitions):
+            strategy = STRATEGY_SPLICE
+        else:
+            notes.append("transition regions overlap within a clip; re-encoding the whole timeline")
+            strategy = STRATEGY_SINGLE_PASS
+    elif conform_count == 0:
+        strategy = STRATEGY_CONCAT_COPY
+    else:
+        strategy = STRATEGY_SEGMENT_CONFORM
+
+    plan = RenderPlan(
+        project_id=project_id,
+        target=target,
+        clips=plans,
+        strategy=strategy,
+        profile=profile,
+        transitions=transitions,
+        subtitles=subtitles,
+        audio_mix=audio_mix,
+        alignment=report,
+        notes=notes,
+    )
+    if report is not None:
+        report["timeline"] = round(plan.duration, 3) if plan.duration is not None else None
+    elif alignment is None and audio_mix is not None and audio_mix.has_voice and plan.duration is not None:
+        narration = get_duration(audio_mix.voice_path)
+        if narration and abs(narration - plan.duration) > 0.5:
+            notes.append(
+                f"timeline is {plan.duration:.2f}s but the narration is {narration:.2f}s; "
+                "request alignment to fit the clips to it"
+            )
+    return plan
@@ -0,0 +1,163 @@
+"""
+Render profiles and encoder selection.
+
+A profile bundles everything that trades render speed against quality
+and size: encoder preset, CRF or bitrate, output geometry, frame rate,
+GOP length, thread count, faststart and whether clips already in the
+output format may be stream-copied (preset and CRF only apply to clips
+that are re-encoded). Profiles are written against an
+abstract speed/quality scale and translated to whichever H.264 encoder
+the box has (libx264 by default, NVENC/QSV/VideoToolbox when enabled).
+"""
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from config import RENDER_ENCODER, RENDER_THREADS, PROXY_HEIGHT, PROXY_FPS
+from services.ffmpeg_capabilities import get_capabilities, has_encoder
+
+SOFTWARE_ENCODER = "libx264"
+
+# x264 preset -> closest NVENC (p1 fastest .. p7 slowest) / QSV preset
+_NVENC_PRESETS = {
+    "ultrafast": "p1", "superfast": "p1", "veryfast": "p2", "faster": "p3",
+    "fast": "p4", "medium": "p5", "slow": "p6", "slower": "p7", "veryslow": "p7",
+}
+_QSV_PRESETS = {
+    "ultrafast": "veryfast", "superfast": "veryfast", "veryfast": "veryfast", "faster": "faster",
+    "fast": "fast", "medium": "medium", "slow": "slow", "slower": "slower", "veryslow": "veryslow",
+}
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """Encoder and output settings for one kind of render."""
+    name: str
+    preset: str = "medium"  # x264 preset name; mapped for hardware encoders
+    crf: Optional[int] = 23  # Constant quality (ignored when video_bitrate is set)
+    video_bitrate: Optional[str] = None  # e.g. "8M" for bitrate-capped outputs
+    width: Optional[int] = None  # None = keep the geometry derived from the clips
+    height: Optional[int] = None
+    fit: str = "pad"  # Clips of another aspect ratio: "pad" (letterbox) or "crop" (smart reframe)
+    fps: Optional[float] = None
+    gop_seconds: float = 2.0  # Keyframe interval
+    fixed_gop: bool = False  # Disable scene-cut keyframes (regular seek points)
+    threads: int = RENDER_THREADS  # 0 = let the encoder decide
+    faststart: bool = True  # Move the moov atom to the front for progressive playback
+    audio_bitrate: str = "128k"
+    allow_copy: bool = True  # Stream-copy clips already in the target format (False = re-encode all at this quality)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+RENDER_PROFILES: Dict[str, RenderProfile] = {
+    # Keeps the clips' geometry so it copies whatever standard copies, and re-encodes the rest faster
+    "draft": RenderProfile(
+        name="draft", preset="ultrafast", crf=28, gop_seconds=2.0, audio_bitrate="96k",
+    ),
+    "standard": RenderProfile(
+        name="standard", preset="veryfast", crf=23,
+    ),
+    # Every clip goes through the slow, high-quality encode, even ones standard would copy
+    "archival": RenderProfile(
+        name="archival", preset="slow", crf=18, gop_seconds=4.0, audio_bitrate="256k", allow_copy=False,
+    ),
+    "shorts_vertical": RenderProfile(
+        name="shorts_vertical", preset="fast", crf=22, width=1080, height=1920, fps=30.0, fit="crop",
+    ),
+    # Timeline proxies/previews: tiny, fast, a keyframe every half second for scrubbing
+    "preview": RenderProfile(
+        name="preview", preset="ultrafast", crf=30,
+        width=int(PROXY_HEIGHT * 16 / 9) // 2 * 2, height=PROXY_HEIGHT, fps=PROXY_FPS,
+        gop_seconds=0.5, fixed_gop=True, audio_bitrate="96k",
+    ),
+}
+
+DEFAULT_PROFILE = "standard"
+
+
+def get_profile(name: Optional[str]) -> RenderProfile:
+    """Look up a render profile by name (None = default)."""
+    profile = RENDER_PROFILES.get(name or DEFAULT_PROFILE)
+    if profile is None:
+        raise ValueError(f"Unknown render profile: {name}. Available: {', '.join(RENDER_PROFILES)}")
+    return profile
+
+
+@lru_cache(maxsize=1)
+def select_encoder() -> str:
+    """
+    Resolve RENDER_ENCODER ('libx264', a specific hardware encoder, or 'auto').
+
+    Uses the cached FFmpeg capabilities, so 'auto' costs no test encodes
+    once the box has been probed. A configured encoder this FFmpeg build
+    doesn't have falls back to libx264.
+    """
+    if RENDER_ENCODER != "auto":
+        if not has_encoder(RENDER_ENCODER):
+            print(f"⚠️ Warning: FFmpeg has no {RENDER_ENCODER} encoder, using {SOFTWARE_ENCODER}")
+            return SOFTWARE_ENCODER
+        return RENDER_ENCODER
+    hardware = get_capabilities().hardware_encoders
+    if hardware:
+        print(f"✅ Using hardware encoder {hardware[0]}")
+        return hardware[0]
+    return SOFTWARE_ENCODER
+
+
+def video_encoder_args(profile: RenderProfile, fps: float, encoder: Optional[str] = None) -> List[str]:
+    """
+    Translate a profile into video encoder options.
+
+    Args:
+        profile: Render profile
+        fps: Output frame rate (used to turn gop_seconds into frames)
+        encoder: Force an encoder instead of the configured one
+
+    Returns:
+        FFmpeg output options for the video stream
+    """
+    encoder = encoder or select_encoder()
+    gop = max(int(round(fps * profile.gop_seconds)), 1)
+    args = ["-c:v", encoder]
+
+    if encoder == "h264_nvenc":
+        args += ["-preset", _NVENC_PRESETS.get(profile.preset, "p4")]
+        if profile.video_bitrate:
+            args += ["-b:v", profile.video_bitrate]
+        elif profile.crf is not None:
+            args += ["-rc", "vbr", "-cq", str(profile.crf), "-b:v", "0"]
+    elif encoder == "h264_qsv":
+        args += ["-preset", _QSV_PRESETS.get(profile.preset, "medium")]
+        if profile.video_bitrate:
+            args += ["-b:v", profile.video_bitrate]
+        elif profile.crf is not None:
+            args += ["-global_quality", str(profile.crf)]
+    elif encoder == "h264_videotoolbox":
+        # No presets/CRF; approximate quality with a bitrate scaled to the CRF
+        args += ["-b:v", profile.video_bitrate or f"{max(2, 40 - (profile.crf or 23))}M"]
+    else:
+        args += ["-preset", profile.preset]
+        if profile.video_bitrate:
+            args += ["-b:v", profile.video_bitrate, "-maxrate", profile.video_bitrate, "-bufsize", profile.video_bitrate]
+        elif profile.crf is not None:
+            args += ["-crf", str(profile.crf)]
+        if profile.fixed_gop:
+            args += ["-keyint_min", str(gop), "-sc_threshold", "0"]
+
+    args += ["-g", str(gop)]
+    if profile.threads:
+        args += ["-threads", str(profile.threads)]
+    return args
+
+
+def faststart_args(profile: RenderProfile) -> List[str]:
+    """Muxer options for the final output file of a profile."""
+    return ["-movflags", "+faststart"] if profile.faststart else []
+
+
+def describe_output(width: int, height: int, fps: float, profile: RenderProfile) -> str:
+    """Human-readable resolution label stored in exports.resolution, e.g. '1920x1080@30 standard'."""
+    fps_label = f"{fps:g}" if fps else "?"
+    return f"{width}x{height}@{fps_label} {profile.name}"
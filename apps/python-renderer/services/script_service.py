@@ -3,8 +3,11 @@
 
 import openai
 from config import OPENAI_API_KEY
+from services.rate_limiter import limited
+from utils.metrics import timed
 
 
+@timed("script_generate", "openai")
 def generate_script(topic: str) -> str:
     """Generate video script using GPT-4."""
     if not OPENAI_API_KEY:
@@ -12,15 +15,17 @@ def generate_script(topic: str) -> str:
     
     client = openai.OpenAI(api_key=OPENAI_API_KEY)
     
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "user",
-                "content": f"Generate a video script about: {topic}. Make it engaging and suitable for a 30-60 second video.",
-            }
-        ],
-    )
+    # The SDK retries 429s itself (honouring Retry-After); the limiter keeps us under the limit
+    with limited("openai"):
+        response = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"Generate a video script about: {topic}. Make it engaging and suitable for a 30-60 second video.",
+                }
+            ],
+        )
     
     return response.choices[0].message.content
 
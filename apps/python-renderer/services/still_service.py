@@ -0,0 +1,198 @@
+"""
+Still image clips.
+
+Generated images (DALL-E/SDXL stills in a project's clips folder) become
+timeline clips with Ken Burns motion: the image is scaled to cover the
+output frame, supersampled so slow moves don't jitter, and zoomed or
+panned with eased zoompan expressions for the requested duration.
+
+zoompan on large stills is expensive, so every (image, motion, duration,
+output format) combination is rendered once into an intermediate clip
+(RENDER_DIR/stills/<project>/) and reused by later renders. The
+intermediate is encoded exactly like a conformed clip of the render's
+target format, with a silent audio track, so the planner can
+stream-copy it straight into the output.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import INGEST_MAX_WORKERS, RENDER_DIR
+from services.probe_service import probe_many
+from services.render_graph import build_still_command
+from services.render_planner import TargetFormat, choose_target
+from services.render_profiles import RenderProfile, faststart_args
+from services.storage_gc import note_access
+from utils.ffmpeg_utils import run_ffmpeg
+from utils.metrics import cache_lookup, stage
+
+STILL_DURATION = 4.0  # Seconds on screen when a still clip doesn't say
+STILL_ZOOM = 1.15  # Zoom at the tight end of a move
+SUPERSAMPLE = 2  # zoompan works on integer pixels; a larger canvas keeps slow moves smooth
+MOTIONS = ("zoom_in", "zoom_out", "pan_left", "pan_right", "pan_up", "pan_down", "none")
+
+STILLS_DIR = RENDER_DIR / "stills"
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def ken_burns_filter(motion: str, zoom: float, frames: int, target: TargetFormat) -> str:
+    """Cover-scale the image and move over it for `frames` frames at the target size and rate."""
+    if motion not in MOTIONS:
+        raise ValueError(f"Unknown still motion: {motion}. Available: {', '.join(MOTIONS)}")
+    w, h = target.width, target.height
+    canvas_w, canvas_h = w * SUPERSAMPLE, h * SUPERSAMPLE
+    progress = f"(on/{max(frames - 1, 1)})"
+    eased = f"({progress}*{progress}*(3-2*{progress}))"  # Smoothstep: starts and stops gently
+    center_x, center_y = "iw/2-(iw/zoom/2)", "ih/2-(ih/zoom/2)"
+    travel_x, travel_y = "(iw-iw/zoom)", "(ih-ih/zoom)"
+    z, x, y = {
+        "zoom_in": (f"1+{zoom - 1:.4f}*{eased}", center_x, center_y),
+        "zoom_out": (f"{zoom:.4f}-{zoom - 1:.4f}*{eased}", center_x, center_y),
+        "pan_left": (f"{zoom:.4f}", f"{travel_x}*(1-{eased})", center_y),
+        "pan_right": (f"{zoom:.4f}", f"{travel_x}*{eased}", center_y),
+        "pan_up": (f"{zoom:.4f}", center_x, f"{travel_y}*(1-{eased})"),
+        "pan_down": (f"{zoom:.4f}", center_x, f"{travel_y}*{eased}"),
+        "none": ("1", "0", "0"),
+    }[motion]
+    return (
+        f"scale={canvas_w}:{canvas_h}:force_original_aspect_ratio=increase,crop={canvas_w}:{canvas_h},"
+        f"zoompan=z='{z}':x='{x}':y='{y}':d={frames}:s={w}x{h}:fps={target.fps},"
+        f"setsar=1,format={target.pix_fmt}"
+    )
+
+
+def still_path(project_id: str, image_path: str, spec: Dict[str, Any]) -> Path:
+    """Where the intermediate for an image rendered with `spec` lives."""
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return STILLS_DIR / project_id / f"{Path(image_path).stem}_{digest}.mp4"
+
+
+def render_still(
+    project_id: str,
+    image_path: str,
+    target: TargetFormat,
+    profile: RenderProfile,
+    duration: Optional[float] = None,
+    motion: Optional[str] = None,
+    zoom: Optional[float] = None,
+) -> Optional[str]:
+    """
+    Render (or reuse) the motion clip for a still image.
+
+    Args:
+        project_id: Project ID
+        image_path: Local path of the image
+        target: Output format the clip must match
+        profile: Render profile to encode with
+        duration: Seconds on screen (default STILL_DURATION)
+        motion: One of MOTIONS (default zoom_in)
+        zoom: Zoom at the tight end of the move (default STILL_ZOOM)
+
+    Returns:
+        Path to the intermediate clip, or None if the image couldn't be rendered
+    """
+    try:
+        st = os.stat(image_path)
+    except OSError:
+        return None
+    duration = float(duration or STILL_DURATION)
+    motion = motion or "zoom_in"
+    zoom = float(zoom or STILL_ZOOM)
+    spec = {
+        "image": [os.path.abspath(image_path), st.st_size, st.st_mtime_ns],
+        "duration": duration,
+        "motion": motion,
+        "zoom": zoom,
+        "target": asdict(target),
+        "profile": asdict(profile),
+    }
+    output_path = still_path(project_id, image_path, spec)
+    with _lock_for(str(output_path)):
+        cached = output_path.exists()
+        cache_lookup("still_clip", cached)
+        if cached:
+            note_access(output_path)
+            return str(output_path)
+
+        frames = max(1, round(duration * target.fps))
+        video_filter = ken_burns_filter(motion, zoom, frames, target)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_name(f".{output_path.stem}.tmp.mp4")
+        cmd = build_still_command(
+            image_path, video_filter, duration, target, profile, str(tmp_path), faststart_args(profile)
+        )
+        with stage("still"):
+            ok = run_ffmpeg(cmd, f"still clip for {image_path}")
+        if not ok:
+            tmp_path.unlink(missing_ok=True)
+            return None
+        os.replace(tmp_path, output_path)
+        return str(output_path)
+
+
+def render_stills(
+    project_id: str,
+    clips: List[Dict[str, Any]],
+    profile: RenderProfile,
+    target: Optional[TargetFormat] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Replace the still image clips of a timeline with their motion clips.
+
+    The intermediates are rendered in the target format the video clips
+    call for (or `target`), so they join the rest of the timeline without
+    another conform. Stills that fail to render are dropped with a warning.
+
+    Args:
+        project_id: Project ID
+        clips: Resolved timeline clips; stills carry {"still": {"duration", "motion", "zoom"}}
+        profile: Render profile of the output
+        target: Force a target format instead of deriving it from the video clips
+
+    Returns:
+        The timeline with every still replaced by a video clip
+    """
+    stills = [clip for clip in clips if clip.get("still") is not None]
+    if not stills:
+        return clips
+    if target is None:
+        videos = [clip["path"] for clip in clips if clip.get("still") is None]
+        probes = probe_many(videos)
+        target = choose_target([probes.get(path) for path in videos], profile)
+
+    with ThreadPoolExecutor(max_workers=min(INGEST_MAX_WORKERS, len(stills))) as pool:
+        rendered = list(pool.map(
+            lambda clip: render_still(
+                project_id,
+                clip["path"],
+                target,
+                profile,
+                clip["still"].get("duration"),
+                clip["still"].get("motion"),
+                clip["still"].get("zoom"),
+            ),
+            stills,
+        ))
+    paths = {id(clip): path for clip, path in zip(stills, rendered)}
+
+    timeline = []
+    for clip in clips:
+        if clip.get("still") is None:
+            timeline.append(clip)
+        elif paths[id(clip)]:
+            timeline.append({**{k: v for k, v in clip.items() if k != "still"}, "path": paths[id(clip)]})
+        else:
+            print(f"Warning: Skipping still {clip['path']}: could not render it")
+    return timeline
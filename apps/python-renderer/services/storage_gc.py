@@ -0,0 +1,394 @@
+"""
+Disk garbage collection for render nodes.
+
+Source material (clips, images, narration, voice samples) is never
+touched. Derived artifacts can always be regenerated (or re-fetched from
+Supabase), so they are evicted least-recently-used first whenever their
+total size exceeds GC_QUOTA_MB or a volume drops below GC_MIN_FREE_MB:
+- renders: RENDER_DIR/<project>.mp4 with its render record and poster
+- previews: RENDER_DIR/previews/<project>.mp4
+- exports: RENDER_DIR/exports/<project>/<profile>.mp4 (multi-output variants)
+- stills: RENDER_DIR/stills/<project>/*.mp4 (Ken Burns clips of still images)
+- streams: RENDER_DIR/streams/<project>/<version>/
+- thumbnails: RENDER_DIR/thumbnails/clips/<project>/<clip>/
+- reframe: RENDER_DIR/reframe/<project>/*.json (saliency analyses)
+- proxies: PROJECTS_DIR/<project>/proxies/*.mp4
+- images: IMAGE_CACHE_DIR/<key>.<ext> with its <key>.json entry (generated
+  images shared by every project)
+
+Temp files left behind by failed or killed renders (`*_temp_concat.mp4`,
+`*_segments/`, dot-prefixed partial outputs) are swept on startup and on
+every run once they're old enough to be certain nobody is writing them.
+
+Collection runs on a daemon thread, never on a request thread.
+"""
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from config import (
+    GC_INTERVAL,
+    GC_MIN_AGE,
+    GC_MIN_FREE_MB,
+    GC_QUOTA_MB,
+    GC_TEMP_MAX_AGE,
+    IMAGE_CACHE_DIR,
+    PROJECTS_DIR,
+    RENDER_DIR,
+)
+
+MB = 1024 * 1024
+# On startup nothing in this process is rendering, but another worker on the
+# same volume may be, so still leave very recent temp files alone
+STARTUP_TEMP_GRACE = 120.0
+# Folders holding derived artifacts and their temp files
+ROOTS = (RENDER_DIR, PROJECTS_DIR, IMAGE_CACHE_DIR)
+
+STORAGE_BYTES = Gauge("renderer_storage_bytes", "Bytes on disk by category", ["category"])
+GC_EVICTED_BYTES = Counter("renderer_gc_evicted_bytes_total", "Bytes of derived artifacts evicted", ["kind"])
+GC_TEMP_REMOVED = Counter("renderer_gc_temp_removed_total", "Orphaned temp files and directories removed")
+
+
+@dataclass
+class Artifact:
+    """One evictable unit: the paths are removed together."""
+
+    kind: str
+    project_id: str  # "" for caches shared by every project
+    paths: List[Path]
+    size: int
+    last_used: float
+    device: int
+
+
+_run_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_last_report: Optional[Dict[str, Any]] = None
+
+
+def note_access(path: Path | str) -> None:
+    """
+    Record that a derived artifact was just used, so LRU eviction keeps it.
+
+    The access time is written to the file itself, so the GC of any process
+    sharing the volume sees it; the kernel's own atime updates can't be relied
+    on (noatime/relatime mounts). The mtime is kept: caches fingerprint it.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.utime(fd, ns=(time.time_ns(), os.fstat(fd).st_mtime_ns))
+    except OSError as e:
+        print(f"⚠️ Warning: Could not record access to {path}: {e}")
+    finally:
+        os.close(fd)
+
+
+def is_temp_name(name: str) -> bool:
+    """Names used for in-progress outputs by the render, proxy, packaging and index writers."""
+    if name.endswith("_temp_concat.mp4") or name.endswith("_segments"):
+        return True
+    return name.startswith(".") and (".tmp" in name or name.endswith((".mp4", ".png")))
+
+
+def _stat_tree(path: Path) -> Tuple[int, float]:
+    """Total size and most recent mtime/atime of a file or directory tree."""
+    try:
+        st = path.stat()
+    except OSError:
+        return 0, 0.0
+    if not path.is_dir():
+        return st.st_size, max(st.st_mtime, st.st_atime)
+    total, newest = 0, st.st_mtime
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += st.st_size
+            newest = max(newest, st.st_mtime, st.st_atime)
+    return total, newest
+
+
+def _children(path: Path) -> List[Path]:
+    try:
+        return [Path(entry.path) for entry in os.scandir(path)]
+    except OSError:
+        return []
+
+
+def _artifact(kind: str, project_id: str, paths: List[Path]) -> Optional[Artifact]:
+    existing = [p for p in paths if p.exists()]
+    if not existing:
+        return None
+    size, last_used = 0, 0.0
+    for path in existing:
+        path_size, path_used = _stat_tree(path)
+        size += path_size
+        last_used = max(last_used, path_used)
+    return Artifact(kind, project_id, existing, size, last_used, existing[0].stat().st_dev)
+
+
+def derived_artifacts() -> List[Artifact]:
+    """Every evictable artifact on disk."""
+    return [artifact for artifact in _candidates() if artifact]
+
+
+def _candidates() -> Iterator[Optional[Artifact]]:
+    for path in _children(RENDER_DIR):
+        if path.suffix == ".mp4" and path.is_file() and not is_temp_name(path.name):
+            project_id = path.stem
+            yield _artifact("renders", project_id, [
+                path,
+                RENDER_DIR / f"{project_id}.render.json",
+                RENDER_DIR / "thumbnails" / f"{project_id}.png",
+            ])
+    for path in _children(RENDER_DIR / "previews"):
+        if path.suffix == ".mp4" and not is_temp_name(path.name):
+            yield _artifact("previews", path.stem, [path])
+    for project_dir in _children(RENDER_DIR / "exports"):
+        for path in _children(project_dir):
+            if path.suffix == ".mp4" and not is_temp_name(path.name):
+                yield _artifact("exports", project_dir.name, [path])
+    for project_dir in _children(RENDER_DIR / "stills"):
+        for path in _children(project_dir):
+            if path.suffix == ".mp4" and not is_temp_name(path.name):
+                yield _artifact("stills", project_dir.name, [path])
+    for project_dir in _children(RENDER_DIR / "streams"):
+        for path in _children(project_dir):
+            if not is_temp_name(path.name):
+                yield _artifact("streams", project_dir.name, [path])
+    for project_dir in _children(RENDER_DIR / "thumbnails" / "clips"):
+        for path in _children(project_dir):
+            yield _artifact("thumbnails", project_dir.name, [path])
+    for project_dir in _children(RENDER_DIR / "reframe"):
+        for path in _children(project_dir):
+            if not is_temp_name(path.name):
+                yield _artifact("reframe", project_dir.name, [path])
+    for project_dir in _children(PROJECTS_DIR):
+        for path in _children(project_dir / "proxies"):
+            if path.suffix == ".mp4" and not is_temp_name(path.name):
+                yield _artifact("proxies", project_dir.name, [path])
+    images: Dict[str, List[Path]] = {}
+    for path in _children(IMAGE_CACHE_DIR):
+        if not is_temp_name(path.name):
+            images.setdefault(path.stem, []).append(path)
+    for paths in images.values():
+        # The image first, so the eviction report names it rather than its entry
+        yield _artifact("images", "", sorted(paths, key=lambda p: p.suffix == ".json"))
+
+
+def _temp_files(root: Path) -> Iterator[Path]:
+    """Temp files and directories anywhere under `root` (not descending into temp directories)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in list(dirnames):
+            if is_temp_name(name):
+                dirnames.remove(name)
+                yield Path(dirpath) / name
+        for name in filenames:
+            if is_temp_name(name):
+                yield Path(dirpath) / name
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def sweep_temp_files(max_age: float = GC_TEMP_MAX_AGE) -> Dict[str, int]:
+    """
+    Remove orphaned temp files not modified for `max_age` seconds.
+
+    Returns:
+        dict with the number of paths and bytes removed
+    """
+    cutoff = time.time() - max_age
+    removed, freed = 0, 0
+    for root in ROOTS:
+        for path in _temp_files(root):
+            size, last_modified = _stat_tree(path)
+            if last_modified > cutoff:
+                continue
+            _remove(path)
+            removed += 1
+            freed += size
+    if removed:
+        GC_TEMP_REMOVED.inc(removed)
+        print(f"🧹 Removed {removed} orphaned temp file(s), {freed / MB:.1f} MB")
+    return {"removed": removed, "bytes": freed}
+
+
+def _free_bytes_needed() -> Dict[int, int]:
+    """Per device: bytes to free to get back above GC_MIN_FREE_MB."""
+    needed: Dict[int, int] = {}
+    for root in ROOTS:
+        try:
+            device = root.stat().st_dev
+            free = shutil.disk_usage(root).free
+        except OSError:
+            continue
+        needed[device] = max(0, GC_MIN_FREE_MB * MB - free)
+    return needed
+
+
+def evict(artifacts: List[Artifact]) -> Dict[str, Any]:
+    """
+    Evict least-recently-used artifacts until under quota and above the free-space floor.
+
+    Returns:
+        dict with the evicted artifacts and bytes freed
+    """
+    over_quota = max(0, sum(a.size for a in artifacts) - GC_QUOTA_MB * MB) if GC_QUOTA_MB else 0
+    free_needed = _free_bytes_needed()
+    cutoff = time.time() - GC_MIN_AGE
+
+    evicted: List[Dict[str, Any]] = []
+    freed = 0
+    for artifact in sorted(artifacts, key=lambda a: a.last_used):
+        if over_quota <= 0 and not any(free_needed.values()):
+            break
+        if artifact.last_used > cutoff:
+            break  # Everything after this is newer still
+        if over_quota <= 0 and free_needed.get(artifact.device, 0) <= 0:
+            continue  # Only another volume is short of space
+        for path in artifact.paths:
+            _remove(path)
+        GC_EVICTED_BYTES.labels(artifact.kind).inc(artifact.size)
+        over_quota -= artifact.size
+        if artifact.device in free_needed:
+            free_needed[artifact.device] = max(0, free_needed[artifact.device] - artifact.size)
+        freed += artifact.size
+        evicted.append({
+            "kind": artifact.kind,
+            "project_id": artifact.project_id,
+            "path": str(artifact.paths[0]),
+            "bytes": artifact.size,
+        })
+    if evicted:
+        print(f"🧹 Evicted {len(evicted)} derived artifact(s), {freed / MB:.1f} MB")
+    return {"evicted": evicted, "bytes": freed}
+
+
+def _source_usage() -> Dict[str, int]:
+    """Bytes used by source material, which GC reports but never removes."""
+    usage = {"clips": 0, "audio": 0, "voice_models": 0}
+    for project_dir in _children(PROJECTS_DIR):
+        if project_dir.name == "voice_models":
+            usage["voice_models"] += _stat_tree(project_dir)[0]
+            continue
+        usage["clips"] += _stat_tree(project_dir / "clips")[0]
+        for path in _children(project_dir):
+            if path.is_file() and path.suffix in (".wav", ".mp3"):
+                usage["audio"] += _stat_tree(path)[0]
+    return usage
+
+
+def disk_usage_report(artifacts: Optional[List[Artifact]] = None) -> Dict[str, Any]:
+    """
+    Disk usage by category and project, with quota and free-space status.
+
+    Args:
+        artifacts: Pre-scanned artifacts (scanned here if omitted)
+    """
+    if artifacts is None:
+        artifacts = derived_artifacts()
+    categories: Dict[str, int] = {kind: 0 for kind in ("renders", "previews", "exports", "stills", "streams", "thumbnails", "reframe", "proxies", "images")}
+    projects: Dict[str, int] = {}
+    for artifact in artifacts:
+        categories[artifact.kind] += artifact.size
+        if artifact.project_id:
+            projects[artifact.project_id] = projects.get(artifact.project_id, 0) + artifact.size
+    derived_total = sum(categories.values())
+    categories.update(_source_usage())
+    categories["temp"] = sum(_stat_tree(p)[0] for root in ROOTS for p in _temp_files(root))
+    for category, size in categories.items():
+        STORAGE_BYTES.labels(category).set(size)
+
+    volumes = {}
+    for name, root in (("renders", RENDER_DIR), ("projects", PROJECTS_DIR), ("images", IMAGE_CACHE_DIR)):
+        try:
+            usage = shutil.disk_usage(root)
+        except OSError:
+            continue
+        volumes[name] = {"path": str(root), "total": usage.total, "used": usage.used, "free": usage.free}
+
+    return {
+        "categories": categories,
+        "derived_bytes": derived_total,
+        "projects": dict(sorted(projects.items(), key=lambda item: item[1], reverse=True)),
+        "volumes": volumes,
+        "quota_bytes": GC_QUOTA_MB * MB or None,
+        "min_free_bytes": GC_MIN_FREE_MB * MB,
+        "scanned_at": time.time(),
+    }
+
+
+def run_gc(temp_max_age: float = GC_TEMP_MAX_AGE) -> Dict[str, Any]:
+    """One collection pass: sweep temp files, evict derived artifacts, refresh the usage report."""
+    global _last_report
+    with _run_lock:
+        started = time.monotonic()
+        temp = sweep_temp_files(temp_max_age)
+        artifacts = derived_artifacts()
+        eviction = evict(artifacts)
+        evicted_paths = {item["path"] for item in eviction["evicted"]}
+        remaining = [a for a in artifacts if str(a.paths[0]) not in evicted_paths]
+        report = disk_usage_report(remaining)
+        report["last_gc"] = {
+            "temp": temp,
+            "evicted": eviction["evicted"],
+            "evicted_bytes": eviction["bytes"],
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        _last_report = report
+        return report
+
+
+def last_report() -> Optional[Dict[str, Any]]:
+    """The usage report from the most recent GC pass (None before the first one)."""
+    return _last_report
+
+
+def request_gc() -> None:
+    """Wake the GC thread for an immediate pass."""
+    _wake.set()
+
+
+def _loop() -> None:
+    temp_max_age = STARTUP_TEMP_GRACE
+    while not _stop.is_set():
+        try:
+            run_gc(temp_max_age)
+        except Exception as e:
+            print(f"⚠️ Warning: Storage GC pass failed: {e}")
+        temp_max_age = GC_TEMP_MAX_AGE
+        _wake.wait(GC_INTERVAL if GC_INTERVAL > 0 else None)
+        _wake.clear()
+
+
+def start_storage_gc() -> None:
+    """Start the background GC thread (the first pass doubles as the startup temp sweep)."""
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="storage-gc", daemon=True)
+    _thread.start()
+
+
+def stop_storage_gc() -> None:
+    _stop.set()
+    _wake.set()
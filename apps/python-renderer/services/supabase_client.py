@@ -0,0 +1,45 @@
+"""
+Shared Supabase client, created on first use.
+
+Building the client imports the supabase SDK and its HTTP stack, which is
+slow and pointless for requests that never touch the database or storage,
+so nothing happens at import time. The first caller (or the startup
+warm-up) creates one client that supabase_db and supabase_storage share.
+"""
+import os
+import threading
+from typing import Any, Optional
+
+# Note: Backend should use SERVICE ROLE KEY, not anon key
+# Get this from Supabase Dashboard > Settings > API > service_role key
+supabase_url = os.getenv("SUPABASE_URL", "https://kdycnltygfhduvpprruz.supabase.co")
+supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
+
+_client: Optional[Any] = None
+_initialized = False
+_lock = threading.Lock()
+
+
+def get_supabase() -> Optional[Any]:
+    """
+    Return the shared Supabase client, creating it on first call.
+
+    Returns:
+        supabase.Client, or None if SUPABASE_URL/SUPABASE_SERVICE_KEY are not configured
+    """
+    global _client, _initialized
+    if _initialized:
+        return _client
+    with _lock:
+        if _initialized:
+            return _client
+        if not supabase_service_key:
+            print("Warning: Supabase SERVICE KEY not configured. Set SUPABASE_SERVICE_KEY")
+            print("Note: Use the service_role key (not anon key) for backend operations")
+        elif supabase_url:
+            from supabase import create_client
+
+            _client = create_client(supabase_url, supabase_service_key)
+            print("✅ Supabase client initialized")
+        _initialized = True
+    return _client
@@ -1,25 +1,9 @@
 """
 Supabase Database service for CRUD operations.
 """
-import os
-from supabase import create_client, Client
+from services.supabase_client import get_supabase
 from typing import Optional, Dict, Any, List
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL", "https://kdycnltygfhduvpprruz.supabase.co")
-# Note: Backend should use SERVICE ROLE KEY, not anon key
-# Get this from Supabase Dashboard > Settings > API > service_role key
-supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
-
-if not supabase_service_key:
-    print("Warning: Supabase SERVICE KEY not configured. Set SUPABASE_SERVICE_KEY")
-    print("Note: Use the service_role key (not anon key) for backend operations")
-
-supabase: Optional[Client] = None
-if supabase_url and supabase_service_key:
-    supabase = create_client(supabase_url, supabase_service_key)
-    print("✅ Supabase database client initialized")
-
 
 def save_clip_record(
     project_id: str,
@@ -52,6 +36,7 @@ def save_clip_record(
     Raises:
         Exception: If save fails or Supabase is not configured
     """
+    supabase = get_supabase()
     if not supabase:
         raise Exception("Supabase not configured. Set SUPABASE_URL and SUPABASE_SERVICE_KEY")
     
@@ -101,6 +86,7 @@ def save_export_record(
     Raises:
         Exception: If save fails or Supabase is not configured
     """
+    supabase = get_supabase()
     if not supabase:
         raise Exception("Supabase not configured")
     
@@ -137,6 +123,7 @@ def update_project_status(project_id: str, status: str) -> Dict[str, Any]:
     Raises:
         Exception: If update fails
     """
+    supabase = get_supabase()
     if not supabase:
         raise Exception("Supabase not configured")
     
@@ -161,6 +148,7 @@ def get_project_clips(project_id: str) -> List[Dict[str, Any]]:
     Raises:
         Exception: If query fails
     """
+    supabase = get_supabase()
     if not supabase:
         raise Exception("Supabase not configured")
     
@@ -170,3 +158,26 @@ def get_project_clips(project_id: str) -> List[Dict[str, Any]]:
         return []
     
     return res.data if isinstance(res.data, list) else [res.data]
+
+
+def get_project_chapters(project_id: str) -> List[Dict[str, Any]]:
+    """
+    Get a project's SEO chapters.
+    
+    Args:
+        project_id: Project ID
+        
+    Returns:
+        List of {"time": "m:ss", "title": ...} chapters (empty if none)
+        
+    Raises:
+        Exception: If query fails
+    """
+    supabase = get_supabase()
+    if not supabase:
+        raise Exception("Supabase not configured")
+    
+    res = supabase.table("projects").select("seo_chapters").eq("id", project_id).execute()
+    
+    rows = res.data if isinstance(res.data, list) else [res.data] if res.data else []
+    return (rows[0].get("seo_chapters") or []) if rows else []
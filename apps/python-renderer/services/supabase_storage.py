@@ -1,26 +1,14 @@
 """
 Supabase Storage service for uploading files.
 """
-import os
-from supabase import create_client, Client
-from typing import Optional
-
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL", "https://kdycnltygfhduvpprruz.supabase.co")
-# Note: Backend should use SERVICE ROLE KEY, not anon key
-# Get this from Supabase Dashboard > Settings > API > service_role key
-supabase_service_key = os.getenv("SUPABASE_SERVICE_KEY")
-
-if not supabase_service_key:
-    print("Warning: Supabase SERVICE KEY not configured. Set SUPABASE_SERVICE_KEY")
-    print("Note: Use the service_role key (not anon key) for backend operations")
-
-supabase: Optional[Client] = None
-if supabase_url and supabase_service_key:
-    supabase = create_client(supabase_url, supabase_service_key)
-    print("✅ Supabase storage client initialized")
+import mimetypes
+from pathlib import Path
+from services.supabase_client import get_supabase
+from typing import Dict, List
+from utils.metrics import timed
 
 
+@timed("upload", "supabase")
 def upload_file(
     bucket: str,
     path: str,
@@ -42,6 +30,7 @@ def upload_file(
     Raises:
         Exception: If upload fails or Supabase is not configured
     """
+    supabase = get_supabase()
     if not supabase:
         raise Exception("Supabase not configured. Set SUPABASE_URL and SUPABASE_SERVICE_KEY")
     
@@ -125,6 +114,31 @@ def upload_thumbnail(project_id: str, file_bytes: bytes, filename: str = "thumbn
     return upload_file("thumbnails", path, file_bytes, "image/png")
 
 
+def upload_stream_package(project_id: str, version: str, package_dir: Path, formats: List[str]) -> Dict[str, str]:
+    """
+    Upload an HLS/DASH package (manifests, playlists and segments) to Supabase Storage.
+    
+    Args:
+        project_id: Project ID
+        version: Package version (render content hash)
+        package_dir: Local directory holding the package
+        formats: Packaged formats ("hls", "dash")
+        
+    Returns:
+        Public URLs of the uploaded manifests keyed by format
+    """
+    prefix = f"projects/{project_id}/streams/{version}"
+    urls = {}
+    for file_path in sorted(Path(package_dir).iterdir()):
+        content_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+        url = upload_file("exports", f"{prefix}/{file_path.name}", file_path.read_bytes(), content_type)
+        if file_path.name == "master.m3u8" and "hls" in formats:
+            urls["hls"] = url
+        elif file_path.name == "manifest.mpd" and "dash" in formats:
+            urls["dash"] = url
+    return urls
+
+
 def delete_file(bucket: str, path: str) -> None:
     """
     Delete a file from Supabase Storage.
@@ -136,6 +150,7 @@ def delete_file(bucket: str, path: str) -> None:
     Raises:
         Exception: If deletion fails
     """
+    supabase = get_supabase()
     if not supabase:
         raise Exception("Supabase not configured")
     
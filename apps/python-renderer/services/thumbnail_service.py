@@ -0,0 +1,258 @@
+"""
+Clip thumbnail service.
+
+Decodes each clip once to produce everything the timeline needs:
+- a sprite sheet of evenly spaced frames for filmstrips/scrubbing
+- a WebVTT index mapping time ranges to sprite tiles
+- scene-change and brightness stats used to choose a representative
+  poster frame (the middle of the longest shot, skipping black frames)
+- the saliency analysis used for smart reframing (reframe_service)
+
+The poster itself is grabbed with a keyframe seek of a single frame.
+Results are cached per clip and reused until the source file changes.
+meta.json is written last (atomically), so its presence with a matching key
+means every output of that run is complete.
+"""
+import json
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import RENDER_DIR, THUMBNAIL_SPRITE_FRAMES, THUMBNAIL_SPRITE_COLUMNS
+from services.media_service import media_url
+from services.probe_service import probe_media
+from services.reframe_service import ANALYSIS_FPS, analysis_path, saliency_filter, store_analysis
+from utils.ffmpeg_utils import escape_filter_path, run_ffmpeg
+from utils.metrics import cache_lookup, timed
+
+TILE_WIDTH = 160
+TILE_HEIGHT = 90
+SCENE_THRESHOLD = 10.0  # scdet score (0-100) treated as a shot boundary
+BLACK_LUMA = 32.0  # Frames with average luma below this are considered black
+
+THUMBNAILS_DIR = RENDER_DIR / "thumbnails" / "clips"
+
+_locks: Dict[str, list] = {}
+_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _output_lock(out_dir: Path) -> Iterator[None]:
+    """Serialize renders into one output folder; the entry is dropped once nobody holds or waits for it."""
+    key = str(out_dir)
+    with _locks_guard:
+        entry = _locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[key]
+
+
+def _output_dir(project_id: str, clip_path: str) -> Path:
+    digest = hashlib.sha1(os.path.abspath(clip_path).encode()).hexdigest()[:8]
+    return THUMBNAILS_DIR / project_id / f"{Path(clip_path).stem}_{digest}"
+
+
+def _url_for(path: Path) -> str:
+    return media_url(path)
+
+
+def _format_vtt_time(seconds: float) -> str:
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+def _parse_frame_stats(stats_path: Path) -> List[Dict[str, float]]:
+    """Parse `metadata=mode=print` output into [{time, score, yavg}, ...]."""
+    frames: List[Dict[str, float]] = []
+    try:
+        with open(stats_path) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("frame:"):
+                    pts_time = line.rsplit("pts_time:", 1)[-1]
+                    frames.append({"time": float(pts_time), "score": 0.0, "yavg": 0.0})
+                elif frames and line.startswith("lavfi.scd.score="):
+                    frames[-1]["score"] = float(line.split("=", 1)[1])
+                elif frames and line.startswith("lavfi.signalstats.YAVG="):
+                    frames[-1]["yavg"] = float(line.split("=", 1)[1])
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not parse frame stats {stats_path}: {e}")
+    return frames
+
+
+def choose_poster_time(frames: List[Dict[str, float]], duration: float) -> float:
+    """
+    Pick a representative poster timestamp from per-frame analysis.
+
+    Splits the clip into shots at scene changes, takes the longest shot and
+    returns the non-black frame closest to its middle.
+    """
+    if not frames:
+        return min(1.0, duration / 2) if duration else 0.0
+
+    # Shot boundaries: first frame plus every scene change
+    cuts = [frames[0]["time"]] + [f["time"] for f in frames[1:] if f["score"] >= SCENE_THRESHOLD]
+    ends = cuts[1:] + [duration or frames[-1]["time"]]
+    shots = sorted(zip(cuts, ends), key=lambda s: s[1] - s[0], reverse=True)
+
+    for start, end in shots:
+        middle = (start + end) / 2
+        candidates = [f for f in frames if start <= f["time"] < end and f["yavg"] >= BLACK_LUMA]
+        if candidates:
+            return min(candidates, key=lambda f: abs(f["time"] - middle))["time"]
+
+    # Everything is dark - take the brightest frame
+    return max(frames, key=lambda f: f["yavg"])["time"]
+
+
+def _write_vtt(vtt_path: Path, sprite_name: str, duration: float, frames: int, columns: int) -> None:
+    interval = duration / frames
+    lines = ["WEBVTT", ""]
+    for i in range(frames):
+        x = (i % columns) * TILE_WIDTH
+        y = (i // columns) * TILE_HEIGHT
+        lines.append(f"{_format_vtt_time(i * interval)} --> {_format_vtt_time(min((i + 1) * interval, duration))}")
+        lines.append(f"{sprite_name}#xywh={x},{y},{TILE_WIDTH},{TILE_HEIGHT}")
+        lines.append("")
+    vtt_path.write_text("\n".join(lines))
+
+
+def _result(out_dir: Path, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "poster": _url_for(out_dir / "poster.jpg"),
+        "sprite": _url_for(out_dir / "sprite.jpg"),
+        "vtt": _url_for(out_dir / "thumbnails.vtt"),
+        "poster_time": meta.get("poster_time"),
+        "frames": meta.get("frames"),
+        "tile": [TILE_WIDTH, TILE_HEIGHT],
+    }
+
+
+def generate_clip_thumbnails(project_id: str, clip_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Generate (or reuse) the poster, sprite sheet and WebVTT index for a clip.
+
+    Args:
+        project_id: Project ID
+        clip_path: Local path of the clip
+
+    Returns:
+        dict with poster/sprite/vtt URLs and the chosen poster time, or None on failure
+    """
+    info = probe_media(clip_path)
+    if not info or not info.get("has_video") or not info.get("duration"):
+        return None
+
+    duration = info["duration"]
+    frames = max(1, min(THUMBNAIL_SPRITE_FRAMES, int(duration * ANALYSIS_FPS)))
+    columns = min(THUMBNAIL_SPRITE_COLUMNS, frames)
+    rows = -(-frames // columns)
+
+    st = os.stat(clip_path)
+    cache_key = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "frames": frames, "columns": columns}
+    out_dir = _output_dir(project_id, clip_path)
+    with _output_lock(out_dir):
+        meta = _cached_meta(out_dir, cache_key)
+        cache_lookup("clip_thumbnails", meta is not None)
+        if meta:
+            return _result(out_dir, meta)
+        return _render_thumbnails(project_id, out_dir, clip_path, info, frames, columns, rows, cache_key)
+
+
+def _cached_meta(out_dir: Path, cache_key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """meta.json of a completed run for `cache_key`, or None."""
+    try:
+        with open(out_dir / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("key") != cache_key or not (out_dir / "poster.jpg").exists():
+        return None
+    return meta
+
+
+@timed("clip_thumbnails")
+def _render_thumbnails(
+    project_id: str,
+    out_dir: Path,
+    clip_path: str,
+    info: Dict[str, Any],
+    frames: int,
+    columns: int,
+    rows: int,
+    cache_key: Dict[str, Any],
+) -> Optional[Dict[str, Any]]:
+    """Decode the clip once for sprite + analysis + reframe saliency, then grab the poster frame."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # The outputs are about to be overwritten: nothing may vouch for them until the new meta lands
+    (out_dir / "meta.json").unlink(missing_ok=True)
+    duration = info["duration"]
+    stats_path = out_dir / "stats.txt"
+    sprite_path = out_dir / "sprite.jpg"
+    saliency_path = analysis_path(project_id, clip_path).with_suffix(".raw")
+    saliency_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # One decode: a sampled stream feeds the sprite sheet, the shot analysis and the saliency grid
+    filter_complex = (
+        f"[0:v]fps={ANALYSIS_FPS},split=2[t][r];"
+        f"[t]scale={TILE_WIDTH}:{TILE_HEIGHT}:force_original_aspect_ratio=decrease,"
+        f"pad={TILE_WIDTH}:{TILE_HEIGHT}:(ow-iw)/2:(oh-ih)/2,setsar=1,split=2[s][a];"
+        f"[s]fps={frames}/{duration:.3f},tile={columns}x{rows}[sprite];"
+        f"[a]scdet=threshold={SCENE_THRESHOLD},signalstats,"
+        f"metadata=mode=print:file='{escape_filter_path(stats_path)}'[analysis];"
+        f"[r]{saliency_filter(info)}[saliency]"
+    )
+    ok = run_ffmpeg(
+        [
+            "ffmpeg",
+            "-y",
+            "-i", clip_path,
+            "-filter_complex", filter_complex,
+            "-map", "[sprite]", "-frames:v", "1", "-q:v", "4", str(sprite_path),
+            "-map", "[analysis]", "-f", "null", "-",
+            "-map", "[saliency]", "-f", "rawvideo", str(saliency_path),
+        ],
+        f"thumbnails for {clip_path}",
+    )
+    if not ok:
+        saliency_path.unlink(missing_ok=True)
+        return None
+    store_analysis(project_id, clip_path, info, saliency_path)
+
+    poster_time = choose_poster_time(_parse_frame_stats(stats_path), duration)
+    stats_path.unlink(missing_ok=True)
+
+    if not run_ffmpeg(
+        [
+            "ffmpeg",
+            "-y",
+            "-ss", f"{poster_time:.3f}",
+            "-i", clip_path,
+            "-frames:v", "1",
+            "-q:v", "2",
+            str(out_dir / "poster.jpg"),
+        ],
+        f"poster for {clip_path}",
+    ):
+        return None
+
+    _write_vtt(out_dir / "thumbnails.vtt", sprite_path.name, duration, frames, columns)
+
+    meta = {"key": cache_key, "poster_time": poster_time, "frames": frames}
+    meta_path = out_dir / "meta.json"
+    tmp_path = meta_path.with_name(f".{meta_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+    return _result(out_dir, meta)
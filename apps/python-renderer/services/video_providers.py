@@ -0,0 +1,541 @@
+"""
+Video generation providers.
+
+Every provider implements the same async interface: submit(prompt) starts
+a generation job, poll(job_id) reports its progress and fetch(project_id,
+job) saves the finished clip into the project. HTTP providers (Pika,
+Runway) only describe their endpoints and response formats; blocking
+requests run in worker threads so a poll never holds up the event loop.
+Their calls go through the shared rate limiter: submits hold one of the
+provider's concurrent-job slots until the job finishes (finish()), polls
+use the provider's separate "<name>_poll" bucket.
+
+The registry tracks every provider's health (recent outcomes, consecutive
+failures) and its generation latency (submit to completed). A provider
+that keeps failing is marked degraded for PROVIDER_COOLDOWN seconds and
+requests fail over to the next provider in VIDEO_PROVIDERS. Server-side
+generations can hedge: once the first job runs past its provider's p90
+latency, the same prompt is submitted to a second provider and whichever
+finishes first wins, which cuts the tail of scene-generation latency.
+
+The "fake" provider renders test clips locally after a configurable delay,
+for tests and offline development.
+"""
+import asyncio
+import math
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import (
+    VIDEO_FAKE_LATENCY,
+    VIDEO_HEDGE,
+    VIDEO_HEDGE_DEFAULT_DELAY,
+    VIDEO_POLL_INTERVAL,
+    VIDEO_PROVIDERS,
+    VIDEO_TIMEOUT,
+)
+from services.rate_limiter import provider_request, release, rename_lease
+from utils.file_utils import save_clip, save_clip_file
+from utils.metrics import ffmpeg_process, stage
+
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+LATENCY_WINDOW = 50  # Completed generations kept for the latency percentiles
+MIN_LATENCY_SAMPLES = 5  # Below this, hedging waits VIDEO_HEDGE_DEFAULT_DELAY instead of the p90
+OUTCOME_WINDOW = 20  # Recent submit/poll outcomes kept for the error rate
+DEGRADED_ERROR_RATE = 0.5  # Error rate over a full window that marks a provider degraded
+FAILURE_THRESHOLD = 3  # Consecutive failures that mark a provider degraded
+PROVIDER_COOLDOWN = 120.0  # Seconds a degraded provider is skipped before it gets another try
+MAX_POLL_ERRORS = 5  # Consecutive poll request errors before a job counts as failed
+MAX_TRACKED_JOBS = 1000  # Client-polled jobs remembered for latency tracking
+
+
+@dataclass
+class ProviderJob:
+    """State of one generation job at one provider."""
+    provider: str
+    job_id: Optional[str]
+    status: str = PROCESSING
+    url: Optional[str] = None
+    progress: float = 0
+    message: Optional[str] = None
+    error: Optional[str] = None
+    submitted_at: float = 0.0  # time.monotonic() of the submit
+    poll_errors: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The /video and /video/status response for this job."""
+        result: Dict[str, Any] = {"status": self.status, "job_id": self.job_id, "provider": self.provider}
+        if self.status == COMPLETED:
+            result.update(video_url=self.url, url=self.url)
+        elif self.status == FAILED:
+            result["error"] = self.error or "Generation failed"
+        else:
+            result.update(progress=self.progress, message=self.message or "Generating video...")
+        return result
+
+
+class VideoProvider:
+    """
+    Base class of video providers.
+
+    Subclasses implement the blocking submit_request/poll_request (and
+    fetch_result if results aren't downloadable URLs); the async
+    submit/poll/fetch wrappers run them in worker threads.
+    """
+    name = ""
+
+    def configured(self) -> bool:
+        """Whether the provider can take requests (e.g. has an API key)."""
+        return True
+
+    def submit_request(self, prompt: str, project_id: Optional[str] = None) -> ProviderJob:
+        raise NotImplementedError
+
+    def poll_request(self, job_id: str) -> ProviderJob:
+        raise NotImplementedError
+
+    def fetch_result(self, project_id: str, job: ProviderJob) -> str:
+        return save_clip(project_id, job.url)
+
+    def finish_job(self, job_id: str) -> None:
+        """Called once a job has finished or been abandoned."""
+
+    async def submit(self, prompt: str, project_id: Optional[str] = None) -> ProviderJob:
+        with stage("video_generate", self.name):
+            job = await asyncio.to_thread(self.submit_request, prompt, project_id)
+        return replace(job, submitted_at=time.monotonic())
+
+    async def poll(self, job_id: str) -> ProviderJob:
+        with stage("video_poll", self.name):
+            return await asyncio.to_thread(self.poll_request, job_id)
+
+    async def fetch(self, project_id: str, job: ProviderJob) -> str:
+        return await asyncio.to_thread(self.fetch_result, project_id, job)
+
+    async def finish(self, job_id: Optional[str]) -> None:
+        if job_id:
+            await asyncio.to_thread(self.finish_job, job_id)
+
+
+class HttpVideoProvider(VideoProvider):
+    """A provider with a JSON submit endpoint and a per-job status endpoint."""
+    api_key: Optional[str] = None
+    submit_url = ""
+
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _headers(self) -> Dict[str, str]:
+        if not self.api_key:
+            raise ValueError(f"{self.name.upper()}_API_KEY not configured")
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def submit_payload(self, prompt: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def status_url(self, job_id: str) -> str:
+        raise NotImplementedError
+
+    def submit_job_id(self, data: Dict[str, Any]) -> Optional[str]:
+        return data.get("job_id") or data.get("id")
+
+    def result_url(self, data: Dict[str, Any]) -> Optional[str]:
+        """The finished video's URL in a submit or status response, if there is one."""
+        raise NotImplementedError
+
+    def _job_lease(self, job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def submit_request(self, prompt: str, project_id: Optional[str] = None) -> ProviderJob:
+        headers = self._headers()
+        # The concurrent-job slot is held until the job finishes, not just for this call
+        lease = uuid.uuid4().hex
+        try:
+            response = provider_request(
+                self.name, "POST", self.submit_url, project_id,
+                lease=lease, lease_ttl=VIDEO_TIMEOUT, headers=headers, json=self.submit_payload(prompt),
+            )
+            data = response.json()
+        except Exception:
+            release(self.name, lease)
+            raise
+
+        # Some requests complete synchronously; the rest return a job to poll
+        video_url = self.result_url(data)
+        job_id = self.submit_job_id(data)
+        if video_url:
+            release(self.name, lease)
+            return ProviderJob(self.name, job_id, COMPLETED, url=video_url)
+        if job_id:
+            rename_lease(self.name, lease, self._job_lease(job_id))
+            return ProviderJob(self.name, job_id, message="Video generation started. Poll for completion.")
+        release(self.name, lease)
+        raise ValueError(f"Unexpected response from {self.name} API")
+
+    def poll_request(self, job_id: str) -> ProviderJob:
+        response = provider_request(f"{self.name}_poll", "GET", self.status_url(job_id), headers=self._headers(), timeout=30)
+        data = response.json()
+
+        status = str(data.get("status", "")).lower()
+        video_url = self.result_url(data)
+        if video_url and status not in ("failed", "error"):
+            return ProviderJob(self.name, job_id, COMPLETED, url=video_url)
+        if status in ("failed", "error"):
+            error = data.get("error") or data.get("message") or "Generation failed"
+            return ProviderJob(self.name, job_id, FAILED, error=error)
+        return ProviderJob(
+            self.name,
+            job_id,
+            progress=data.get("progress", 0),
+            message=data.get("message", "Generating video..."),
+        )
+
+    def finish_job(self, job_id: str) -> None:
+        release(self.name, self._job_lease(job_id))
+
+
+class FakeVideoProvider(VideoProvider):
+    """
+    Local stand-in provider: jobs complete after `latency` seconds with a
+    rendered test clip, or fail if `fail` is set.
+    """
+
+    def __init__(self, name: str = "fake", latency: float = VIDEO_FAKE_LATENCY, fail: bool = False, duration: float = 3.0):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.duration = duration
+        self._jobs: Dict[str, float] = {}  # job_id -> time.monotonic() it completes
+
+    def submit_request(self, prompt: str, project_id: Optional[str] = None) -> ProviderJob:
+        job_id = f"{self.name}-{uuid.uuid4().hex[:12]}"
+        self._jobs[job_id] = time.monotonic() + self.latency
+        return ProviderJob(self.name, job_id, message="Video generation started. Poll for completion.")
+
+    def poll_request(self, job_id: str) -> ProviderJob:
+        if job_id not in self._jobs:
+            return ProviderJob(self.name, job_id, FAILED, error="Unknown job")
+        remaining = self._jobs[job_id] - time.monotonic()
+        if remaining > 0:
+            progress = round(100 * (1 - remaining / self.latency)) if self.latency else 0
+            return ProviderJob(self.name, job_id, progress=progress)
+        if self.fail:
+            return ProviderJob(self.name, job_id, FAILED, error="Fake provider failure")
+        return ProviderJob(self.name, job_id, COMPLETED, url=f"fake://{job_id}.mp4")
+
+    def finish_job(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+
+    def fetch_result(self, project_id: str, job: ProviderJob) -> str:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / f"{job.job_id}.mp4"
+            cmd = [
+                "ffmpeg", "-y", "-v", "error",
+                "-f", "lavfi", "-i", f"testsrc2=s=1280x720:r=30:d={self.duration}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={self.duration}",
+                "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-ac", "2", "-shortest",
+                str(path),
+            ]
+            try:
+                with ffmpeg_process():
+                    subprocess.run(cmd, check=True, capture_output=True)
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"Fake provider failed: {e.stderr.decode().strip() if e.stderr else 'Unknown error'}")
+            return save_clip_file(project_id, str(path), path.name)
+
+
+class ProviderHealth:
+    """Rolling health and latency statistics of one provider."""
+
+    def __init__(self):
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes: deque = deque(maxlen=OUTCOME_WINDOW)
+        self.consecutive_failures = 0
+        self.degraded_until = 0.0
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.degraded_until = 0.0
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def record_failure(self) -> None:
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        full_window_failing = len(self.outcomes) == OUTCOME_WINDOW and self.error_rate() >= DEGRADED_ERROR_RATE
+        if self.consecutive_failures >= FAILURE_THRESHOLD or full_window_failing:
+            self.degraded_until = time.monotonic() + PROVIDER_COOLDOWN
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def degraded(self) -> bool:
+        return time.monotonic() < self.degraded_until
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile of recent generation latencies."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {
+            "degraded": self.degraded(),
+            "error_rate": round(self.error_rate(), 3),
+            "consecutive_failures": self.consecutive_failures,
+            "samples": len(self.latencies),
+            "p50": round(p50, 2) if p50 is not None else None,
+            "p90": round(p90, 2) if p90 is not None else None,
+        }
+
+
+class ProviderRegistry:
+    """Video providers with health tracking, failover and hedged generation."""
+
+    def __init__(self, order: Optional[List[str]] = None):
+        self.providers: Dict[str, VideoProvider] = {}
+        self.health: Dict[str, ProviderHealth] = {}
+        self.order = list(order or [])  # Failover/hedging preference
+        self._tracked: "OrderedDict[tuple, float]" = OrderedDict()  # (provider, job_id) -> submitted_at
+
+    def register(self, provider: VideoProvider) -> None:
+        self.providers[provider.name] = provider
+        self.health.setdefault(provider.name, ProviderHealth())
+
+    def get(self, name: str) -> VideoProvider:
+        if name not in self.providers:
+            raise ValueError(f"Unknown provider: {name}. Available: {', '.join(self.providers)}")
+        return self.providers[name]
+
+    def candidates(self, preferred: Optional[str] = None) -> List[str]:
+        """
+        Providers to try, in order: the preferred one, then VIDEO_PROVIDERS.
+
+        Healthy providers come first; degraded ones stay at the end as a
+        last resort rather than failing the request outright.
+        """
+        if preferred:
+            self.get(preferred)
+        names = list(dict.fromkeys([preferred] + self.order if preferred else self.order))
+        names = [n for n in names if n in self.providers and self.providers[n].configured()]
+        return [n for n in names if not self.health[n].degraded()] + [n for n in names if self.health[n].degraded()]
+
+    def hedge_delay(self, provider: str) -> float:
+        """Seconds after submit before a job at `provider` is hedged: its p90 latency."""
+        health = self.health[provider]
+        if len(health.latencies) < MIN_LATENCY_SAMPLES:
+            return VIDEO_HEDGE_DEFAULT_DELAY
+        return health.percentile(0.9)
+
+    def _track(self, job: ProviderJob) -> None:
+        if job.job_id and job.status == PROCESSING:
+            self._tracked[(job.provider, job.job_id)] = job.submitted_at
+            while len(self._tracked) > MAX_TRACKED_JOBS:
+                self._tracked.popitem(last=False)
+
+    def _record(self, job: ProviderJob) -> None:
+        """Record a finished job's outcome (and latency) in its provider's health."""
+        health = self.health[job.provider]
+        if job.status == COMPLETED:
+            health.record_success(time.monotonic() - job.submitted_at if job.submitted_at else None)
+        elif job.status == FAILED:
+            health.record_failure()
+
+    async def _submit_to(self, name: str, prompt: str, project_id: Optional[str]) -> ProviderJob:
+        try:
+            job = await self.providers[name].submit(prompt, project_id)
+        except Exception:
+            self.health[name].record_failure()
+            raise
+        if job.status == COMPLETED:
+            self._record(job)
+        return job
+
+    async def submit(self, prompt: str, provider: Optional[str] = None, project_id: Optional[str] = None) -> ProviderJob:
+        """
+        Start a generation, failing over to the next provider when a submit fails.
+
+        Args:
+            prompt: Video prompt
+            provider: Preferred provider (default: the first healthy one in VIDEO_PROVIDERS)
+            project_id: Project the clip is for (fair share of the provider's rate limit)
+
+        Returns:
+            The accepted job (completed if the provider answered synchronously)
+        """
+        errors = []
+        names = self.candidates(provider)
+        if not names:
+            raise ValueError("No video provider configured")
+        for name in names:
+            try:
+                job = await self._submit_to(name, prompt, project_id)
+            except Exception as e:
+                print(f"Warning: {name} submit failed, trying the next provider: {e}")
+                errors.append(f"{name}: {e}")
+                continue
+            self._track(job)
+            return job
+        raise RuntimeError(f"All video providers failed: {'; '.join(errors)}")
+
+    async def poll(self, provider: str, job_id: str) -> ProviderJob:
+        """Poll one job (a client-polled job's outcome and latency feed the provider's health)."""
+        job = await self.get(provider).poll(job_id)
+        if job.status != PROCESSING:
+            await self.providers[provider].finish(job_id)
+            submitted_at = self._tracked.pop((provider, job_id), None)
+            if submitted_at is not None:
+                self._record(replace(job, submitted_at=submitted_at))
+        return job
+
+    async def fetch(self, project_id: str, job: ProviderJob) -> str:
+        """Save a completed job's clip into the project."""
+        return await self.get(job.provider).fetch(project_id, job)
+
+    async def _poll_job(self, job: ProviderJob) -> ProviderJob:
+        """Poll a server-side job, tolerating a few transient request errors."""
+        try:
+            update = await self.providers[job.provider].poll(job.job_id)
+        except Exception as e:
+            job = replace(job, poll_errors=job.poll_errors + 1)
+            if job.poll_errors < MAX_POLL_ERRORS:
+                return job
+            update = ProviderJob(job.provider, job.job_id, FAILED, error=f"Polling failed: {e}")
+        job = replace(update, submitted_at=job.submitted_at, poll_errors=0)
+        if job.status != PROCESSING:
+            await self.providers[job.provider].finish(job.job_id)
+            self._record(job)
+        return job
+
+    async def generate(
+        self,
+        project_id: str,
+        prompt: str,
+        provider: Optional[str] = None,
+        hedge: Optional[bool] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Generate a clip server-side: submit, poll, fail over, hedge and fetch.
+
+        Args:
+            project_id: Project ID the clip is saved to
+            prompt: Video prompt
+            provider: Preferred provider (default: the first healthy one in VIDEO_PROVIDERS)
+            hedge: Also submit to the next provider once the job passes its provider's p90 latency (default VIDEO_HEDGE)
+            timeout: Seconds before giving up (default VIDEO_TIMEOUT)
+
+        Returns:
+            {"clip", "url", "status", "provider", "job_id", "hedged", "attempts"}
+        """
+        remaining = self.candidates(provider)
+        if not remaining:
+            raise ValueError("No video provider configured")
+        hedge = VIDEO_HEDGE if hedge is None else hedge
+        deadline = time.monotonic() + (timeout or VIDEO_TIMEOUT)
+        attempts: List[Dict[str, Any]] = []
+        active: List[ProviderJob] = []
+        hedged = False
+
+        async def launch() -> bool:
+            """Submit to the next untried provider that accepts the job."""
+            while remaining:
+                name = remaining.pop(0)
+                try:
+                    job = await self._submit_to(name, prompt, project_id)
+                except Exception as e:
+                    attempts.append({"provider": name, "error": str(e)})
+                    continue
+                attempts.append({"provider": name, "job_id": job.job_id})
+                active.append(job)
+                return True
+            return False
+
+        await launch()
+        try:
+            while True:
+                winner = next((job for job in active if job.status == COMPLETED), None)
+                if winner:
+                    try:
+                        clip_path = await self.fetch(project_id, winner)
+                        break
+                    except Exception as e:
+                        # A clip we can't download is as good as a failed generation
+                        self.health[winner.provider].record_failure()
+                        active[active.index(winner)] = replace(winner, status=FAILED, error=f"Fetch failed: {e}")
+                for job in [job for job in active if job.status == FAILED]:
+                    active.remove(job)
+                    attempt = next(a for a in attempts if a.get("job_id") == job.job_id and a["provider"] == job.provider)
+                    attempt["error"] = job.error or "Generation failed"
+                if not active and not await launch():
+                    errors = "; ".join(f"{a['provider']}: {a['error']}" for a in attempts if a.get("error"))
+                    raise RuntimeError(f"All video providers failed: {errors}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Video generation timed out after {timeout or VIDEO_TIMEOUT:.0f}s")
+                first = active[0]
+                if hedge and not hedged and remaining and time.monotonic() - first.submitted_at >= self.hedge_delay(first.provider):
+                    hedged = True
+                    print(f"Hedging {first.provider} job {first.job_id}: past its p90 latency")
+                    if await launch():
+                        continue
+                pending = [job for job in active if job.status == PROCESSING]
+                await asyncio.sleep(VIDEO_POLL_INTERVAL)
+                polled = await asyncio.gather(*(self._poll_job(job) for job in pending))
+                active = [job for job in active if job.status != PROCESSING] + list(polled)
+        finally:
+            # Hedge losers (and jobs a timeout leaves behind) are abandoned: free their slots
+            for job in active:
+                if job.status == PROCESSING:
+                    await self.providers[job.provider].finish(job.job_id)
+
+        return {
+            "clip": clip_path,
+            "url": winner.url,
+            "status": COMPLETED,
+            "provider": winner.provider,
+            "job_id": winner.job_id,
+            "hedged": hedged,
+            "attempts": attempts,
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """Health and latency of every registered provider."""
+        return {
+            "order": self.order,
+            "providers": {
+                name: {"configured": provider.configured(), **self.health[name].to_dict()}
+                for name, provider in self.providers.items()
+            },
+        }
+
+
+_registry: Optional[ProviderRegistry] = None
+
+
+def get_registry() -> ProviderRegistry:
+    """The process-wide registry, with the built-in providers registered on first use."""
+    global _registry
+    if _registry is None:
+        from services.pika_service import PikaProvider
+        from services.runway_service import RunwayProvider
+
+        _registry = ProviderRegistry(VIDEO_PROVIDERS)
+        for provider in (PikaProvider(), RunwayProvider(), FakeVideoProvider()):
+            _registry.register(provider)
+    return _registry
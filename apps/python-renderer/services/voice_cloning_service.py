@@ -2,13 +2,14 @@
 ElevenLabs Voice Cloning Service (Phase 1 - Cloud)
 Handles voice sample upload and training via ElevenLabs API
 """
-import requests
 import os
 import base64
-from io import BytesIO
 from config import ELEVENLABS_API_KEY
+from services.rate_limiter import provider_request
+from utils.metrics import timed
 
 
+@timed("voice_clone", "elevenlabs")
 def clone_voice_from_audio(audio_data: bytes, voice_name: str, description: str = "") -> dict:
     """
     Clone a voice from audio sample using ElevenLabs API.
@@ -33,7 +34,7 @@ def clone_voice_from_audio(audio_data: bytes, voice_name: str, description: str
     
     # Prepare multipart form data
     files = {
-        "files": ("voice_sample.wav", BytesIO(audio_data), "audio/wav")
+        "files": ("voice_sample.wav", audio_data, "audio/wav")  # Bytes, so a throttled upload can be resent
     }
     
     data = {
@@ -41,8 +42,7 @@ def clone_voice_from_audio(audio_data: bytes, voice_name: str, description: str
         "description": description or f"Cloned voice: {voice_name}",
     }
     
-    response = requests.post(url, headers=headers, files=files, data=data)
-    response.raise_for_status()
+    response = provider_request("elevenlabs", "POST", url, headers=headers, files=files, data=data, timeout=180)
     
     result = response.json()
     
@@ -76,8 +76,7 @@ def list_cloned_voices() -> list[dict]:
         "xi-api-key": ELEVENLABS_API_KEY,
     }
     
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
+    response = provider_request("elevenlabs", "GET", url, headers=headers)
     
     result = response.json()
     voices = result.get("voices", [])
@@ -133,8 +132,7 @@ def delete_cloned_voice(voice_id: str) -> bool:
         "xi-api-key": ELEVENLABS_API_KEY,
     }
     
-    response = requests.delete(url, headers=headers)
-    response.raise_for_status()
+    provider_request("elevenlabs", "DELETE", url, headers=headers)
     
     return True
 
@@ -1,7 +1,10 @@
-import requests
+import base64
 import os
 from config import ELEVENLABS_API_KEY, ELEVENLABS_VOICE_ID
+from services.caption_service import remember_script, save_tts_alignment
+from services.rate_limiter import provider_request
 from utils.file_utils import save_audio
+from utils.metrics import timed
 
 
 # Style presets for different emotional tones
@@ -29,6 +32,7 @@ STYLE_PRESETS = {
 }
 
 
+@timed("voice_generate", "elevenlabs")
 def generate_cloud_voice(
     project_id: str,
     script: str,
@@ -47,10 +51,11 @@ def generate_cloud_voice(
         # Default to Rachel if no voice is configured
         selected_voice_id = "21m00Tcm4TlvDq8ikWAM"
     
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{selected_voice_id}"
+    # The with-timestamps variant also returns per-character timings, used for captions
+    url = f"https://api.elevenlabs.io/v1/text-to-speech/{selected_voice_id}/with-timestamps"
     
     headers = {
-        "Accept": "audio/mpeg",
+        "Accept": "application/json",
         "Content-Type": "application/json",
         "xi-api-key": ELEVENLABS_API_KEY,
     }
@@ -70,11 +75,17 @@ def generate_cloud_voice(
         },
     }
     
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
+    response = provider_request("elevenlabs", "POST", url, project_id, headers=headers, json=data, timeout=180)
+    body = response.json()
     
     # Save audio file
-    audio_path = save_audio(project_id, response.content)
+    audio_path = save_audio(project_id, base64.b64decode(body["audio_base64"]))
+    
+    alignment = body.get("alignment") or body.get("normalized_alignment")
+    if alignment:
+        save_tts_alignment(project_id, audio_path, script, alignment)
+    else:
+        remember_script(project_id, audio_path, script)
     
     return {
         "audio": audio_path,
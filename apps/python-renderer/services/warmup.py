@@ -0,0 +1,145 @@
+"""
+Startup warm-up and readiness.
+
+Importing the app does no I/O: no directories are created, no Supabase
+client is built and FFmpeg is not run. The work that used to happen at
+import (or on the first request that needed it) runs here instead, in a
+background thread started by the app lifespan, so the server accepts
+connections immediately and GET /ready tells a load balancer when it is
+actually worth sending renders to:
+
+- directories: the projects and render output folders
+- ffmpeg: capabilities (from the on-disk cache after the first start)
+- encoder: render encoder selection, which uses those capabilities
+- supabase: the shared client (optional: a missing key doesn't block readiness)
+- redis: a ping (optional: the rate limiter and job events degrade without it)
+
+Required steps that fail leave the instance not ready; optional ones are
+reported but don't.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import PROJECTS_DIR, RENDER_DIR
+
+PENDING = "pending"
+RUNNING = "running"
+OK = "ok"
+FAILED = "failed"
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_started_at: Optional[float] = None
+_finished_at: Optional[float] = None
+_steps: Dict[str, Dict[str, Any]] = {}
+
+
+def _directories() -> Dict[str, Any]:
+    for path in (PROJECTS_DIR, RENDER_DIR, RENDER_DIR / "thumbnails"):
+        path.mkdir(parents=True, exist_ok=True)
+    return {"projects": str(PROJECTS_DIR), "renders": str(RENDER_DIR)}
+
+
+def _ffmpeg() -> Dict[str, Any]:
+    from services.ffmpeg_capabilities import get_capabilities
+
+    capabilities = get_capabilities()
+    if not capabilities.available:
+        raise RuntimeError("ffmpeg not found or not runnable")
+    if not capabilities.ffprobe_version:
+        raise RuntimeError("ffprobe not found or not runnable")
+    return capabilities.summary()
+
+
+def _encoder() -> Dict[str, Any]:
+    from services.render_profiles import select_encoder
+
+    return {"encoder": select_encoder()}
+
+
+def _supabase() -> Dict[str, Any]:
+    from services.supabase_client import get_supabase
+
+    if get_supabase() is None:
+        raise RuntimeError("Supabase not configured. Set SUPABASE_URL and SUPABASE_SERVICE_KEY")
+    return {"configured": True}
+
+
+def _redis() -> Dict[str, Any]:
+    from services.redis_client import get_sync_redis_client
+
+    get_sync_redis_client().ping()
+    return {"connected": True}
+
+
+# (name, function, required) in the order they run
+STEPS: List[Tuple[str, Callable[[], Dict[str, Any]], bool]] = [
+    ("directories", _directories, True),
+    ("ffmpeg", _ffmpeg, True),
+    ("encoder", _encoder, True),
+    ("supabase", _supabase, False),
+    ("redis", _redis, False),
+]
+
+
+def _run() -> None:
+    global _finished_at
+    for name, step, _ in STEPS:
+        with _lock:
+            _steps[name]["status"] = RUNNING
+        start = time.time()
+        try:
+            detail, status, error = step(), OK, None
+        except Exception as e:
+            detail, status, error = None, FAILED, str(e)
+            print(f"⚠️ Warning: Warm-up step {name} failed: {e}")
+        with _lock:
+            _steps[name].update(status=status, seconds=round(time.time() - start, 3), detail=detail, error=error)
+    with _lock:
+        _finished_at = time.time()
+    report = readiness()
+    print(f"{'✅' if report['ready'] else '⚠️'} Warm-up finished in {_finished_at - _started_at:.2f}s")
+
+
+def start_warmup() -> None:
+    """Run the warm-up steps in a background thread (once per process)."""
+    global _thread, _started_at
+    with _lock:
+        if _thread is not None:
+            return
+        _started_at = time.time()
+        for name, _, required in STEPS:
+            _steps[name] = {"status": PENDING, "required": required}
+        _thread = threading.Thread(target=_run, name="warmup", daemon=True)
+    _thread.start()
+
+
+def wait_ready(timeout: Optional[float] = None) -> bool:
+    """Block until every warm-up step has run; returns whether the instance is ready."""
+    if _thread is not None:
+        _thread.join(timeout)
+    return readiness()["ready"]
+
+
+def readiness() -> Dict[str, Any]:
+    """
+    Warm-up progress.
+
+    Returns:
+        dict with ready (all required steps succeeded), complete (every step
+        has run), timings and the per-step status, detail and error
+    """
+    with _lock:
+        steps = {name: dict(step) for name, step in _steps.items()}
+        started_at, finished_at = _started_at, _finished_at
+    # Ready as soon as the required steps are done; optional ones may still be running
+    ready = bool(steps) and all(step["status"] == OK for step in steps.values() if step["required"])
+    return {
+        "ready": ready,
+        "complete": finished_at is not None,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "seconds": round((finished_at or time.time()) - started_at, 3) if started_at else None,
+        "steps": steps,
+    }
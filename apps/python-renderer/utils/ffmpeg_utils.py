@@ -3,34 +3,69 @@ import os
 from pathlib import Path
 from typing import List
 
+from utils.metrics import ffmpeg_process
+
+
+def escape_filter_path(path: Path | str) -> str:
+    """Escape a path for use as a filter option value."""
+    return str(path).replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+
+
+def run_ffmpeg(cmd: List[str], context: str = "FFmpeg") -> bool:
+    """Run an FFmpeg command, logging stderr on failure."""
+    try:
+        with ffmpeg_process():
+            subprocess.run(cmd, check=True, capture_output=True)
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg error ({context}): {e.stderr.decode() if e.stderr else 'Unknown error'}")
+        return False
+
 
 def concat_videos(clip_paths: List[str], output_path: str) -> bool:
     """Concatenate multiple video clips into one."""
-    if not clip_paths:
+    return concat_segments([{"path": clip} for clip in clip_paths], output_path)
+
+
+def concat_segments(segments: List[dict], output_path: str) -> bool:
+    """
+    Stream-copy segments into one file with the concat demuxer.
+
+    Each segment is {"path", "inpoint"?, "outpoint"?, "duration"?}; in/out
+    points should sit on keyframes since nothing is re-encoded.
+    """
+    if not segments:
         return False
     
-    # Create concat file
-    concat_file = Path(output_path).parent / "concat.txt"
+    # Create concat file next to the output so concurrent renders don't share it
+    concat_file = Path(f"{output_path}.concat.txt")
     with open(concat_file, "w") as f:
-        for clip in clip_paths:
+        for segment in segments:
             # Escape single quotes and use absolute paths
-            abs_clip = os.path.abspath(clip)
+            abs_clip = os.path.abspath(segment["path"]).replace("'", "'\\''")
             f.write(f"file '{abs_clip}'\n")
+            if segment.get("inpoint"):
+                f.write(f"inpoint {segment['inpoint']:.6f}\n")
+            if segment.get("outpoint") is not None:
+                f.write(f"outpoint {segment['outpoint']:.6f}\n")
+            if segment.get("duration") is not None:
+                f.write(f"duration {segment['duration']:.6f}\n")
     
     try:
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-y",  # Overwrite output
-                "-f", "concat",
-                "-safe", "0",
-                "-i", str(concat_file),
-                "-c", "copy",  # Copy codec (faster, no re-encoding)
-                output_path,
-            ],
-            check=True,
-            capture_output=True,
-        )
+        with ffmpeg_process():
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-y",  # Overwrite output
+                    "-f", "concat",
+                    "-safe", "0",
+                    "-i", str(concat_file),
+                    "-c", "copy",  # Copy codec (faster, no re-encoding)
+                    output_path,
+                ],
+                check=True,
+                capture_output=True,
+            )
         return True
     except subprocess.CalledProcessError as e:
         print(f"FFmpeg error: {e.stderr.decode()}")
@@ -40,28 +75,30 @@ def concat_videos(clip_paths: List[str], output_path: str) -> bool:
             concat_file.unlink()
 
 
-def add_audio_to_video(video_path: str, audio_path: str, output_path: str) -> bool:
-    """Add audio track to video."""
+def add_audio_to_video(video_path: str, audio_path: str, output_path: str, extra_args: list[str] | None = None) -> bool:
+    """Add audio track to video (extra_args are appended as output options, e.g. -movflags +faststart)."""
     if not os.path.exists(audio_path):
         return False
     
     try:
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-y",
-                "-i", video_path,
-                "-i", audio_path,
-                "-c:v", "copy",  # Copy video codec
-                "-c:a", "aac",  # Encode audio as AAC
-                "-shortest",  # Match shortest stream
-                "-map", "0:v:0",  # Map video from first input
-                "-map", "1:a:0",  # Map audio from second input
-                output_path,
-            ],
-            check=True,
-            capture_output=True,
-        )
+        with ffmpeg_process():
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-i", video_path,
+                    "-i", audio_path,
+                    "-c:v", "copy",  # Copy video codec
+                    "-c:a", "aac",  # Encode audio as AAC
+                    "-shortest",  # Match shortest stream
+                    "-map", "0:v:0",  # Map video from first input
+                    "-map", "1:a:0",  # Map audio from second input
+                    *(extra_args or []),
+                    output_path,
+                ],
+                check=True,
+                capture_output=True,
+            )
         return True
     except subprocess.CalledProcessError as e:
         print(f"FFmpeg error: {e.stderr.decode()}")
@@ -69,29 +106,42 @@ def add_audio_to_video(video_path: str, audio_path: str, output_path: str) -> bo
 
 
 def create_transition(
-    clip1_path: str, clip2_path: str, output_path: str, duration: float = 0.5
+    clip1_path: str,
+    clip2_path: str,
+    output_path: str,
+    clip1_duration: float,
+    duration: float = 0.5,
+    transition: str = "fade",
+    with_audio: bool = False,
 ) -> bool:
-    """Create a crossfade transition between two clips."""
-    try:
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-y",
-                "-i", clip1_path,
-                "-i", clip2_path,
-                "-filter_complex",
-                f"[0:v][1:v]xfade=transition=fade:duration={duration}:offset=0[v]",
-                "-map", "[v]",
-                "-c:v", "libx264",
-                output_path,
-            ],
-            check=True,
-            capture_output=True,
-        )
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg error: {e.stderr.decode()}")
-        return False
+    """
+    Create a crossfade transition between two clips, starting `duration` seconds before clip1 ends.
+
+    Args:
+        clip1_duration: Length of the first clip in seconds (e.g. from probe_service)
+        with_audio: Both clips have audio; crossfade it too
+    """
+    offset = max(clip1_duration - duration, 0)
+    
+    filter_complex = f"[0:v][1:v]xfade=transition={transition}:duration={duration}:offset={offset:.3f}[v]"
+    maps = ["-map", "[v]"]
+    if with_audio:
+        filter_complex += f";[0:a][1:a]acrossfade=d={duration}[a]"
+        maps += ["-map", "[a]", "-c:a", "aac"]
+    
+    return run_ffmpeg(
+        [
+            "ffmpeg",
+            "-y",
+            "-i", clip1_path,
+            "-i", clip2_path,
+            "-filter_complex", filter_complex,
+            *maps,
+            "-c:v", "libx264",
+            output_path,
+        ],
+        "transition",
+    )
 
 
 def sync_audio_video(video_path: str, audio_path: str, output_path: str) -> bool:
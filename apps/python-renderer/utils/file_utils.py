@@ -1,7 +1,29 @@
+import hashlib
 import os
+import threading
 import requests
 from pathlib import Path
+from typing import Callable, Iterable, List
 from config import PROJECTS_DIR
+from utils.metrics import timed
+from utils.project_manifest import clips_dir_state, load_manifest, record_file
+
+# Callbacks run after a clip is written to a project: hook(project_id, clip_path)
+_clip_saved_hooks: List[Callable[[str, str], None]] = []
+
+
+def register_clip_saved_hook(hook: Callable[[str, str], None]) -> None:
+    """Register a callback to run whenever save_clip writes a new clip."""
+    if hook not in _clip_saved_hooks:
+        _clip_saved_hooks.append(hook)
+
+
+def _notify_clip_saved(project_id: str, clip_path: str) -> None:
+    for hook in _clip_saved_hooks:
+        try:
+            hook(project_id, clip_path)
+        except Exception as e:
+            print(f"Warning: clip saved hook failed for {clip_path}: {e}")
 
 
 def ensure_project_folder(project_id: str) -> Path:
@@ -12,15 +34,26 @@ def ensure_project_folder(project_id: str) -> Path:
     return folder
 
 
+def _write_tracked(project_id: str, path: Path, chunks: Iterable[bytes]) -> None:
+    """Write a project file, hashing it on the way and updating the project manifest."""
+    previous_state = clips_dir_state(project_id)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            digest.update(chunk)
+            f.write(chunk)
+    record_file(project_id, str(path), previous_state, digest.hexdigest())
+
+
 def save_audio(project_id: str, data: bytes) -> str:
     """Save audio data to project folder."""
     folder = ensure_project_folder(project_id)
     path = folder / "audio.wav"
-    with open(path, "wb") as f:
-        f.write(data)
+    _write_tracked(project_id, path, [data])
     return str(path)
 
 
+@timed("download", "http")
 def save_clip(project_id: str, url: str) -> str:
     """Download and save video clip from URL."""
     folder = ensure_project_folder(project_id)
@@ -32,13 +65,25 @@ def save_clip(project_id: str, url: str) -> str:
     response = requests.get(url, stream=True)
     response.raise_for_status()
     
-    with open(clip_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    _write_tracked(project_id, clip_path, response.iter_content(chunk_size=8192))
     
+    _notify_clip_saved(project_id, str(clip_path))
     return str(clip_path)
 
 
+def save_clip_file(project_id: str, source_path: str, filename: str) -> str:
+    """Copy a local video clip (e.g. rendered by a local provider) into the project's clips folder."""
+    folder = ensure_project_folder(project_id)
+    clip_path = folder / "clips" / filename
+
+    with open(source_path, "rb") as f:
+        _write_tracked(project_id, clip_path, iter(lambda: f.read(1024 * 1024), b""))
+
+    _notify_clip_saved(project_id, str(clip_path))
+    return str(clip_path)
+
+
+@timed("download", "http")
 def save_image(project_id: str, url: str) -> str:
     """Download and save image from URL."""
     folder = ensure_project_folder(project_id)
@@ -50,27 +95,65 @@ def save_image(project_id: str, url: str) -> str:
     response = requests.get(url, stream=True)
     response.raise_for_status()
     
-    with open(image_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    _write_tracked(project_id, image_path, response.iter_content(chunk_size=8192))
     
     return str(image_path)
 
 
-def get_project_paths(project_id: str) -> dict:
-    """Get all paths for a project."""
+def save_image_file(project_id: str, source_path: str, filename: str) -> str:
+    """Copy a local image (e.g. from the image cache) into the project's clips folder."""
     folder = ensure_project_folder(project_id)
+    image_path = folder / "clips" / filename
+
+    with open(source_path, "rb") as f:
+        _write_tracked(project_id, image_path, iter(lambda: f.read(1024 * 1024), b""))
+
+    return str(image_path)
+
+
+def save_music(project_id: str, url: str) -> str:
+    """
+    Download a music bed from URL once (kept out of clips/ so it's never used as a clip).
+
+    The file is named after the URL, so later renders reuse it untouched and
+    everything keyed on its mtime (render cache, loudness index) still hits.
+    """
+    folder = ensure_project_folder(project_id) / "music"
+    folder.mkdir(exist_ok=True)
+    extension = os.path.splitext(os.path.basename(url).split("?")[0])[1]
+    music_path = folder / f"{hashlib.sha1(url.encode()).hexdigest()[:16]}{extension}"
+    if not music_path.exists():
+        _download_music(url, music_path)
+    return str(music_path)
+
+
+@timed("download", "http")
+def _download_music(url: str, music_path: Path) -> None:
+    tmp_path = music_path.with_name(f".{music_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        response = requests.get(url, stream=True)
+        response.raise_for_status()
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                f.write(chunk)
+        os.replace(tmp_path, music_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def get_project_paths(project_id: str) -> dict:
+    """Get all paths for a project (read-only: missing folders are not created)."""
+    folder = PROJECTS_DIR / project_id
     clips_dir = folder / "clips"
     
-    # Get all media files
-    clips = []
-    if clips_dir.exists():
-        clips = [str(p) for p in clips_dir.glob("*") if p.is_file()]
+    # Media files from the project manifest (rescanned only when the folder changes)
+    files = load_manifest(project_id)["files"]
     
     return {
         "folder": str(folder),
         "audio": str(folder / "audio.wav"),
-        "clips": clips,
+        "clips": [str(clips_dir / name) for name in files],
+        "videos": [str(clips_dir / name) for name, entry in files.items() if entry["kind"] == "video"],
         "final": str(folder / "final.mp4"),
     }
 
@@ -0,0 +1,175 @@
+"""
+Render instrumentation and Prometheus metrics.
+
+`stage()` / `timed()` wrap a unit of work (download, plan, concat, mux,
+thumbnail, a provider call, an upload) in a timing span that feeds a
+per-stage/provider histogram. Spans are also collected per render when a
+`record_spans()` block is active, so slow renders can report where the
+time went. FFmpeg/ffprobe processes, cache lookups, JobQueue depth and
+WebSocket connections are exported alongside at /metrics.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# Buckets from quick cache hits up to long provider generations
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "renderer_stage_duration_seconds",
+    "Time spent in each render/provider stage",
+    ["stage", "provider"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_FAILURES = Counter(
+    "renderer_stage_failures_total",
+    "Stages that raised an exception",
+    ["stage", "provider"],
+)
+FFMPEG_PROCESSES = Counter(
+    "renderer_ffmpeg_processes_total",
+    "FFmpeg/ffprobe processes spawned",
+    ["tool", "result"],
+)
+FFMPEG_RUNNING = Gauge(
+    "renderer_ffmpeg_processes_running",
+    "FFmpeg/ffprobe processes currently running",
+    ["tool"],
+)
+CACHE_REQUESTS = Counter(
+    "renderer_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss)",
+    ["cache", "result"],
+)
+
+_spans: ContextVar[Optional[List[Dict]]] = ContextVar("render_spans", default=None)
+_stage_listener: ContextVar[Optional[Callable[[str], None]]] = ContextVar("stage_listener", default=None)
+_ffmpeg_running = 0
+_ffmpeg_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name: str, provider: str = "local") -> Iterator[None]:
+    """Time a block as one stage span."""
+    listener = _stage_listener.get()
+    if listener is not None:
+        try:
+            listener(name)
+        except Exception as e:
+            print(f"Warning: stage listener failed for {name}: {e}")
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.labels(name, provider).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name, provider).observe(elapsed)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append({"stage": name, "provider": provider, "seconds": round(elapsed, 4)})
+
+
+def timed(name: str, provider: str = "local") -> Callable:
+    """Decorator form of `stage()`."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, provider):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def record_spans() -> Iterator[List[Dict]]:
+    """Collect the stage spans run inside this block (e.g. for one render)."""
+    spans: List[Dict] = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+@contextmanager
+def stage_listener(callback: Callable[[str], None]) -> Iterator[None]:
+    """Call `callback(stage_name)` as each stage inside this block starts (e.g. to report render progress)."""
+    token = _stage_listener.set(callback)
+    try:
+        yield
+    finally:
+        _stage_listener.reset(token)
+
+
+@contextmanager
+def ffmpeg_process(tool: str = "ffmpeg") -> Iterator[None]:
+    """Count an FFmpeg/ffprobe invocation and track how many are in flight."""
+    global _ffmpeg_running
+    FFMPEG_RUNNING.labels(tool).inc()
+    with _ffmpeg_lock:
+        _ffmpeg_running += 1
+    try:
+        yield
+    except Exception:
+        FFMPEG_PROCESSES.labels(tool, "error").inc()
+        raise
+    else:
+        FFMPEG_PROCESSES.labels(tool, "ok").inc()
+    finally:
+        FFMPEG_RUNNING.labels(tool).dec()
+        with _ffmpeg_lock:
+            _ffmpeg_running -= 1
+
+
+def ffmpeg_running() -> int:
+    """FFmpeg/ffprobe processes currently running in this process."""
+    return _ffmpeg_running
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    """Record a cache hit or miss."""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class _RuntimeCollector:
+    """Reads queue depth and WebSocket connections at scrape time."""
+
+    def collect(self):
+        from utils.queue import job_queue
+        from services.ws_manager import ws_manager
+
+        depth = GaugeMetricFamily("renderer_job_queue_depth", "Jobs waiting in the local JobQueue")
+        depth.add_metric([], job_queue.queue.qsize())
+        yield depth
+
+        jobs = GaugeMetricFamily("renderer_jobs", "Jobs tracked by the local JobQueue", labels=["status"])
+        counts: Dict[str, int] = {}
+        for job in list(job_queue.jobs.values()):
+            counts[job.status.value] = counts.get(job.status.value, 0) + 1
+        for status, count in counts.items():
+            jobs.add_metric([status], count)
+        yield jobs
+
+        sockets = list(ws_manager.active.values())
+        connections = GaugeMetricFamily("renderer_websocket_connections", "Open progress WebSocket connections")
+        connections.add_metric([], sum(len(s) for s in sockets))
+        yield connections
+        channels = GaugeMetricFamily("renderer_websocket_channels", "Jobs with at least one WebSocket listener")
+        channels.add_metric([], len(sockets))
+        yield channels
+
+
+REGISTRY.register(_RuntimeCollector())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Prometheus exposition payload and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,213 @@
+"""
+Per-project manifest index.
+
+Records every media file in a project's clips folder (size, mtime,
+content hash, media kind and, once ingested, probe data) plus the
+narration track, in PROJECTS_DIR/<id>/.manifest.json. Lookups cost one
+stat of the clips folder: the index is only rescanned when the folder's
+mtime says files were added, removed or renamed, and a rescan keeps the
+hash and probe data of entries whose size and mtime are unchanged.
+
+save_clip/save_image/save_audio update the index as they write, so
+files saved through them never trigger a rescan. Lookups never create
+directories.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import PROJECTS_DIR
+
+MANIFEST_NAME = ".manifest.json"
+MANIFEST_VERSION = 1
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm", ".avi")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# project_id -> manifest
+_manifests: Dict[str, Dict[str, Any]] = {}
+_lock = threading.RLock()
+
+
+def media_kind(name: str) -> Optional[str]:
+    lower = name.lower()
+    if lower.endswith(VIDEO_EXTENSIONS):
+        return "video"
+    if lower.endswith(IMAGE_EXTENSIONS):
+        return "image"
+    return None
+
+
+def clips_dir_state(project_id: str) -> Optional[int]:
+    """The clips folder's mtime_ns (None if it doesn't exist)."""
+    try:
+        return os.stat(PROJECTS_DIR / project_id / "clips").st_mtime_ns
+    except OSError:
+        return None
+
+
+def _manifest_path(project_id: str) -> Path:
+    return PROJECTS_DIR / project_id / MANIFEST_NAME
+
+
+def _read(project_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_manifest_path(project_id)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def _write(project_id: str, manifest: Dict[str, Any]) -> None:
+    """Atomically persist a manifest (best effort; skipped if the project folder doesn't exist)."""
+    path = _manifest_path(project_id)
+    if not path.parent.is_dir():
+        return
+    tmp_path = path.with_name(f".{MANIFEST_NAME}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write project manifest {path}: {e}")
+
+
+def _entry(st: os.stat_result, kind: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """A file entry, keeping hash/probe from `previous` if the file is unchanged."""
+    unchanged = previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns
+    return {
+        "kind": kind,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "hash": previous.get("hash") if unchanged else None,
+        "probe": previous.get("probe") if unchanged else None,
+    }
+
+
+def _scan(project_id: str, state: Optional[int], previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rebuild the clip entries from the folder, reusing unchanged entries."""
+    old_files = (previous or {}).get("files", {})
+    files: Dict[str, Dict[str, Any]] = {}
+    if state is not None:
+        with os.scandir(PROJECTS_DIR / project_id / "clips") as entries:
+            for entry in entries:
+                kind = media_kind(entry.name)
+                if entry.name.startswith(".") or kind is None or not entry.is_file():
+                    continue
+                try:
+                    files[entry.name] = _entry(entry.stat(), kind, old_files.get(entry.name))
+                except OSError:
+                    continue
+    return {
+        "version": MANIFEST_VERSION,
+        "clips_mtime_ns": state,
+        "files": dict(sorted(files.items())),
+        "audio": (previous or {}).get("audio"),
+    }
+
+
+def _validate_audio(project_id: str, manifest: Dict[str, Any]) -> bool:
+    """Refresh the narration entry from a single stat; True if it changed."""
+    try:
+        st = os.stat(PROJECTS_DIR / project_id / "audio.wav")
+    except OSError:
+        changed = manifest.get("audio") is not None
+        manifest["audio"] = None
+        return changed
+    audio = manifest.get("audio")
+    if audio and audio.get("size") == st.st_size and audio.get("mtime_ns") == st.st_mtime_ns:
+        return False
+    manifest["audio"] = _entry(st, "audio", audio)
+    return True
+
+
+def load_manifest(project_id: str) -> Dict[str, Any]:
+    """
+    The project's manifest, rescanning the clips folder only if it changed.
+
+    Returns:
+        {"clips_mtime_ns", "files": {name: {kind, size, mtime_ns, hash, probe}}, "audio": entry or None}
+    """
+    state = clips_dir_state(project_id)
+    with _lock:
+        manifest = _manifests.get(project_id) or _read(project_id)
+        dirty = False
+        if manifest is None or manifest.get("clips_mtime_ns") != state:
+            manifest = _scan(project_id, state, manifest)
+            dirty = True
+        dirty = _validate_audio(project_id, manifest) or dirty
+        if dirty:
+            _write(project_id, manifest)
+        _manifests[project_id] = manifest
+        return manifest
+
+
+def record_file(
+    project_id: str,
+    path: str,
+    previous_state: Optional[int],
+    content_hash: Optional[str] = None,
+) -> None:
+    """
+    Add or update one file after it was written.
+
+    Args:
+        project_id: Project ID
+        path: File inside the project's clips folder, or its audio.wav
+        previous_state: clips_dir_state() from before the write. If the
+            manifest was current then, it stays current without a rescan.
+        content_hash: Hash computed while writing, if any
+    """
+    path = Path(path)
+    try:
+        st = path.stat()
+    except OSError:
+        return
+    with _lock:
+        manifest = _manifests.get(project_id) or _read(project_id)
+        if manifest is None:
+            # First index of this project: the scan picks the new file up too
+            manifest = load_manifest(project_id)
+        if path.name == "audio.wav" and path.parent.name == project_id:
+            manifest["audio"] = {**_entry(st, "audio"), "hash": content_hash}
+        else:
+            kind = media_kind(path.name)
+            if kind is None:
+                return
+            files = {**manifest["files"], path.name: {**_entry(st, kind), "hash": content_hash}}
+            manifest["files"] = dict(sorted(files.items()))
+            if manifest.get("clips_mtime_ns") == previous_state:
+                manifest["clips_mtime_ns"] = clips_dir_state(project_id)
+        _manifests[project_id] = manifest
+        _write(project_id, manifest)
+
+
+def record_probe(project_id: str, path: str, probe: Dict[str, Any]) -> None:
+    """Attach probe data to a clip's entry (if the clip is unchanged since it was indexed)."""
+    path = Path(path)
+    with _lock:
+        manifest = _manifests.get(project_id) or _read(project_id)
+        entry = (manifest or {}).get("files", {}).get(path.name)
+        if not entry or path.parent.name != "clips" or path.parent.parent.name != project_id:
+            return
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+            return
+        entry["probe"] = probe
+        _write(project_id, manifest)
+
+
+def project_media(project_id: str, kind: Optional[str] = None) -> List[str]:
+    """Paths of the project's media files (optionally only "video" or "image"), sorted by name."""
+    clips_dir = PROJECTS_DIR / project_id / "clips"
+    return [
+        str(clips_dir / name)
+        for name, entry in load_manifest(project_id)["files"].items()
+        if kind is None or entry["kind"] == kind
+    ]
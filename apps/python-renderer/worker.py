@@ -0,0 +1,268 @@
+"""
+Render worker: runs queued renders outside the API process.
+
+    python worker.py [--slots N]
+
+Takes render jobs from the Redis queue (see services/render_jobs.py) and
+runs up to N at once (RENDER_WORKER_SLOTS, default one per two CPUs),
+publishing progress through job_publish as the render moves through its
+stages. Every RENDER_WORKER_HEARTBEAT seconds it reports its capacity and
+running jobs to Redis and requeues the jobs of workers that have stopped
+heartbeating. SIGTERM/SIGINT stop it taking new jobs; running renders
+finish first.
+
+Start as many workers as the boxes can take, independently of the number
+of API replicas; they need the same PROJECTS_DIR and render storage as
+the API.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Dict
+
+from config import (
+    RENDER_JOB_MAX_ATTEMPTS,
+    RENDER_JOB_TTL,
+    RENDER_WORKER_HEARTBEAT,
+    RENDER_WORKER_METRICS_PORT,
+    RENDER_WORKER_SLOTS,
+)
+from services.ffmpeg_capabilities import get_capabilities
+from services.job_publish import publish_complete, publish_error, publish_progress, publish_status
+from services.redis_client import close_redis, get_redis_client
+from services.render_jobs import (
+    COMPLETED,
+    FAILED,
+    QUEUE_KEY,
+    RUNNING,
+    WORKER_TIMEOUT,
+    WORKERS_KEY,
+    job_key,
+    processing_key,
+    redis_time,
+    requeue_dead_workers,
+    requeue_worker,
+    run_render,
+    worker_key,
+)
+from services.render_profiles import select_encoder
+from services.warmup import readiness, start_warmup, wait_ready
+from utils.metrics import ffmpeg_running, stage_listener
+
+# Render stage -> (progress %, message) published as the stage starts
+STAGE_PROGRESS = {
+    "resolve_clips": (5, "Resolving clips..."),
+    "captions": (10, "Timing captions..."),
+    "proxies": (10, "Preparing preview proxies..."),
+    "stills": (15, "Animating still images..."),
+    "plan": (20, "Planning render..."),
+    "timeline": (30, "Encoding timeline with FFmpeg..."),
+    "mux": (70, "Mixing audio..."),
+    "thumbnail": (85, "Generating thumbnail..."),
+    "package": (90, "Packaging for streaming..."),
+    "export_record": (95, "Saving export record..."),
+}
+
+TAKE_TIMEOUT = 2  # Seconds a BRPOPLPUSH blocks, so shutdown is noticed promptly
+
+
+class RenderWorker:
+    """Consumes render jobs with a fixed number of concurrent render slots."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.started_at = time.time()
+        self.active: Dict[str, float] = {}  # job id -> start time
+        self.completed = 0
+        self.failed = 0
+        self._free = asyncio.Semaphore(slots)
+        self._stopping = asyncio.Event()
+        self._tasks: set = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def stop(self) -> None:
+        if not self._stopping.is_set():
+            print("🛑 Stopping: no new jobs, waiting for running renders...")
+        self._stopping.set()
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        redis = await get_redis_client()
+        await self._heartbeat()
+        await requeue_dead_workers()
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
+        print(f"✅ Render worker {self.id} consuming with {self.slots} slot(s)")
+        try:
+            while not self._stopping.is_set():
+                await self._free.acquire()
+                if self._stopping.is_set():
+                    self._free.release()
+                    break
+                try:
+                    job_id = await redis.brpoplpush(QUEUE_KEY, processing_key(self.id), TAKE_TIMEOUT)
+                except Exception as e:
+                    self._free.release()
+                    print(f"⚠️ Warning: Could not take a render job: {e}")
+                    await asyncio.sleep(TAKE_TIMEOUT)
+                    continue
+                if job_id is None:
+                    self._free.release()
+                    continue
+                task = asyncio.create_task(self._run_job(job_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+            await self._deregister()
+
+    async def _run_job(self, job_id: str) -> None:
+        try:
+            await self._process(job_id)
+            redis = await get_redis_client()
+            await redis.lrem(processing_key(self.id), 0, job_id)
+            self.active.pop(job_id, None)
+            await self._heartbeat()  # Report the freed slot now rather than at the next beat
+        except Exception as e:
+            # Redis trouble: the job stays in our processing list and is requeued if we die
+            print(f"⚠️ Warning: Render job {job_id} bookkeeping failed: {e}")
+        finally:
+            self.active.pop(job_id, None)
+            self._free.release()
+
+    async def _process(self, job_id: str) -> None:
+        redis = await get_redis_client()
+        key = job_key(job_id)
+        raw = await redis.hgetall(key)
+        if not raw or raw.get("status") in (COMPLETED, FAILED):
+            return  # Expired, or finished by a worker we wrongly took for dead
+        attempts = await redis.hincrby(key, "attempts", 1)
+        if attempts > RENDER_JOB_MAX_ATTEMPTS:
+            await self._finish(job_id, FAILED, error=f"Render abandoned after {attempts - 1} attempt(s) by workers that died")
+            return
+
+        self.active[job_id] = time.time()
+        await redis.hset(key, mapping={"status": RUNNING, "worker": self.id, "started_at": time.time()})
+        await publish_status(job_id, RUNNING, f"Rendering on {self.id}")
+        await self._heartbeat()
+
+        try:
+            result = await asyncio.to_thread(self._render, job_id, raw["kind"], json.loads(raw["request"]))
+        except Exception as e:
+            self.failed += 1
+            await self._finish(job_id, FAILED, error=str(e))
+        else:
+            self.completed += 1
+            await self._finish(job_id, COMPLETED, result=result)
+
+    def _render(self, job_id: str, kind: str, request: dict) -> dict:
+        """Run the render in a worker thread, publishing progress as its stages start."""
+        reached = [0]
+
+        def on_stage(name: str) -> None:
+            progress, message = STAGE_PROGRESS.get(name, (None, None))
+            if progress is None or progress <= reached[0]:
+                return
+            reached[0] = progress
+            asyncio.run_coroutine_threadsafe(self._progress(job_id, progress, message), self._loop)
+
+        with stage_listener(on_stage):
+            return run_render(kind, request)
+
+    async def _progress(self, job_id: str, progress: int, message: str) -> None:
+        redis = await get_redis_client()
+        await redis.hset(job_key(job_id), mapping={"progress": progress, "message": message})
+        await publish_progress(job_id, progress, message)
+
+    async def _finish(self, job_id: str, status: str, result: dict | None = None, error: str | None = None) -> None:
+        redis = await get_redis_client()
+        fields = {"status": status, "finished_at": time.time()}
+        if status == COMPLETED:
+            fields.update(progress=100, message="Render complete!", result=json.dumps(result or {}))
+        else:
+            fields.update(error=error or "Render failed")
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(job_key(job_id), mapping=fields)
+        pipe.expire(job_key(job_id), RENDER_JOB_TTL)
+        await pipe.execute()
+        if status == COMPLETED:
+            await publish_complete(job_id, result)
+        else:
+            print(f"❌ Render job {job_id} failed: {error}")
+            await publish_error(job_id, error or "Render failed")
+
+    async def _heartbeat(self) -> None:
+        """Report capacity and running jobs; expires if the worker dies."""
+        redis = await get_redis_client()
+        capabilities = get_capabilities()
+        info = {
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "slots": self.slots,
+            "free": self.slots - len(self.active),
+            "ffmpeg_running": ffmpeg_running(),
+            "cpu_count": capabilities.cpu_count,
+            "encoder": select_encoder(),
+            "ffmpeg_version": capabilities.ffmpeg_version,
+            "started_at": self.started_at,
+            "completed": self.completed,
+            "failed": self.failed,
+            "stopping": self._stopping.is_set(),
+        }
+        now = await redis_time(redis)
+        pipe = redis.pipeline(transaction=True)
+        pipe.hset(worker_key(self.id), mapping={"info": json.dumps(info), "jobs": json.dumps(list(self.active))})
+        pipe.expire(worker_key(self.id), int(WORKER_TIMEOUT) + 1)
+        pipe.zadd(WORKERS_KEY, {self.id: now})
+        await pipe.execute()
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(RENDER_WORKER_HEARTBEAT)
+            try:
+                await self._heartbeat()
+                await requeue_dead_workers()
+            except Exception as e:
+                print(f"⚠️ Warning: Render worker heartbeat failed: {e}")
+
+    async def _deregister(self) -> None:
+        try:
+            # Anything still listed (e.g. bookkeeping failed) goes back to the queue
+            await requeue_worker(self.id)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not deregister render worker: {e}")
+
+
+async def main(slots: int) -> None:
+    start_warmup()
+    if not await asyncio.to_thread(wait_ready):
+        failed = {name: step["error"] for name, step in readiness()["steps"].items() if step["required"] and step["error"]}
+        raise SystemExit(f"Render worker not ready: {failed}")
+    if RENDER_WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+
+        start_http_server(RENDER_WORKER_METRICS_PORT)
+        print(f"✅ Worker metrics on :{RENDER_WORKER_METRICS_PORT}/metrics")
+
+    worker = RenderWorker(slots or max(1, get_capabilities().cpu_count // 2))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await close_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OmegaFrame Studio render worker")
+    parser.add_argument("--slots", type=int, default=RENDER_WORKER_SLOTS, help="Concurrent renders (0 = one per two CPUs)")
+    args = parser.parse_args()
+    asyncio.run(main(args.slots))